@@ -0,0 +1,92 @@
+from retrieval import DEFAULT_TOKEN_BUDGET
+
+SYSTEM_PROMPT = "You are a helpful assistant that answers questions about documents."
+DEFAULT_MODEL = "gpt-3.5-turbo"
+
+def create_client():
+    from openai import OpenAI
+    import config
+    # OPENAI_BASE_URL can point the client at a local stub server for testing
+    return OpenAI(api_key=config.OPENAI_API_KEY, base_url=getattr(config, 'OPENAI_BASE_URL', None))
+
+def context_token_budget():
+    # How much of the document is sent with each question
+    import config
+    return getattr(config, 'AI_CONTEXT_TOKEN_BUDGET', DEFAULT_TOKEN_BUDGET)
+
+def build_prompt(document_content, question):
+    return f"Given the following document content:\n\n{document_content}\n\nUser question: {question}\n\nPlease provide a response:"
+
+def build_messages(document_content, question):
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": build_prompt(document_content, question)}
+    ]
+
+def stream_answer(client, document_content, question, cancelled=None, model=DEFAULT_MODEL, max_tokens=300, temperature=0.7):
+    # Yields the answer text as it arrives. cancelled() is checked between
+    # chunks; returning True closes the connection and ends the stream.
+    stream = client.chat.completions.create(
+        model=model,
+        messages=build_messages(document_content, question),
+        max_tokens=max_tokens,
+        n=1,
+        temperature=temperature,
+        stream=True,
+    )
+    try:
+        started = False
+        for chunk in stream:
+            if cancelled and cancelled():
+                break
+            if not chunk.choices:
+                continue
+            text = chunk.choices[0].delta.content
+            if not text:
+                continue
+            if not started:
+                # Match the old behaviour of stripping the full response
+                text = text.lstrip()
+                started = bool(text)
+            if text:
+                yield text
+    finally:
+        stream.close()
+
+def cached_stream_answer(client, cache, document_content, question, context=None, cancelled=None,
+                         model=DEFAULT_MODEL, max_tokens=300, temperature=0.7):
+    # Like stream_answer, but answers are cached per (model, question, text
+    # sent, parameters), and identical questions asked at the same time share
+    # one request. context, if given, is what is actually sent instead of the
+    # whole document.
+    from response_cache import make_key
+    sent = context if context is not None else document_content
+    key = make_key(model, question, sent, {'max_tokens': max_tokens, 'temperature': temperature})
+    while True:
+        answer = cache.get(key)
+        if answer is not None:
+            yield answer
+            return
+        flight, leader = cache.begin(key)
+        if leader:
+            break
+        while not flight.wait(0.1):
+            if cancelled and cancelled():
+                return
+        if flight.result is not None:
+            yield flight.result
+            return
+        # The request we were waiting on was cancelled or failed; try again
+
+    parts = []
+    complete = False
+    try:
+        for text in stream_answer(client, sent, question, cancelled, model, max_tokens, temperature):
+            parts.append(text)
+            yield text
+        complete = not (cancelled and cancelled())
+    finally:
+        answer = ''.join(parts) if complete else None
+        if answer:
+            cache.put(key, answer)
+        cache.finish(key, flight, answer)
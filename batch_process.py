@@ -0,0 +1,150 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from doc_reader import iter_file, reads_toc, extract_toc
+from document_analysis import extract_keywords, calculate_readability
+from text_summarizer import summarize_text
+from search_index import SearchIndex, DEFAULT_INDEX_PATH
+from incremental_save import atomic_path
+
+SUPPORTED_EXTENSIONS = ('.docx', '.pdf', '.txt')
+STAGES = ('read', 'toc', 'keywords', 'readability', 'summary', 'index')
+
+def find_documents(root_dir):
+    for dir_path, dir_names, file_names in os.walk(root_dir):
+        dir_names.sort()
+        for file_name in sorted(file_names):
+            if file_name.lower().endswith(SUPPORTED_EXTENSIONS):
+                yield os.path.join(dir_path, file_name)
+
+# The search index of this worker process, opened once by _open_index
+_index = None
+
+def _open_index(index_path):
+    global _index
+    _index = SearchIndex(index_path) if index_path else None
+
+def process_document(file_path, num_keywords=10, num_sentences=5):
+    # Pages are added to the index opened by _open_index(), if any
+    record = {'path': file_path, 'timings': {}}
+
+    def timed(stage, func, *args):
+        start = time.perf_counter()
+        result = func(*args)
+        record['timings'][stage] = time.perf_counter() - start
+        return result
+
+    try:
+        # Inside the try: a file deleted since the directory walk is an error record
+        record['size'] = os.path.getsize(file_path)
+        toc = []
+        pages = timed('read', lambda: list(iter_file(file_path, toc=toc)))
+        text = '\n'.join(pages)
+        # Headings are collected while reading when the format supports it
+        record['toc'] = toc if reads_toc(file_path) else timed('toc', extract_toc, file_path)
+        record['keywords'] = timed('keywords', extract_keywords, text, num_keywords)
+        record['readability'] = timed('readability', calculate_readability, text)
+        record['summary'] = timed('summary', summarize_text, text, num_sentences)
+        if _index is not None:
+            timed('index', _index.add_document, file_path, pages)
+    except Exception as e:
+        record['error'] = f"{type(e).__name__}: {e}"
+    return record
+
+def load_checkpoint(output_path):
+    # The JSON Lines output doubles as the checkpoint: every path already
+    # processed successfully is skipped, failed ones are tried again. A
+    # partial last line left by a crash is cut off.
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, 'rb+') as f:
+        data = f.read()
+        if data and not data.endswith(b'\n'):
+            f.truncate(data.rfind(b'\n') + 1)
+            data = data[:data.rfind(b'\n') + 1]
+    for line in data.decode('utf-8').splitlines():
+        if line.strip():
+            record = json.loads(line)
+            if 'error' not in record:
+                done.add(record['path'])
+    return done
+
+def drop_records(output_path, paths):
+    # Removes the records of documents about to be processed again, so the
+    # output keeps one record per document
+    if not paths or not os.path.exists(output_path):
+        return
+    with open(output_path, encoding='utf-8') as f:
+        lines = f.readlines()
+    kept = [line for line in lines if line.strip() and json.loads(line)['path'] not in paths]
+    if len(kept) < len(lines):
+        with atomic_path(output_path) as temp_path:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                f.writelines(kept)
+
+def run_batch(root_dir, output_path, workers=None, num_keywords=10, num_sentences=5, index_path=DEFAULT_INDEX_PATH):
+    done = load_checkpoint(output_path)
+    if index_path:
+        # Create the tables once before the workers start writing to them
+        SearchIndex(index_path)
+    pending = [path for path in find_documents(root_dir) if path not in done]
+    drop_records(output_path, set(pending))
+    print(f"{len(pending)} documents to process ({len(done)} already done)")
+
+    stage_seconds = dict.fromkeys(STAGES, 0.0)
+    stage_docs = dict.fromkeys(STAGES, 0)
+    stage_bytes = dict.fromkeys(STAGES, 0)
+    total_bytes = 0
+    failed = 0
+    start = time.perf_counter()
+
+    with open(output_path, 'a', encoding='utf-8') as out, ProcessPoolExecutor(
+            max_workers=workers, initializer=_open_index, initargs=(index_path,)) as executor:
+        futures = [executor.submit(process_document, path, num_keywords, num_sentences) for path in pending]
+        for future in as_completed(futures):
+            record = future.result()
+            out.write(json.dumps(record, default=str) + '\n')
+            out.flush()
+            if 'error' in record:
+                failed += 1
+                print(f"Failed: {record['path']}: {record['error']}")
+                continue
+            total_bytes += record['size']
+            for stage, seconds in record['timings'].items():
+                stage_seconds[stage] += seconds
+                stage_docs[stage] += 1
+                stage_bytes[stage] += record['size']
+
+    elapsed = time.perf_counter() - start
+    processed = len(pending) - failed
+    megabytes = total_bytes / (1024 * 1024)
+    print(f"\nProcessed {processed} documents ({failed} failed) in {elapsed:.2f}s")
+    if elapsed > 0:
+        print(f"Overall: {processed / elapsed:.2f} docs/s, {megabytes / elapsed:.2f} MB/s")
+    # Stage figures are per worker-second, summed over all workers, and only
+    # count the documents that went through the stage
+    print(f"{'Stage':<12}{'docs/s':>12}{'MB/s':>12}")
+    for stage in STAGES:
+        seconds = stage_seconds[stage]
+        if seconds > 0:
+            stage_megabytes = stage_bytes[stage] / (1024 * 1024)
+            print(f"{stage:<12}{stage_docs[stage] / seconds:>12.2f}{stage_megabytes / seconds:>12.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Process a directory of documents without the GUI.")
+    parser.add_argument('root_dir', help="Directory to scan for DOCX, PDF and TXT files")
+    parser.add_argument('-o', '--output', default='results.jsonl', help="JSON Lines output file, also used to resume")
+    parser.add_argument('-w', '--workers', type=int, default=None, help="Number of worker processes (default: CPU count)")
+    parser.add_argument('--keywords', type=int, default=10, help="Number of keywords per document")
+    parser.add_argument('--sentences', type=int, default=5, help="Number of summary sentences per document")
+    parser.add_argument('--index', default=DEFAULT_INDEX_PATH, help="Full-text search index to add the documents to")
+    parser.add_argument('--no-index', action='store_true', help="Do not add the documents to the search index")
+    args = parser.parse_args()
+    run_batch(args.root_dir, args.output, args.workers, args.keywords, args.sentences,
+              None if args.no_index else args.index)
+
+if __name__ == "__main__":
+    main()
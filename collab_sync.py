@@ -0,0 +1,129 @@
+import json
+import queue
+import socket
+import threading
+from ot import TextOperation
+
+DEFAULT_SERVER = "127.0.0.1:8765"
+
+class SyncClient:
+    """Client side of the operational transform protocol (as in ot.js).
+
+    At most one operation is in flight to the server. Local edits made while
+    waiting for its acknowledgement are composed into a buffer that is sent
+    next. Operations from the server are transformed past both, so they can be
+    applied to the local text as it is now.
+    """
+
+    def __init__(self, revision, send):
+        self.revision = revision
+        self.outstanding = None
+        self.buffer = None
+        self.send = send
+
+    def apply_local(self, op):
+        if self.outstanding is None:
+            self.outstanding = op
+            self.send(self.revision, op)
+        elif self.buffer is None:
+            self.buffer = op
+        else:
+            self.buffer = self.buffer.compose(op)
+
+    def server_ack(self):
+        self.revision += 1
+        self.outstanding = self.buffer
+        self.buffer = None
+        if self.outstanding is not None:
+            self.send(self.revision, self.outstanding)
+
+    def apply_server(self, op):
+        # Returns the operation to apply to the local text
+        self.revision += 1
+        if self.outstanding is not None:
+            self.outstanding, op = TextOperation.transform(self.outstanding, op)
+        if self.buffer is not None:
+            self.buffer, op = TextOperation.transform(self.buffer, op)
+        return op
+
+class CollaborationSession:
+    """A connection to the relay server for one shared document.
+
+    Messages are JSON lines. A reader thread puts what arrives on a queue and
+    poll(), called on the Tk thread, turns it into events, so the sync state
+    and the editor are only touched from one thread. bytes_sent and
+    bytes_received show that traffic follows the size of the edits.
+    """
+
+    def __init__(self, server, doc_id, text):
+        host, _, port = server.rpartition(':')
+        self.doc_id = doc_id
+        self.client = None
+        self.length = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self._incoming = queue.Queue()
+        self._send_lock = threading.Lock()
+        self._sock = socket.create_connection((host or '127.0.0.1', int(port)), timeout=10)
+        self._sock.settimeout(None)
+        self._reader = threading.Thread(target=self._read, name="collaboration", daemon=True)
+        self._reader.start()
+        # The server keeps its own copy if the document is already shared
+        self._send({'type': 'join', 'doc': doc_id, 'text': text})
+
+    def _send(self, message):
+        data = (json.dumps(message, separators=(',', ':')) + '\n').encode('utf-8')
+        with self._send_lock:
+            self._sock.sendall(data)
+            self.bytes_sent += len(data)
+
+    def _send_op(self, revision, op):
+        self._send({'type': 'op', 'revision': revision, 'op': op.to_json()})
+
+    def _read(self):
+        error = None
+        try:
+            with self._sock.makefile('rb') as stream:
+                for line in stream:
+                    self.bytes_received += len(line)
+                    self._incoming.put(json.loads(line))
+        except (OSError, ValueError) as e:
+            error = e
+        self._incoming.put({'type': 'closed', 'error': str(error) if error else None})
+
+    def local_edit(self, op):
+        # op must apply to the text of length self.length
+        if self.client is None:
+            return
+        self.length = op.target_length
+        self.client.apply_local(op)
+
+    def poll(self):
+        # Yields ('snapshot', text), ('op', operation) and ('closed', error)
+        while True:
+            try:
+                message = self._incoming.get_nowait()
+            except queue.Empty:
+                return
+            kind = message['type']
+            if kind == 'snapshot':
+                self.client = SyncClient(message['revision'], self._send_op)
+                self.length = len(message['text'])
+                yield 'snapshot', message['text']
+            elif kind == 'ack':
+                self.client.server_ack()
+            elif kind == 'op':
+                op = self.client.apply_server(TextOperation.from_json(message['op']))
+                self.length = op.target_length
+                yield 'op', op
+            elif kind == 'error':
+                yield 'closed', message['message']
+            elif kind == 'closed':
+                yield 'closed', message['error']
+
+    def close(self):
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._sock.close()
@@ -1,50 +1,93 @@
-import firebase_admin
-from firebase_admin import credentials, firestore
-import difflib
+from diff_engine import DEFAULT_ALGORITHM, unified_diff
+from version_store import FirestoreBackend, VersionConflict, SNAPSHOT_INTERVAL, make_record, rebuild
+
+# How often an update is retried when another writer saved first
+MAX_UPDATE_ATTEMPTS = 5
 
 class CollaborationManager:
-    def __init__(self):
-        cred = credentials.Certificate("path/to/your/firebase_credentials.json")
-        firebase_admin.initialize_app(cred)
-        self.db = firestore.client()
+    # Versions are stored as periodic full snapshots with deltas in between,
+    # so saving costs about the size of the change rather than the document.
+    # backend can be a MemoryBackend or SQLiteBackend to work without Firestore.
+    # diff_algorithm is one of diff_engine.ALGORITHMS ('patience' or 'myers').
+    def __init__(self, backend=None, snapshot_interval=SNAPSHOT_INTERVAL, diff_algorithm=DEFAULT_ALGORITHM):
+        self.backend = backend if backend is not None else FirestoreBackend()
+        self.snapshot_interval = snapshot_interval
+        self.diff_algorithm = diff_algorithm
 
     def create_document(self, doc_id, content):
-        doc_ref = self.db.collection('documents').document(doc_id)
-        doc_ref.set({
-            'content': content,
-            'version': 1,
-            'history': [{'version': 1, 'content': content}]
-        })
+        record = make_record(1, 1, None, content)
+        self.backend.write_version(doc_id, {'content': content, 'version': 1, 'base': 1}, record)
 
     def update_document(self, doc_id, new_content):
-        doc_ref = self.db.collection('documents').document(doc_id)
-        doc = doc_ref.get()
-        if doc.exists:
-            old_content = doc.to_dict()['content']
-            new_version = doc.to_dict()['version'] + 1
-            doc_ref.update({
-                'content': new_content,
-                'version': new_version,
-                'history': firestore.ArrayUnion([{'version': new_version, 'content': new_content}])
-            })
-            return self.generate_diff(old_content, new_content)
-        return None
+        # The write only succeeds if nobody saved a version since the head was
+        # read; otherwise the head is read again and the update retried
+        for attempt in range(MAX_UPDATE_ATTEMPTS):
+            head = self.backend.get_head(doc_id)
+            if head is None:
+                return None
+            try:
+                self.backend.commit([self.prepare_write(doc_id, head, new_content)])
+            except VersionConflict:
+                continue
+            return self.generate_diff(head['content'], new_content)
+        raise VersionConflict([doc_id])
+
+    def prepare_write(self, doc_id, head, new_content):
+        # (doc_id, expected_version, head, record) for backend.commit(); head
+        # is the current head, or None to create the document
+        if head is None:
+            return doc_id, None, {'content': new_content, 'version': 1, 'base': 1}, make_record(1, 1, None, new_content)
+        new_version = head['version'] + 1
+        record = make_record(new_version, head.get('base'), head['content'], new_content, self.snapshot_interval)
+        return doc_id, head['version'], {'content': new_content, 'version': new_version, 'base': record['base']}, record
 
     def get_document(self, doc_id):
-        doc_ref = self.db.collection('documents').document(doc_id)
-        doc = doc_ref.get()
-        if doc.exists:
-            return doc.to_dict()['content']
+        head = self.backend.get_head(doc_id)
+        if head is not None:
+            return head['content']
         return None
 
+    def get_version(self, doc_id, version):
+        # Rebuilt from the nearest snapshot at or before the version
+        record = self.backend.get_record(doc_id, version)
+        if record is None:
+            return None
+        content = None
+        for _, content in rebuild(self.backend.get_records(doc_id, record['base'], version)):
+            pass
+        return content
+
     def get_version_history(self, doc_id):
-        doc_ref = self.db.collection('documents').document(doc_id)
-        doc = doc_ref.get()
-        if doc.exists:
-            return doc.to_dict()['history']
+        head = self.backend.get_head(doc_id)
+        if head is not None:
+            records = self.backend.get_records(doc_id, 1, head['version'])
+            return [{'version': version, 'content': content} for version, content in rebuild(records)]
         return None
 
     def generate_diff(self, old_content, new_content):
-        differ = difflib.Differ()
-        diff = list(differ.compare(old_content.splitlines(), new_content.splitlines()))
-        return '\n'.join(diff)
\ No newline at end of file
+        # Unified diff with three lines of context
+        return unified_diff(old_content, new_content, 'previous', 'current', algorithm=self.diff_algorithm)
+
+def check_legacy_head():
+    # A document saved before version records: its head has no base and no
+    # record exists for its versions. Updating it must write a snapshot, and
+    # the new versions must rebuild.
+    from version_store import MemoryBackend
+    backend = MemoryBackend()
+    lines = [f"Line {number} of a document saved before version records.\n" for number in range(50)]
+    backend._heads['legacy'] = {'content': ''.join(lines), 'version': 3}
+    manager = CollaborationManager(backend)
+    lines[10] = "An edited line.\n"
+    manager.update_document('legacy', ''.join(lines))
+    version_4 = ''.join(lines)
+    lines.append("A new last line.\n")
+    manager.update_document('legacy', ''.join(lines))
+    assert 'content' in backend.get_record('legacy', 4), "version 4 should be a snapshot"
+    assert 'delta' in backend.get_record('legacy', 5), "version 5 should be a delta"
+    assert manager.get_version('legacy', 4) == version_4
+    assert manager.get_version('legacy', 5) == ''.join(lines)
+    assert [entry['version'] for entry in manager.get_version_history('legacy')] == [4, 5]
+    print("Legacy head: updated with a snapshot, versions 4 and 5 rebuild")
+
+if __name__ == "__main__":
+    check_legacy_head()
@@ -1,4 +1,12 @@
 # OpenAI API Configuration
 OPENAI_API_KEY = "INSERT_YOUR_API_KEY_HERE"
 
+# Optional: send requests to a different OpenAI-compatible server, for example
+# a local stub server such as "http://127.0.0.1:8000/v1"
+OPENAI_BASE_URL = None
+
+# Approximate number of tokens of document context sent with each question.
+# Larger documents are reduced to the passages most relevant to the question.
+AI_CONTEXT_TOKEN_BUDGET = 2000
+
 # You can add other configuration items here as needed
\ No newline at end of file
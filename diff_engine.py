@@ -0,0 +1,414 @@
+import argparse
+import random
+import struct
+import time
+import zlib
+from bisect import bisect_left
+
+DEFAULT_ALGORITHM = 'patience'
+# Edits searched from each end of a range before myers_matches settles for
+# a split that may not give the shortest diff
+MAX_SNAKE_COST = 64
+PATCH_MAGIC = b'LDP1'
+
+# Binary patch op codes
+_COPY = 0
+_DELETE = 1
+_INSERT = 2
+
+def split_lines(text):
+    return text.splitlines(keepends=True)
+
+def hash_lines(a, b):
+    # Lines are replaced by small integers so comparisons are cheap
+    ids = {}
+    return ([ids.setdefault(line, len(ids)) for line in a],
+            [ids.setdefault(line, len(ids)) for line in b])
+
+def myers_matches(a, alo, ahi, b, blo, bhi, max_cost=None):
+    """Matching (i, j) pairs of an edit script for a[alo:ahi] and b[blo:bhi].
+
+    Myers' O(ND) algorithm in linear space: the ranges are split where the
+    forward and backward searches for a shortest edit script meet, and each
+    half is diffed the same way, so memory is O(N + M). A search gives up
+    after max_cost edits from each end (MAX_SNAKE_COST by default) and
+    splits where the forward search got furthest instead, as GNU diff does.
+    Time then stays bounded on texts with little in common, at the cost of a
+    diff that may not be the shortest.
+    """
+    max_cost = max_cost or MAX_SNAKE_COST
+    matches = []
+    stack = [(alo, ahi, blo, bhi)]
+    while stack:
+        alo, ahi, blo, bhi = stack.pop()
+        while alo < ahi and blo < bhi and a[alo] == b[blo]:
+            matches.append((alo, blo))
+            alo += 1
+            blo += 1
+        while alo < ahi and blo < bhi and a[ahi - 1] == b[bhi - 1]:
+            ahi -= 1
+            bhi -= 1
+            matches.append((ahi, bhi))
+        if alo == ahi or blo == bhi:
+            continue
+        split = _split_point(a, alo, ahi, b, blo, bhi, max_cost)
+        if split is None:
+            continue  # Nothing in common: the whole range is replaced
+        x, y = split
+        stack.append((alo, alo + x, blo, blo + y))
+        stack.append((alo + x, ahi, blo + y, bhi))
+    matches.sort()
+    return matches
+
+def _split_point(a, alo, ahi, b, blo, bhi, max_cost):
+    # (x, y) offsets into the ranges where a shortest edit script can be cut
+    # in two, or None if they have no line in common. The first and the last
+    # lines of the ranges must differ, so that both halves are smaller.
+    n = ahi - alo
+    m = bhi - blo
+    delta = n - m
+    odd = delta & 1
+    max_d = (n + m + 1) // 2
+    offset = max_d + 1
+    size = 2 * max_d + 3
+    # forward[offset + k]: furthest x on diagonal k = x - y from the start;
+    # backward[offset + k]: the same from the end of both ranges. -1: not reached.
+    forward = [-1] * size
+    backward = [-1] * size
+    forward[offset + 1] = backward[offset + 1] = 0
+    # Diagonals that ran off the grid are skipped from then on
+    forward_start = forward_end = backward_start = backward_end = 0
+    for d in range(min(max_d, max_cost)):
+        for k in range(-d + forward_start, d + 1 - forward_end, 2):
+            if k == -d or (k != d and forward[offset + k - 1] < forward[offset + k + 1]):
+                x = forward[offset + k + 1]
+            else:
+                x = forward[offset + k - 1] + 1
+            y = x - k
+            while x < n and y < m and a[alo + x] == b[blo + y]:
+                x += 1
+                y += 1
+            forward[offset + k] = x
+            if x > n:
+                forward_end += 2
+            elif y > m:
+                forward_start += 2
+            elif odd:
+                reached = backward[offset + delta - k] if 0 <= offset + delta - k < size else -1
+                if reached != -1 and x >= n - reached:
+                    return x, y
+        for k in range(-d + backward_start, d + 1 - backward_end, 2):
+            if k == -d or (k != d and backward[offset + k - 1] < backward[offset + k + 1]):
+                x = backward[offset + k + 1]
+            else:
+                x = backward[offset + k - 1] + 1
+            y = x - k
+            while x < n and y < m and a[ahi - 1 - x] == b[bhi - 1 - y]:
+                x += 1
+                y += 1
+            backward[offset + k] = x
+            if x > n:
+                backward_end += 2
+            elif y > m:
+                backward_start += 2
+            elif not odd:
+                forward_k = delta - k
+                reached = forward[offset + forward_k] if 0 <= offset + forward_k < size else -1
+                if reached != -1 and reached >= n - x:
+                    return reached, reached - forward_k
+    if max_d <= max_cost:
+        return None
+    # Too expensive: cut where the forward search got furthest. The half
+    # before the cut takes at most max_cost edits, so it is solved exactly.
+    best = None
+    for k in range(-max_cost, max_cost + 1):
+        x = forward[offset + k]
+        if 0 <= x <= n and 0 <= x - k <= m and (best is None or 2 * x - k > best[0] + best[1]):
+            best = (x, x - k)
+    if best is None or best in ((0, 0), (n, m)):
+        return None
+    return best
+
+def _unique_anchors(a, alo, ahi, b, blo, bhi):
+    # (i, j) for lines that occur exactly once in both ranges, in a's order
+    counts = {}
+    for i in range(alo, ahi):
+        entry = counts.get(a[i])
+        counts[a[i]] = [1, i, None] if entry is None else [entry[0] + 1, i, None]
+    for j in range(blo, bhi):
+        entry = counts.get(b[j])
+        if entry is not None and entry[0] == 1:
+            # A second occurrence in b rules the line out
+            entry[2] = j if entry[2] is None else -1
+    return sorted((i, j) for count, i, j in counts.values() if count == 1 and j is not None and j >= 0)
+
+def _longest_increasing(anchors):
+    # Longest run of anchors whose b positions also increase (patience sorting)
+    tails = []
+    tail_indexes = []
+    previous = [None] * len(anchors)
+    for index, (i, j) in enumerate(anchors):
+        pile = bisect_left(tails, j)
+        if pile:
+            previous[index] = tail_indexes[pile - 1]
+        if pile == len(tails):
+            tails.append(j)
+            tail_indexes.append(index)
+        else:
+            tails[pile] = j
+            tail_indexes[pile] = index
+    result = []
+    index = tail_indexes[-1] if tail_indexes else None
+    while index is not None:
+        result.append(anchors[index])
+        index = previous[index]
+    result.reverse()
+    return result
+
+def patience_matches(a, alo, ahi, b, blo, bhi):
+    # Lines unique to both sides anchor the diff; the gaps between anchors
+    # are diffed the same way, and with Myers when they have no unique lines
+    matches = []
+    stack = [(alo, ahi, blo, bhi)]
+    while stack:
+        alo, ahi, blo, bhi = stack.pop()
+        while alo < ahi and blo < bhi and a[alo] == b[blo]:
+            matches.append((alo, blo))
+            alo += 1
+            blo += 1
+        while alo < ahi and blo < bhi and a[ahi - 1] == b[bhi - 1]:
+            ahi -= 1
+            bhi -= 1
+            matches.append((ahi, bhi))
+        if alo == ahi or blo == bhi:
+            continue
+        anchors = _longest_increasing(_unique_anchors(a, alo, ahi, b, blo, bhi))
+        if not anchors:
+            matches.extend(myers_matches(a, alo, ahi, b, blo, bhi))
+            continue
+        for i, j in anchors:
+            matches.append((i, j))
+            stack.append((alo, i, blo, j))
+            alo, blo = i + 1, j + 1
+        stack.append((alo, ahi, blo, bhi))
+    matches.sort()
+    return matches
+
+def _trimmed_myers_matches(a, alo, ahi, b, blo, bhi):
+    prefix = []
+    while alo < ahi and blo < bhi and a[alo] == b[blo]:
+        prefix.append((alo, blo))
+        alo += 1
+        blo += 1
+    suffix = []
+    while alo < ahi and blo < bhi and a[ahi - 1] == b[bhi - 1]:
+        ahi -= 1
+        bhi -= 1
+        suffix.append((ahi, bhi))
+    suffix.reverse()
+    return prefix + myers_matches(a, alo, ahi, b, blo, bhi) + suffix
+
+ALGORITHMS = {
+    'patience': patience_matches,
+    'myers': _trimmed_myers_matches,
+}
+
+def opcodes(a, b, algorithm=DEFAULT_ALGORITHM):
+    # Same (tag, i1, i2, j1, j2) tuples as difflib.SequenceMatcher.get_opcodes()
+    a_ids, b_ids = hash_lines(a, b)
+    matches = ALGORITHMS[algorithm](a_ids, 0, len(a_ids), b_ids, 0, len(b_ids))
+    matches.append((len(a), len(b)))
+    codes = []
+    i = j = 0
+    run_start = None
+    for mi, mj in matches:
+        if (mi, mj) == (i, j) and mi < len(a):
+            if run_start is None:
+                run_start = (i, j)
+            i += 1
+            j += 1
+            continue
+        if run_start is not None:
+            codes.append(('equal', run_start[0], i, run_start[1], j))
+            run_start = None
+        if mi > i and mj > j:
+            codes.append(('replace', i, mi, j, mj))
+        elif mi > i:
+            codes.append(('delete', i, mi, j, j))
+        elif mj > j:
+            codes.append(('insert', i, i, j, mj))
+        i, j = mi, mj
+        if mi < len(a):
+            run_start = (i, j)
+            i += 1
+            j += 1
+    return codes
+
+def grouped_opcodes(codes, n=3):
+    # Hunks with n lines of context, as in difflib.SequenceMatcher.get_grouped_opcodes()
+    if not codes:
+        codes = [('equal', 0, 1, 0, 1)]
+    codes = list(codes)
+    if codes[0][0] == 'equal':
+        tag, i1, i2, j1, j2 = codes[0]
+        codes[0] = tag, max(i1, i2 - n), i2, max(j1, j2 - n), j2
+    if codes[-1][0] == 'equal':
+        tag, i1, i2, j1, j2 = codes[-1]
+        codes[-1] = tag, i1, min(i2, i1 + n), j1, min(j2, j1 + n)
+    group = []
+    for tag, i1, i2, j1, j2 in codes:
+        if tag == 'equal' and i2 - i1 > 2 * n:
+            group.append((tag, i1, min(i2, i1 + n), j1, min(j2, j1 + n)))
+            yield group
+            group = []
+            i1, j1 = max(i1, i2 - n), max(j1, j2 - n)
+        group.append((tag, i1, i2, j1, j2))
+    if group and not (len(group) == 1 and group[0][0] == 'equal'):
+        yield group
+
+def _hunk_range(start, stop):
+    length = stop - start
+    if length == 1:
+        return f"{start + 1}"
+    return f"{start + 1 if length else start},{length}"
+
+def unified_diff(old_content, new_content, fromfile='a', tofile='b', n=3, algorithm=DEFAULT_ALGORITHM):
+    # Same output as ''.join(difflib.unified_diff(...)) on the lines of both texts
+    a = split_lines(old_content)
+    b = split_lines(new_content)
+    out = []
+    for group in grouped_opcodes(opcodes(a, b, algorithm), n):
+        if not out:
+            out.append(f"--- {fromfile}\n+++ {tofile}\n")
+        first, last = group[0], group[-1]
+        out.append(f"@@ -{_hunk_range(first[1], last[2])} +{_hunk_range(first[3], last[4])} @@\n")
+        for tag, i1, i2, j1, j2 in group:
+            if tag == 'equal':
+                out.extend(' ' + line for line in a[i1:i2])
+                continue
+            out.extend('-' + line for line in a[i1:i2])
+            out.extend('+' + line for line in b[j1:j2])
+    # Lines without a final newline are ended so the diff stays line based
+    return ''.join(line if line.endswith('\n') else line + '\n' for line in out)
+
+def _varint(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+def _read_varint(data, pos):
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+
+def make_patch(old_content, new_content, algorithm=DEFAULT_ALGORITHM):
+    # Compact binary patch: a header with the CRC of the old text, then
+    # copy/delete line counts and inserted UTF-8 text, all varint encoded
+    a = split_lines(old_content)
+    b = split_lines(new_content)
+    out = [PATCH_MAGIC, struct.pack('<I', zlib.crc32(old_content.encode('utf-8')))]
+    for tag, i1, i2, j1, j2 in opcodes(a, b, algorithm):
+        if tag == 'equal':
+            out.append(bytes([_COPY]) + _varint(i2 - i1))
+            continue
+        if i2 > i1:
+            out.append(bytes([_DELETE]) + _varint(i2 - i1))
+        if j2 > j1:
+            text = ''.join(b[j1:j2]).encode('utf-8')
+            out.append(bytes([_INSERT]) + _varint(len(text)) + text)
+    return b''.join(out)
+
+def apply_patch(old_content, patch):
+    if patch[:4] != PATCH_MAGIC:
+        raise ValueError("Not a line diff patch")
+    if struct.unpack('<I', patch[4:8])[0] != zlib.crc32(old_content.encode('utf-8')):
+        raise ValueError("Patch does not apply to this content")
+    a = split_lines(old_content)
+    parts = []
+    i = 0
+    pos = 8
+    while pos < len(patch):
+        op = patch[pos]
+        value, pos = _read_varint(patch, pos + 1)
+        if op == _COPY:
+            parts.extend(a[i:i + value])
+            i += value
+        elif op == _DELETE:
+            i += value
+        elif op == _INSERT:
+            parts.append(patch[pos:pos + value].decode('utf-8'))
+            pos += value
+        else:
+            raise ValueError(f"Unknown patch op {op}")
+    return ''.join(parts)
+
+def _edited_copy(lines, edits, rng):
+    lines = list(lines)
+    for _ in range(edits):
+        i = rng.randrange(len(lines))
+        action = rng.random()
+        if action < 0.4:
+            lines[i] = f"edited line {rng.random()}\n"
+        elif action < 0.7:
+            lines.insert(i, f"inserted line {rng.random()}\n")
+        else:
+            del lines[i]
+    return lines
+
+def benchmark(line_count=100000, edits=500, seed=0, compare_difflib=True):
+    import difflib
+    rng = random.Random(seed)
+    words = ["the", "document", "reader", "shows", "text", "and", "answers", "questions", "about", "it"]
+    a = [' '.join(rng.choice(words) for _ in range(8)) + '\n' for _ in range(line_count)]
+    # Repeated lines such as blank lines, which patience cannot anchor on
+    for i in range(0, line_count, 10):
+        a[i] = '\n'
+    b = _edited_copy(a, edits, rng)
+    old_content, new_content = ''.join(a), ''.join(b)
+    print(f"{line_count} lines, {edits} scattered edits")
+
+    timings = {}
+    for algorithm in ALGORITHMS:
+        started = time.perf_counter()
+        diff = unified_diff(old_content, new_content, algorithm=algorithm)
+        timings[algorithm] = time.perf_counter() - started
+        print(f"{algorithm + ' unified':<22}{timings[algorithm]:>9.3f}s {len(diff):>10} bytes")
+    started = time.perf_counter()
+    patch = make_patch(old_content, new_content)
+    assert apply_patch(old_content, patch) == new_content
+    print(f"{'patience binary':<22}{time.perf_counter() - started:>9.3f}s {len(patch):>10} bytes")
+
+    # A whole-document rewrite with many repeated lines: no unique anchors,
+    # so everything goes to Myers, which must stay bounded
+    rewrite_a = [rng.choice(words) + '\n' for _ in range(4000)]
+    rewrite_b = [rng.choice(words) + '\n' for _ in range(4000)]
+    started = time.perf_counter()
+    codes = opcodes(rewrite_a, rewrite_b)
+    kept = sum(i2 - i1 for tag, i1, i2, j1, j2 in codes if tag == 'equal')
+    print(f"{'rewrite, 4000 lines':<22}{time.perf_counter() - started:>9.3f}s {kept:>10} lines kept")
+
+    if compare_difflib:
+        started = time.perf_counter()
+        reference = ''.join(difflib.unified_diff(a, b, 'a', 'b', lineterm='\n'))
+        elapsed = time.perf_counter() - started
+        print(f"{'difflib unified':<22}{elapsed:>9.3f}s {len(reference):>10} bytes")
+        print(f"Speedup over difflib: {elapsed / timings[DEFAULT_ALGORITHM]:.1f}x")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the line diff engine with difflib.")
+    parser.add_argument('--lines', type=int, default=100000, help="Number of lines in the document")
+    parser.add_argument('--edits', type=int, default=500, help="Number of scattered line edits")
+    parser.add_argument('--no-difflib', action='store_true', help="Skip the (slow) difflib run")
+    args = parser.parse_args()
+    benchmark(args.lines, args.edits, compare_difflib=not args.no_difflib)
@@ -1,65 +1,229 @@
-from docx import Document
-import PyPDF2
+import argparse
 import os
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
+import time
+from concurrent.futures import ProcessPoolExecutor
+from large_text import DEFAULT_ERRORS
+
+# python-docx, PyPDF2 and reportlab are imported inside the functions that use
+# them, so importing this module (and opening the GUI) stays fast
+
+# Below this many pages, starting worker processes costs more than it saves
+PARALLEL_MIN_PAGES = 32
+
+def read_file(file_path, stream=False, parallel=False, cache=None, progress=None):
+    # With stream=True, return a generator that yields the document page by page
+    # (one chunk for DOCX and TXT) instead of one big string. While streaming,
+    # progress(pages_done, total_pages) is called as each page is extracted.
+    if cache is not None:
+        if stream:
+            return _iter_file_cached(file_path, cache, progress)
+        return load_document(file_path, cache, parallel)['text']
+    if stream:
+        return iter_file(file_path, progress)
 
-def read_file(file_path):
     _, file_extension = os.path.splitext(file_path)
     
     if file_extension.lower() == '.docx':
         return read_docx(file_path)
     elif file_extension.lower() == '.pdf':
-        return read_pdf(file_path)
+        return read_pdf(file_path, parallel=parallel)
     elif file_extension.lower() == '.txt':
         return read_txt(file_path)
     else:
         raise ValueError(f"Unsupported file format: {file_extension}")
 
+def iter_file(file_path, progress=None, toc=None):
+    # If toc is a list and the format allows it (see reads_toc), TOC entries
+    # found while reading are appended to it, saving a second parse
+    _, file_extension = os.path.splitext(file_path)
+
+    if file_extension.lower() == '.pdf':
+        yield from iter_pdf_pages(file_path, progress, toc)
+        return
+    if file_extension.lower() == '.docx':
+        from docx_stream import iter_docx_pages
+        yield from iter_docx_pages(file_path, progress, toc)
+        return
+    if file_extension.lower() == '.txt':
+        text = read_txt(file_path)
+    else:
+        raise ValueError(f"Unsupported file format: {file_extension}")
+    if progress:
+        progress(1, 1)
+    yield text
+
+def reads_toc(file_path):
+    # Whether iter_file() collects the TOC in the same pass
+    return file_path.lower().endswith(('.docx', '.pdf'))
+
+def read_pages_and_toc(file_path, progress=None):
+    toc = []
+    pages = list(iter_file(file_path, progress, toc))
+    if not reads_toc(file_path):
+        toc = extract_toc(file_path)
+    return pages, toc
+
+def load_document(file_path, cache=None, parallel=False):
+    # Returns the text, TOC and page start offsets, served from the cache when
+    # the file has been extracted before
+    if cache is not None:
+        document = cache.get(file_path)
+        if document is not None:
+            return document
+
+    _, file_extension = os.path.splitext(file_path)
+    if parallel and file_extension.lower() == '.pdf':
+        pages = extract_pdf_pages_parallel(file_path)
+        toc = add_toc_offsets(extract_toc(file_path), page_offsets(pages))
+    else:
+        pages, toc = read_pages_and_toc(file_path)
+    document = {'text': '\n'.join(pages), 'toc': toc, 'page_offsets': page_offsets(pages)}
+    if cache is not None:
+        cache.put(file_path, document['text'], document['toc'], document['page_offsets'])
+    return document
+
+def _iter_file_cached(file_path, cache, progress=None):
+    document = cache.get(file_path)
+    if document is not None:
+        text, offsets = document['text'], document['page_offsets']
+        for page_number, (start, end) in enumerate(zip(offsets, offsets[1:] + [len(text) + 1]), 1):
+            if progress:
+                progress(page_number, len(offsets))
+            yield text[start:end - 1]
+        return
+
+    pages = []
+    toc = []
+    for page in iter_file(file_path, progress, toc):
+        pages.append(page)
+        yield page
+    if not reads_toc(file_path):
+        toc = extract_toc(file_path)
+    cache.put(file_path, '\n'.join(pages), toc, page_offsets(pages))
+
+def page_offsets(pages):
+    # Start offset of each page in the '\n'-joined document text
+    offsets = []
+    position = 0
+    for page in pages:
+        offsets.append(position)
+        position += len(page) + 1
+    return offsets
+
+def add_toc_offsets(toc, offsets):
+    # Gives TOC entries that point to a page the offset of that page
+    for entry in toc:
+        page = entry['page']
+        entry['offset'] = offsets[page] if page is not None and page < len(offsets) else None
+    return toc
+
 def read_docx(file_path):
-    doc = Document(file_path)
-    return '\n'.join([paragraph.text for paragraph in doc.paragraphs])
+    from docx_stream import iter_docx_pages
+    return '\n'.join(iter_docx_pages(file_path))
 
-def read_pdf(file_path):
-    with open(file_path, 'rb') as file:
-        reader = PyPDF2.PdfReader(file)
-        return '\n'.join([page.extract_text() for page in reader.pages])
+def read_pdf(file_path, parallel=False, max_workers=None):
+    if parallel:
+        return '\n'.join(extract_pdf_pages_parallel(file_path, max_workers))
+    return '\n'.join(iter_pdf_pages(file_path))
 
-def read_txt(file_path):
-    with open(file_path, 'r', encoding='utf-8') as file:
+def iter_pdf_pages(file_path, progress=None, toc=None):
+    from pdf_document import PdfDocument
+    # Pages are extracted one at a time, so only the current page is held in
+    # memory. The outline is read from the same open document; its entries
+    # get page offsets once all pages are read.
+    with PdfDocument(file_path) as document:
+        offsets = []
+        position = 0
+        for text in document.iter_pages(progress):
+            offsets.append(position)
+            position += len(text) + 1
+            yield text
+        if toc is not None:
+            toc.extend(add_toc_offsets(document.toc(), offsets))
+
+def extract_pdf_pages_parallel(file_path, max_workers=None):
+    from pdf_document import PdfDocument
+    with PdfDocument(file_path) as document:
+        page_count = document.page_count
+
+    max_workers = max_workers or os.cpu_count() or 1
+    if max_workers < 2 or page_count < PARALLEL_MIN_PAGES:
+        return list(iter_pdf_pages(file_path))
+
+    # Split the pages into one contiguous range per worker; map() returns the
+    # ranges in submission order, so the pages come back in document order
+    chunk_size = -(-page_count // max_workers)
+    ranges = [(start, min(start + chunk_size, page_count)) for start in range(0, page_count, chunk_size)]
+    pages = []
+    with ProcessPoolExecutor(max_workers=len(ranges)) as executor:
+        for chunk in executor.map(_extract_pdf_page_range, [file_path] * len(ranges), *zip(*ranges)):
+            pages.extend(chunk)
+    return pages
+
+def _extract_pdf_page_range(file_path, start, stop):
+    from pdf_document import PdfDocument
+    # Runs in a worker process, which opens its own reader
+    with PdfDocument(file_path) as document:
+        return [document.page_text(i) for i in range(start, stop)]
+
+def read_txt(file_path, errors=DEFAULT_ERRORS):
+    # Undecodable bytes follow the errors policy ('replace' by default,
+    # 'strict' to fail) instead of making the whole file unreadable
+    with open(file_path, 'r', encoding='utf-8', errors=errors) as file:
         return file.read()
 
-def save_file(file_path, content):
+def save_file(file_path, content, changes=None):
+    # changes is an incremental_save.EditTracker for the document being
+    # edited. When it matches the file on disk, only the edited paragraphs
+    # are rewritten; otherwise the whole file is. Files are replaced
+    # atomically. Returns how the file was written ('unchanged', 'appended',
+    # 'patched' or 'rewritten').
     _, file_extension = os.path.splitext(file_path)
-    
+
     if file_extension.lower() == '.docx':
-        save_docx(file_path, content)
-    elif file_extension.lower() in ['.txt', '.pdf']:
-        save_txt(file_path, content)
+        return save_docx(file_path, content, changes)
+    elif file_extension.lower() == '.txt':
+        return save_txt(file_path, content, changes)
+    elif file_extension.lower() == '.pdf':
+        from incremental_save import atomic_path
+        with atomic_path(file_path) as temp_path:
+            export_to_pdf(temp_path, content)
+        return 'rewritten'
     else:
         raise ValueError(f"Unsupported file format for saving: {file_extension}")
 
-def save_docx(file_path, content):
+def save_docx(file_path, content, changes=None):
+    from incremental_save import atomic_path, save_docx_incremental
+    result = save_docx_incremental(file_path, content, changes)
+    if result is not None:
+        return result
+    from docx import Document
     doc = Document()
     for paragraph in content.split('\n'):
         doc.add_paragraph(paragraph)
-    doc.save(file_path)
-
-def save_txt(file_path, content):
-    with open(file_path, 'w', encoding='utf-8') as file:
-        file.write(content)
-
-def export_to_pdf(file_path, content):
-    c = canvas.Canvas(file_path, pagesize=letter)
-    width, height = letter
-    y = height - 50  # Start from top of the page
-    for line in content.split('\n'):
-        if y < 50:  # If we're at the bottom of the page
-            c.showPage()  # Start a new page
-            y = height - 50  # Reset y to top of page
-        c.drawString(50, y, line)
-        y -= 15  # Move down for next line
-    c.save()
+    with atomic_path(file_path) as temp_path:
+        doc.save(temp_path)
+    return 'rewritten'
+
+def save_txt(file_path, content, changes=None):
+    from incremental_save import atomic_path, save_text_incremental
+    result = save_text_incremental(file_path, content, changes)
+    if result is not None:
+        return result
+    with atomic_path(file_path) as temp_path:
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            file.write(content)
+    return 'rewritten'
+
+def export_to_pdf(file_path, content, progress=None):
+    # content is a string or an iterable of text chunks, such as
+    # read_file(..., stream=True). Lines are wrapped to the page width and
+    # pages are written as they fill, so memory use stays flat for large
+    # inputs. progress(pages, chars_done, total_chars) follows each page.
+    from pdf_export import export_text_to_pdf, iter_chunks
+    if isinstance(content, str):
+        return export_text_to_pdf(file_path, iter_chunks(content), len(content), progress)
+    return export_text_to_pdf(file_path, content, None, progress)
 
 def export_to_html(file_path, content):
     html_content = f"""
@@ -76,7 +240,12 @@ def export_to_html(file_path, content):
     with open(file_path, 'w', encoding='utf-8') as f:
         f.write(html_content)
 
-def extract_toc(file_path):
+def extract_toc(file_path, cache=None):
+    if cache is not None:
+        toc = cache.get_toc(file_path)
+        if toc is not None:
+            return toc
+
     _, file_extension = os.path.splitext(file_path)
     
     if file_extension.lower() == '.docx':
@@ -87,64 +256,45 @@ def extract_toc(file_path):
         return []  # Return empty list for unsupported formats
 
 def extract_toc_docx(file_path):
-    doc = Document(file_path)
+    # Entries have the page index (from Word's saved page breaks) and the
+    # offset of the heading in the document text
+    from docx_stream import iter_docx_pages
     toc = []
-    for paragraph in doc.paragraphs:
-        if paragraph.style.name.startswith('Heading'):
-            level = int(paragraph.style.name[-1])
-            toc.append({'title': paragraph.text, 'level': level, 'page': 0})  # Page number not available in docx
+    for _ in iter_docx_pages(file_path, toc=toc):
+        pass
     return toc
 
 def extract_toc_pdf(file_path):
-    with open(file_path, 'rb') as file:
-        reader = PyPDF2.PdfReader(file)
-        if '/Outlines' in reader.trailer['/Root']:
-            outlines = reader.outline
-            return parse_pdf_outlines(outlines)
-    return []
-
-def parse_pdf_outlines(outlines, level=1):
-    toc = []
-    for item in outlines:
-        if isinstance(item, list):
-            toc.extend(parse_pdf_outlines(item, level+1))
-        else:
-            toc.append({'title': item.title, 'level': level, 'page': item.page})
-    return toc
-
-def generate_bullet_points(text, num_points=5):
-    summary = summarize_text(text, num_points)
-    sentences = sent_tokenize(summary)
-    return '\n'.join([f"• {sentence}" for sentence in sentences])
-
-def summarize_text(text, num_sentences=5):
-    # Tokenize the text into sentences
-    sentences = sent_tokenize(text)
-    
-    # Remove stopwords and punctuation
-    stop_words = set(stopwords.words('english') + list('!"#$%&\'()*+,-./:;<=>?@[\\]^_`{|}~'))
-    words = [word.lower() for sentence in sentences for word in sentence.split() if word.lower() not in stop_words]
-    
-    # Calculate word frequencies
-    freq = FreqDist(words)
-    
-    # Score sentences based on word frequencies
-    sentence_scores = {}
-    for sentence in sentences:
-        for word in sentence.split():
-            if word.lower() in freq:
-                if sentence not in sentence_scores:
-                    sentence_scores[sentence] = freq[word.lower()]
-                else:
-                    sentence_scores[sentence] += freq[word.lower()]
-    
-    # Get the top N sentences
-    summary_sentences = nlargest(num_sentences, sentence_scores, key=sentence_scores.get)
-    
-    # Join the sentences and return the summary
-    return ' '.join(summary_sentences)
+    # Entries have the index of the page each outline item points to, or None
+    from pdf_document import PdfDocument
+    with PdfDocument(file_path) as document:
+        return document.toc()
 
+def benchmark(file_path='benchmark_parallel.pdf', pages=200, workers=None):
+    # Serial against multi-process extraction of a generated PDF
+    from pdf_export import export_text_to_pdf
+    line = "Parallel extraction splits the pages of a long PDF into one range per worker process."
+    text = '\n'.join(f"{line} Line {number}." for number in range(pages * 48))
+    page_count = export_text_to_pdf(file_path, [text])
+    workers = workers or os.cpu_count() or 1
 
+    started = time.perf_counter()
+    serial = list(iter_pdf_pages(file_path))
+    serial_time = time.perf_counter() - started
 
+    started = time.perf_counter()
+    parallel = extract_pdf_pages_parallel(file_path, workers)
+    parallel_time = time.perf_counter() - started
 
+    print(f"{page_count}-page PDF, {workers} workers, same text: {parallel == serial}")
+    print(f"serial:   {serial_time:.2f}s ({page_count / serial_time:.0f} pages/s)")
+    print(f"parallel: {parallel_time:.2f}s ({page_count / parallel_time:.0f} pages/s, "
+          f"{serial_time / parallel_time:.1f}x)")
 
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare serial and parallel PDF text extraction.")
+    parser.add_argument('--pages', type=int, default=200, help="Pages in the generated PDF")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: one per CPU)")
+    parser.add_argument('--output', default='benchmark_parallel.pdf', help="Where to write the generated PDF")
+    args = parser.parse_args()
+    benchmark(args.output, args.pages, args.workers)
@@ -0,0 +1,231 @@
+import argparse
+import re
+import time
+import zipfile
+from xml.etree.ElementTree import iterparse, parse
+
+W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+EXTENDED_PROPERTIES = '{http://schemas.openxmlformats.org/officeDocument/2006/extended-properties}'
+
+HEADING_STYLE = re.compile(r'heading\s*(\d)$', re.IGNORECASE)
+
+# Run children that stand for text, as in python-docx's Run.text
+_RUN_TEXT = {W + 'tab': '\t', W + 'ptab': '\t', W + 'cr': '\n', W + 'noBreakHyphen': '-'}
+# Paragraph children whose content is not part of the paragraph text
+_SKIPPED = {W + 'pPr', W + 'rPr', W + 'del', W + 'moveFrom'}
+
+def heading_levels(archive):
+    # Paragraph style id -> heading level, for styles named "Heading N"
+    try:
+        styles = parse(archive.open('word/styles.xml')).getroot()
+    except KeyError:
+        return {}
+    levels = {}
+    for style in styles.iter(W + 'style'):
+        name = style.find(W + 'name')
+        match = HEADING_STYLE.match(name.get(W + 'val', '')) if name is not None else None
+        if match and style.get(W + 'type') == 'paragraph':
+            levels[style.get(W + 'styleId')] = int(match.group(1))
+    return levels
+
+def page_count(archive):
+    # The page count Word saved in docProps/app.xml, or None
+    try:
+        pages = parse(archive.open('docProps/app.xml')).getroot().find(EXTENDED_PROPERTIES + 'Pages')
+    except (KeyError, SyntaxError):
+        return None
+    return int(pages.text) if pages is not None and pages.text and pages.text.isdigit() else None
+
+class _Paragraph:
+    __slots__ = ('parts', 'break_before', 'break_after')
+
+    def __init__(self):
+        self.parts = []
+        self.break_before = False
+        self.break_after = False
+
+def _read_paragraph(p):
+    paragraph = _Paragraph()
+    page_break_before = p.find(f'{W}pPr/{W}pageBreakBefore')
+    if page_break_before is not None and page_break_before.get(W + 'val', 'true') not in ('0', 'false'):
+        paragraph.break_before = True
+    _collect(p, paragraph)
+    return paragraph
+
+def _collect(element, paragraph):
+    for child in element:
+        tag = child.tag
+        if tag in _SKIPPED:
+            continue
+        if tag == W + 'r':
+            for item in child:
+                _run_item(item, paragraph)
+        else:
+            # Hyperlinks, insertions, smart tags, fields...
+            _collect(child, paragraph)
+
+def _run_item(item, paragraph):
+    tag = item.tag
+    if tag == W + 't':
+        if item.text:
+            paragraph.parts.append(item.text)
+    elif tag in _RUN_TEXT:
+        paragraph.parts.append(_RUN_TEXT[tag])
+    elif tag == W + 'br':
+        kind = item.get(W + 'type')
+        if kind in (None, 'textWrapping'):
+            paragraph.parts.append('\n')
+        elif kind == 'page':
+            _page_break(paragraph)
+    elif tag == W + 'lastRenderedPageBreak':
+        # Where Word's layout started a new page when the file was saved
+        _page_break(paragraph)
+
+def _page_break(paragraph):
+    # Pages are split between paragraphs, so the text is the same as
+    # without pages: a break before any text starts the page here, a later
+    # one starts it at the next paragraph
+    if paragraph.parts:
+        paragraph.break_after = True
+    else:
+        paragraph.break_before = True
+
+def _cell_text(cell):
+    # Every paragraph of the cell, including those of nested tables
+    texts = (''.join(_read_paragraph(p).parts) for p in cell.iter(W + 'p'))
+    return ' '.join(text for text in texts if text)
+
+def _blocks(element):
+    # Paragraphs and tables, looking inside content controls
+    if element.tag in (W + 'p', W + 'tbl'):
+        yield element
+    elif element.tag in (W + 'sdt', W + 'customXml'):
+        content = element.find(W + 'sdtContent') if element.tag == W + 'sdt' else element
+        for child in content if content is not None else ():
+            yield from _blocks(child)
+
+def iter_docx_pages(file_path, progress=None, toc=None):
+    """Yields the text of a DOCX page by page, parsing word/document.xml once.
+
+    The XML is read incrementally from the zip and each top-level block is
+    discarded once handled, so memory use depends on the largest paragraph or
+    table rather than the document. Paragraphs become lines and each table
+    row a tab-separated line. Pages follow the page breaks saved by Word.
+    If toc is a list, heading entries are appended to it with the page index
+    and the offset of the heading in the text.
+    """
+    with zipfile.ZipFile(file_path) as archive:
+        levels = heading_levels(archive)
+        total_pages = page_count(archive)
+        with archive.open('word/document.xml') as xml:
+            lines = []
+            pages_done = 0
+            position = -1  # End of the text so far, in the '\n'-joined document
+            start_new_page = False
+            for element in iter_body_elements(xml):
+                for block in _blocks(element):
+                    if block.tag == W + 'tbl':
+                        for text in _row_texts(block):
+                            lines.append(text)
+                            position += 1 + len(text)
+                        continue
+                    paragraph = _read_paragraph(block)
+                    if (paragraph.break_before or start_new_page) and lines:
+                        pages_done += 1
+                        if progress:
+                            progress(pages_done, max(total_pages or 0, pages_done + 1))
+                        yield '\n'.join(lines)
+                        lines = []
+                    start_new_page = paragraph.break_after
+                    text = ''.join(paragraph.parts)
+                    style = block.find(f'{W}pPr/{W}pStyle')
+                    level = levels.get(style.get(W + 'val')) if style is not None else None
+                    if level is not None and toc is not None:
+                        toc.append({'title': text, 'level': level, 'page': pages_done, 'offset': position + 1})
+                    lines.append(text)
+                    position += 1 + len(text)
+            pages_done += 1
+            if progress:
+                progress(pages_done, pages_done)
+            yield '\n'.join(lines)
+
+def iter_body_elements(xml):
+    # Each complete child of w:body in order; it is discarded once the
+    # caller asks for the next one
+    depth = 0
+    body = None
+    for event, element in iterparse(xml, events=('start', 'end')):
+        if event == 'start':
+            depth += 1
+            if depth == 2 and element.tag == W + 'body':
+                body = element
+            continue
+        depth -= 1
+        if depth == 2 and body is not None:
+            yield element
+            body.clear()
+
+def _row_texts(table):
+    # Each table row becomes one tab-separated line
+    for row in table.findall(W + 'tr'):
+        yield '\t'.join(_cell_text(cell) for cell in row.findall(W + 'tc'))
+
+def body_lines(file_path):
+    # The lines of the text that each child of w:body produces, in order;
+    # empty for children without text such as w:sectPr
+    with zipfile.ZipFile(file_path) as archive, archive.open('word/document.xml') as xml:
+        result = []
+        for element in iter_body_elements(xml):
+            items = []
+            for block in _blocks(element):
+                if block.tag == W + 'tbl':
+                    items.extend(_row_texts(block))
+                else:
+                    items.append(''.join(_read_paragraph(block).parts))
+            result.append('\n'.join(items).split('\n') if items else [])
+        return result
+
+def _make_benchmark_document(file_path, pages):
+    from docx import Document
+    from docx.enum.text import WD_BREAK
+    doc = Document()
+    sentence = "The document reader streams paragraphs out of the zip without building a full object tree. "
+    for page in range(pages):
+        doc.add_heading(f"Section {page + 1}", 1 if page % 5 == 0 else 2)
+        for _ in range(12):
+            doc.add_paragraph(sentence * 3)
+        if page % 5 == 0:
+            table = doc.add_table(rows=4, cols=3)
+            for row in table.rows:
+                for cell in row.cells:
+                    cell.text = "cell text"
+        doc.add_paragraph().add_run().add_break(WD_BREAK.PAGE)
+    doc.save(file_path)
+
+def benchmark(file_path='benchmark.docx', pages=500):
+    from docx import Document
+    _make_benchmark_document(file_path, pages)
+
+    started = time.perf_counter()
+    # What reading a DOCX and its TOC used to cost: two full python-docx parses
+    doc = Document(file_path)
+    '\n'.join(paragraph.text for paragraph in doc.paragraphs)
+    doc = Document(file_path)
+    [paragraph.text for paragraph in doc.paragraphs if paragraph.style.name.startswith('Heading')]
+    python_docx = time.perf_counter() - started
+
+    started = time.perf_counter()
+    toc = []
+    page_texts = list(iter_docx_pages(file_path, toc=toc))
+    streaming = time.perf_counter() - started
+
+    print(f"{pages}-page document: {len(page_texts)} pages, {len(toc)} headings")
+    print(f"python-docx (text + TOC): {python_docx:.2f}s")
+    print(f"streaming single pass:    {streaming:.2f}s ({python_docx / streaming:.1f}x faster)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare streaming DOCX reading with python-docx.")
+    parser.add_argument('--pages', type=int, default=500, help="Pages in the generated document")
+    parser.add_argument('--output', default='benchmark.docx', help="Where to write the generated document")
+    args = parser.parse_args()
+    benchmark(args.output, args.pages)
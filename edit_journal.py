@@ -0,0 +1,385 @@
+import argparse
+import json
+import os
+import threading
+import time
+from incremental_save import atomic_path
+
+DEFAULT_JOURNAL_DIR = os.path.join(os.path.expanduser("~"), ".smart_documents_reader", "journal")
+# Appended edits are flushed to disk at most this often, so a crash loses at
+# most this much typing and a burst of keystrokes costs one fsync
+DEFAULT_SYNC_INTERVAL = 1.0
+# The journal is compacted once its edits outgrow both this and its base, so
+# rewriting the document is paid for by at least as many bytes of edits
+DEFAULT_COMPACT_BYTES = 1024 * 1024
+SUFFIX = ".journal"
+
+def _encode(record):
+    return json.dumps(record, ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b'\n'
+
+class EditJournal:
+    """Write-ahead log of the edits made in the editor since the last save.
+
+    A journal file starts with its base: either a file as it is on disk
+    (path, mtime and size) or a snapshot of the text. Each edit is then
+    appended as one JSON line, so writing it costs the size of the edit, not
+    of the document. Lines are written and fsynced by a background thread
+    every sync_interval seconds. Once the edits outgrow the base, compact()
+    replaces the journal with a snapshot of the text; after a save, rebase()
+    starts it over from the saved file. A journal that still holds edits
+    when the app exits or crashes is found by find_sessions() and replayed
+    by recover().
+    """
+
+    def __init__(self, directory=DEFAULT_JOURNAL_DIR, sync_interval=DEFAULT_SYNC_INTERVAL,
+                 compact_bytes=DEFAULT_COMPACT_BYTES, on_error=None):
+        self.directory = directory
+        self.sync_interval = sync_interval
+        self.compact_bytes = compact_bytes
+        self.on_error = on_error
+        self.path = None
+        self._file = None
+        self._records = []  # Encoded edits since the base
+        self._pending = []  # Encoded edits not written yet
+        self._base = None
+        self._base_bytes = 0
+        self._header_bytes = 0
+        self._edit_bytes = 0
+        # Bumped whenever the journal is rewritten, so a save can tell whether
+        # the edits it marked are still the ones in the journal
+        self._generation = 0
+        self._condition = threading.Condition()
+        self._io_lock = threading.Lock()
+        self._closed = False
+        self._counters = dict.fromkeys(('edits', 'bytes_written', 'syncs', 'compactions'), 0)
+        self._thread = threading.Thread(target=self._run, name="edit-journal", daemon=True)
+        self._thread.start()
+
+    @property
+    def active(self):
+        return self.path is not None
+
+    def start(self, file_path):
+        # A new journal whose base is file_path as it is on disk now
+        self.close()
+        self._rewrite(self._file_header(file_path), [])
+
+    def start_text(self, file_path, text):
+        # A new journal whose base is the text itself, for documents that
+        # differ from any file
+        self.close()
+        self._rewrite({'type': 'text', 'path': file_path, 'text': text}, [])
+
+    @staticmethod
+    def _file_header(file_path):
+        stat = os.stat(file_path)
+        return {'type': 'file', 'path': os.path.abspath(file_path),
+                'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+
+    def record(self, operation, start, text):
+        # Takes editor edit events: (operation, "line.column" start, text),
+        # with the column in Python characters. A Tk column is not one after a
+        # character outside the BMP, which Tcl 8.6 counts as two.
+        if self.path is None:
+            return
+        line, column = map(int, start.split('.'))
+        if operation == 'insert':
+            record = ['i', line - 1, column, text]
+        else:
+            record = ['d', line - 1, column, len(text), text.count('\n')]
+        data = _encode(record)
+        with self._condition:
+            self._records.append(data)
+            self._pending.append(data)
+            self._edit_bytes += len(data)
+            self._counters['edits'] += 1
+
+    def needs_compaction(self):
+        return self.path is not None and self._edit_bytes > max(self.compact_bytes, self._base_bytes)
+
+    def compact(self, text):
+        # text must be the document with every recorded edit applied
+        self._rewrite({'type': 'text', 'path': self._base.get('path'), 'text': text}, [])
+        self._counters['compactions'] += 1
+
+    def mark(self):
+        # Where the journal stands; pass it to rebase() once a save of the
+        # text as it is now has finished
+        with self._condition:
+            return self._generation, len(self._records)
+
+    def rebase(self, file_path, mark):
+        # The file now holds the text as it was at mark: keep only the edits
+        # made since. If the journal was compacted meanwhile it is left as it
+        # is, since it still replays to the right text.
+        generation, count = mark
+        if self.path is None or generation != self._generation:
+            return
+        self._rewrite(self._file_header(file_path), self._records[count:])
+
+    @property
+    def unsaved(self):
+        # Whether replaying the journal gives something the file does not have
+        return self.path is not None and (bool(self._records) or self._base['type'] == 'text')
+
+    def _rewrite(self, header, records):
+        with self._io_lock:
+            with self._condition:
+                records = list(records)
+                self._pending = []
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            path = self.path or os.path.join(self.directory, f"{os.getpid()}-{time.time_ns()}{SUFFIX}")
+            os.makedirs(self.directory, exist_ok=True)
+            data = _encode(header)
+            with atomic_path(path) as temp_path:
+                with open(temp_path, 'wb') as f:
+                    f.write(data)
+                    f.writelines(records)
+            self._file = open(path, 'ab')
+            with self._condition:
+                # Edits recorded while the file was written are still pending
+                self._records = records + self._pending
+                self._edit_bytes = sum(len(record) for record in self._records)
+                self._generation += 1
+            self.path = path
+            self._base = header
+            # Compacting a journal based on a file writes the whole text
+            self._base_bytes = header.get('size', len(data))
+            self._header_bytes = len(data)
+            self._counters['bytes_written'] += len(data) + sum(len(record) for record in records)
+            self._counters['syncs'] += 1
+
+    def flush(self):
+        # Writes and fsyncs the pending edits now
+        with self._io_lock:
+            with self._condition:
+                pending = self._pending
+                self._pending = []
+            if not pending or self._file is None:
+                return
+            data = b''.join(pending)
+            self._file.write(data)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._counters['bytes_written'] += len(data)
+            self._counters['syncs'] += 1
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if not self._closed:
+                    self._condition.wait(self.sync_interval)
+                if self._closed:
+                    return
+            try:
+                self.flush()
+            except Exception as error:
+                if self.on_error:
+                    self.on_error(error)
+
+    def close(self):
+        # Ends the current journal: it is kept if it holds unsaved edits, so
+        # they can be recovered later, and deleted otherwise
+        if self.path is None:
+            return
+        self.flush()
+        with self._io_lock:
+            keep = self.unsaved
+            self._file.close()
+            self._file = None
+            if not keep:
+                os.remove(self.path)
+            self.path = None
+            self._base = None
+            with self._condition:
+                self._records = []
+                self._pending = []
+                self._edit_bytes = 0
+                self._generation += 1
+
+    def shutdown(self):
+        self.close()
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+
+    def stats(self):
+        with self._condition:
+            return dict(self._counters, journal_bytes=self._header_bytes + self._edit_bytes)
+
+def _read_journal(journal_path):
+    # The header and the edits of a journal. A crash can leave the last line
+    # partly written; it and anything after it are ignored.
+    with open(journal_path, 'rb') as f:
+        lines = f.read().split(b'\n')
+    header = json.loads(lines[0])
+    records = []
+    for line in lines[1:]:
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            break
+    return header, records
+
+def _process_running(pid):
+    if pid == os.getpid():
+        return True
+    if os.name != 'posix':
+        return False  # Signal 0 would terminate the process on Windows
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def find_sessions(directory=DEFAULT_JOURNAL_DIR):
+    """Journals left with unsaved edits by an app that is no longer running.
+
+    Returns dicts with the journal path, the document path (None for an
+    untitled document), the number of edits and when it was last written,
+    newest first.
+    """
+    try:
+        names = [name for name in os.listdir(directory) if name.endswith(SUFFIX)]
+    except FileNotFoundError:
+        return []
+    sessions = []
+    for name in names:
+        pid = name.split('-', 1)[0]
+        if pid.isdigit() and _process_running(int(pid)):
+            continue
+        journal_path = os.path.join(directory, name)
+        try:
+            header, records = _read_journal(journal_path)
+            modified = os.path.getmtime(journal_path)
+        except (OSError, ValueError):
+            continue
+        sessions.append({'journal': journal_path, 'path': header.get('path'), 'edits': len(records),
+                         'modified': modified})
+    sessions.sort(key=lambda session: session['modified'], reverse=True)
+    return sessions
+
+def replay(text, records):
+    # Applies journal edits to text, working on its lines so that each edit
+    # only touches the lines it spans
+    lines = text.split('\n')
+    for record in records:
+        if record[0] == 'i':
+            _, line, column, inserted = record
+            current = lines[line]
+            lines[line:line + 1] = (current[:column] + inserted + current[column:]).split('\n')
+        else:
+            _, line, column, length, newlines = record
+            joined = '\n'.join(lines[line:line + newlines + 1])
+            lines[line:line + newlines + 1] = [joined[:column] + joined[column + length:]]
+    return '\n'.join(lines)
+
+def recover(journal_path, read=None):
+    """Replays a journal. Returns (document path, text, line count of the file).
+
+    The line count is that of the file the edits were made to, or None if the
+    journal starts from a snapshot. read(file_path) reads the base file; it
+    must give the text the editor showed. Raises ValueError if that file was
+    changed since.
+    """
+    header, records = _read_journal(journal_path)
+    file_path = header.get('path')
+    if header['type'] == 'text':
+        return file_path, replay(header['text'], records), None
+    try:
+        stat = os.stat(file_path)
+    except FileNotFoundError:
+        raise ValueError(f"{file_path} no longer exists")
+    if (stat.st_mtime_ns, stat.st_size) != (header['mtime_ns'], header['size']):
+        raise ValueError(f"{file_path} was changed after the unsaved edits were made")
+    if read is None:
+        from doc_reader import read_file as read
+    base = read(file_path)
+    return file_path, replay(base, records), base.count('\n') + 1
+
+def discard_session(journal_path):
+    try:
+        os.remove(journal_path)
+    except FileNotFoundError:
+        pass
+
+def check_replay(directory='check_journal'):
+    # Edits on a line with a character outside the BMP are replayed where
+    # they were made
+    import shutil
+    text = "Plain first line\nA \U0001F600 smile and more\nLast line"
+    lines = text.split('\n')
+    journal = EditJournal(directory)
+    journal.start_text(None, text)
+    # Insert after the emoji, at column 4 in Python characters
+    journal.record('insert', "2.4", "big ")
+    lines[1] = lines[1][:4] + "big " + lines[1][4:]
+    # Delete "smile" after it
+    column = lines[1].index("smile")
+    journal.record('delete', f"2.{column}", "smile")
+    lines[1] = lines[1][:column] + lines[1][column + 5:]
+    # Split the line after the emoji, then join it back with the next one
+    journal.record('insert', "2.3", "\n")
+    lines[1:2] = [lines[1][:3], lines[1][3:]]
+    journal.record('delete', f"3.{len(lines[2])}", "\n")
+    lines[2:4] = [lines[2] + lines[3]]
+    journal.flush()
+    expected = '\n'.join(lines)
+    _, recovered, _ = recover(journal.path)
+    journal.shutdown()
+    shutil.rmtree(directory)
+    assert recovered == expected, f"replayed {recovered!r}, expected {expected!r}"
+    print("Replay: edits after a character outside the BMP land where they were made")
+
+def benchmark(directory='benchmark_journal', size_mb=50, edits=20000, seconds=60.0):
+    # Edits spread over `seconds` of typing, journaled, against autosaving
+    # the whole document once per sync interval
+    import random
+    import shutil
+    os.makedirs(directory, exist_ok=True)
+    document = os.path.join(directory, 'document.txt')
+    line = "The journal only grows with what was typed, whatever the size of the document.\n"
+    with open(document, 'w', encoding='utf-8') as f:
+        f.write(line * (size_mb * 1024 * 1024 // len(line)))
+    with open(document, encoding='utf-8') as f:
+        text = f.read()
+    line_count = text.count('\n') + 1
+    journal = EditJournal(os.path.join(directory, 'journals'), compact_bytes=DEFAULT_COMPACT_BYTES)
+    journal.start(document)
+    random.seed(1)
+    started = time.perf_counter()
+    for number in range(edits):
+        position = f"{random.randrange(line_count - 1) + 1}.{random.randrange(10)}"
+        if number % 5:
+            journal.record('insert', position, random.choice("abcdefgh \n"))
+        else:
+            journal.record('delete', position, "x")
+    recorded = (time.perf_counter() - started) / edits
+    journal.flush()
+    stats = journal.stats()
+    journal.shutdown()
+    autosaves = seconds / DEFAULT_SYNC_INTERVAL
+    full_bytes = len(text.encode('utf-8')) * autosaves
+    print(f"{size_mb} MB document, {edits} edits: {recorded * 1e6:.1f} us per edit on the UI thread")
+    print(f"journal: {stats['bytes_written'] / 1024:.0f} KB written, "
+          f"{stats['journal_bytes'] / 1024:.0f} KB on disk, {stats['compactions']} compactions")
+    print(f"full autosave every {DEFAULT_SYNC_INTERVAL:.0f}s over {seconds:.0f}s: "
+          f"{full_bytes / 1024 / 1024:.0f} MB written ({full_bytes / stats['bytes_written']:.0f}x more)")
+    shutil.rmtree(directory)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure edit journaling against full autosaves.")
+    parser.add_argument('--size-mb', type=int, default=50, help="Size of the generated document")
+    parser.add_argument('--edits', type=int, default=20000, help="Edits to journal")
+    parser.add_argument('--output', default='benchmark_journal', help="Directory for the generated files")
+    parser.add_argument('--check', action='store_true', help="Check that journaled edits replay correctly instead")
+    args = parser.parse_args()
+    if args.check:
+        check_replay()
+    else:
+        benchmark(args.output, args.size_mb, args.edits)
@@ -0,0 +1,109 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".smart_documents_reader", "extraction_cache.sqlite3")
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024  # 512 MB of extracted text
+# Bumped when the stored data changes shape; older entries are dropped.
+# 2: PDF TOC entries hold page indexes and offsets instead of page references
+FORMAT_VERSION = 2
+
+def file_hash(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for block in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+class ExtractionCache:
+    """Persistent cache of extracted text, TOC and page offsets, keyed by file content hash.
+
+    A (path, mtime, size) table is checked first so unchanged files are not re-hashed.
+    Entries are evicted least-recently-used once the stored text exceeds max_bytes.
+    SQLite's locking makes it safe to share the cache between threads and processes.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER, content_hash TEXT)""")
+            conn.execute("""CREATE TABLE IF NOT EXISTS entries (
+                content_hash TEXT PRIMARY KEY, text TEXT, toc TEXT, page_offsets TEXT,
+                nbytes INTEGER, last_used REAL)""")
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+            if conn.execute("PRAGMA user_version").fetchone()[0] < FORMAT_VERSION:
+                conn.execute("DELETE FROM entries")
+                conn.execute("DELETE FROM files")
+                conn.execute(f"PRAGMA user_version = {FORMAT_VERSION}")
+
+    def _connect(self):
+        # One connection per thread, reused for every call. Worker processes
+        # forked after the first call open their own.
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=30)
+            self._local.pid = os.getpid()
+            conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _content_hash(self, conn, file_path):
+        stat = os.stat(file_path)
+        path = os.path.abspath(file_path)
+        row = conn.execute("SELECT mtime_ns, size, content_hash FROM files WHERE path = ?", (path,)).fetchone()
+        if row and row[0] == stat.st_mtime_ns and row[1] == stat.st_size:
+            return row[2]
+        content_hash = file_hash(file_path)
+        conn.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+                     (path, stat.st_mtime_ns, stat.st_size, content_hash))
+        return content_hash
+
+    def get(self, file_path):
+        with self._connect() as conn:
+            content_hash = self._content_hash(conn, file_path)
+            row = conn.execute("SELECT text, toc, page_offsets FROM entries WHERE content_hash = ?",
+                               (content_hash,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE entries SET last_used = ? WHERE content_hash = ?", (time.time(), content_hash))
+        return {'text': row[0], 'toc': json.loads(row[1]), 'page_offsets': json.loads(row[2])}
+
+    def get_toc(self, file_path):
+        # The TOC alone, without loading the text
+        with self._connect() as conn:
+            content_hash = self._content_hash(conn, file_path)
+            row = conn.execute("SELECT toc FROM entries WHERE content_hash = ?", (content_hash,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def put(self, file_path, text, toc, page_offsets):
+        toc_json = json.dumps(toc)
+        nbytes = len(text.encode('utf-8')) + len(toc_json)
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            content_hash = self._content_hash(conn, file_path)
+            conn.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+                         (content_hash, text, toc_json, json.dumps(page_offsets), nbytes, time.time()))
+            self._evict(conn)
+
+    def _evict(self, conn):
+        total = conn.execute("SELECT COALESCE(SUM(nbytes), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for content_hash, nbytes in conn.execute(
+                "SELECT content_hash, nbytes FROM entries ORDER BY last_used").fetchall():
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM entries WHERE content_hash = ?", (content_hash,))
+            conn.execute("DELETE FROM files WHERE content_hash = ?", (content_hash,))
+            total -= nbytes
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM entries")
+            conn.execute("DELETE FROM files")
@@ -0,0 +1,460 @@
+import copy
+import mmap
+import os
+import re
+import shutil
+import tempfile
+import zipfile
+from bisect import bisect_right
+from contextlib import contextmanager
+from xml.sax.saxutils import escape
+
+# Characters XML 1.0 does not allow; tabs and newlines never reach the XML
+_INVALID_XML_CHARS = {code: None for code in range(32) if code not in (9, 10, 13)}
+
+# Start or end tag, or empty-element tag. Declarations, comments and
+# processing instructions do not match because of the name.
+_TAG = re.compile(rb'<(/?)([A-Za-z_][\w.:-]*)[^>]*?(/?)>')
+_BODY = re.compile(rb'<([\w.-]+:)?body[\s>]')
+
+@contextmanager
+def atomic_path(file_path):
+    """Yields a temporary path next to file_path that replaces it on success.
+
+    The new file is flushed to disk before the rename, so a crash leaves
+    either the old file or the new one, never a partial write. It keeps the
+    permissions of the file it replaces.
+    """
+    directory = os.path.dirname(os.path.abspath(file_path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(file_path)}.", suffix=".tmp")
+    os.close(fd)
+    try:
+        yield temp_path
+        fd = os.open(temp_path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        if os.path.exists(file_path):
+            shutil.copymode(file_path, temp_path)
+        os.replace(temp_path, file_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+class EditTracker:
+    """The line ranges of a document changed since it was loaded or saved.
+
+    Each hunk is [start, end, original_start, original_end]: lines start to
+    end - 1 of the text now replace lines original_start to original_end - 1
+    of the file. Hunks are kept sorted and touching ones are merged, so there
+    is one per place edited. The file's size and mtime are kept to tell
+    whether it was changed by something else before a save.
+    """
+
+    def __init__(self, file_path, line_count):
+        self.file_path = os.path.abspath(file_path)
+        self.line_count = line_count
+        self.hunks = []
+        # The lines filling each hunk, once taken by snapshot()
+        self.hunk_lines = None
+        self.mark_saved()
+
+    def mark_saved(self):
+        try:
+            stat = os.stat(self.file_path)
+        except FileNotFoundError:
+            self.stat = None
+        else:
+            self.stat = (stat.st_mtime_ns, stat.st_size)
+
+    def applies_to(self, file_path):
+        # Whether the hunks describe changes to file_path as it is on disk
+        if os.path.abspath(file_path) != self.file_path or self.stat is None:
+            return False
+        try:
+            stat = os.stat(file_path)
+        except FileNotFoundError:
+            return False
+        return (stat.st_mtime_ns, stat.st_size) == self.stat
+
+    def edit(self, operation, start, text):
+        # An editor edit listener: start is the Tk "line.column" index
+        line = int(start.split(".")[0]) - 1
+        newlines = text.count("\n")
+        if operation == 'insert':
+            self.replace_lines(line, 1, newlines + 1)
+        else:
+            self.replace_lines(line, newlines + 1, 1)
+
+    def replace_lines(self, start, removed, added):
+        # Lines start to start + removed - 1 became `added` lines
+        end = start + removed
+        before, merged, after = [], [], []
+        delta = 0  # Lines gained by the hunks before start
+        for hunk in self.hunks:
+            if hunk[1] < start:
+                before.append(hunk)
+                delta += (hunk[1] - hunk[0]) - (hunk[3] - hunk[2])
+            elif hunk[0] > end:
+                after.append(hunk)
+            else:
+                merged.append(hunk)
+        first = min([start] + [hunk[0] for hunk in merged])
+        last = max([end] + [hunk[1] for hunk in merged])
+        merged_delta = sum((hunk[1] - hunk[0]) - (hunk[3] - hunk[2]) for hunk in merged)
+        shift = added - removed
+        for hunk in after:
+            hunk[0] += shift
+            hunk[1] += shift
+        self.hunks = before + [[first, last + shift, first - delta, last - delta - merged_delta]] + after
+
+    def new_line_count(self):
+        return self.line_count + sum((hunk[1] - hunk[0]) - (hunk[3] - hunk[2]) for hunk in self.hunks)
+
+    def snapshot(self, get_lines):
+        # A copy to save from another thread, holding the current lines of
+        # each hunk as returned by get_lines(first, last). Reading only those
+        # from the editor keeps the cost of a save down to the edits.
+        changes = copy.copy(self)
+        changes.hunks = [list(hunk) for hunk in self.hunks]
+        changes.hunk_lines = [get_lines(hunk[0], hunk[1]) for hunk in self.hunks]
+        return changes
+
+    def lines_for(self, content):
+        # The lines of each hunk, from the snapshot or else from the full text
+        if self.hunk_lines is not None:
+            return self.hunk_lines
+        lines = content.split('\n')
+        return [lines[hunk[0]:hunk[1]] for hunk in self.hunks]
+
+def _applies(changes, file_path, content):
+    # Whether applying changes to file_path as it is on disk gives content
+    return (changes is not None and changes.applies_to(file_path)
+            and content.count('\n') + 1 == changes.new_line_count())
+
+def save_text_incremental(file_path, content, changes):
+    """Writes only what changed since the file was read.
+
+    Returns 'unchanged', 'appended' when the edits only added to the end
+    (written in place), 'patched' when the file was rebuilt from the original
+    bytes of unchanged lines and the new edited lines, or None if changes
+    does not describe the file on disk and it has to be written in full.
+    Unchanged lines keep their bytes, including line endings and anything
+    that was not valid UTF-8.
+    """
+    from large_text import LargeTextFile
+    if not _applies(changes, file_path, content):
+        return None
+    if not changes.hunks:
+        return 'unchanged'
+    hunk_lines = changes.lines_for(content)
+    hunks = changes.hunks
+    if len(hunks) == 1 and hunks[0][2] == changes.line_count - 1:
+        # Typing at the end of the file only needs the new text appended
+        kept, newline = _last_line(file_path)
+        added = '\n'.join(hunk_lines[0])
+        if added.startswith(kept):
+            with open(file_path, 'ab') as file:
+                file.write(added[len(kept):].replace('\n', newline.decode()).encode('utf-8'))
+                file.flush()
+                os.fsync(file.fileno())
+            return 'appended'
+
+    with LargeTextFile(file_path) as original:
+        if original.line_count != changes.line_count:
+            return None
+        newline = original.newline
+        with atomic_path(file_path) as temp_path:
+            with open(temp_path, 'wb') as file:
+                copied = 0
+                for (start, end, original_start, original_end), lines in zip(hunks, hunk_lines):
+                    original.copy_lines(copied, original_start, file)
+                    text = '\n'.join(lines)
+                    if original_end < original.line_count:
+                        text += '\n'
+                    file.write(text.replace('\n', newline.decode()).encode('utf-8'))
+                    copied = original_end
+                original.copy_lines(copied, original.line_count, file)
+            # Some systems cannot replace a file that is still open
+            original.close()
+    return 'patched'
+
+def _last_line(file_path):
+    # The text of the file's last line and the line ending it uses, read
+    # from the end of the file
+    with open(file_path, 'rb') as file:
+        size = os.fstat(file.fileno()).st_size
+        if not size:
+            return '', b'\n'
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            end = data.rfind(b'\n')
+            newline = b'\r\n' if end > 0 and data[end - 1] == 13 else b'\n'
+            return data[end + 1:].decode('utf-8', 'replace'), newline
+
+def _children(xml, start, end):
+    # (name, start, end) of each element directly inside xml[start:end]
+    children = []
+    depth = 0
+    child_start = name = None
+    for match in _TAG.finditer(xml, start, end):
+        closing, tag, empty = match.groups()
+        if closing:
+            depth -= 1
+            if depth == 0:
+                children.append((name, child_start, match.end()))
+        elif empty:
+            if depth == 0:
+                children.append((tag, match.start(), match.end()))
+        else:
+            if depth == 0:
+                child_start, name = match.start(), tag
+            depth += 1
+    return children
+
+def _local(name):
+    return name.rpartition(b':')[2]
+
+def _content(xml, element):
+    # Start and end of what is between an element's start and end tags
+    name, start, end = element
+    open_tag = _TAG.match(xml, start)
+    if open_tag.group(3):
+        return end, end
+    return open_tag.end(), end - len(name) - 3
+
+def _find(xml, start, end, name):
+    # The first element with that name in xml[start:end], at any depth
+    for match in _TAG.finditer(xml, start, end):
+        if not match.group(1) and match.group(2) == name:
+            if match.group(3):
+                return name, match.start(), match.end()
+            depth = 0
+            for inner in _TAG.finditer(xml, match.start(), end):
+                if inner.group(3) or inner.group(2) != name:
+                    continue
+                depth += -1 if inner.group(1) else 1
+                if depth == 0:
+                    return name, match.start(), inner.end()
+            return None
+    return None
+
+class _ParagraphTemplate:
+    # The formatting an edited paragraph keeps: its start tag, its paragraph
+    # properties and the properties of its first run
+    def __init__(self, prefix, xml=None, paragraph=None):
+        self.prefix = prefix
+        self.open_tag = b'<' + prefix + b'p>'
+        self.properties = b''
+        self.run_properties = b''
+        if paragraph is None:
+            return
+        open_tag = _TAG.match(xml, paragraph[1]).group(0)
+        self.open_tag = open_tag[:-2].rstrip() + b'>' if open_tag.endswith(b'/>') else open_tag
+        start, end = _content(xml, paragraph)
+        for child in _children(xml, start, end):
+            if _local(child[0]) == b'pPr':
+                self.properties = xml[child[1]:child[2]]
+                start = child[2]
+                break
+        run = _find(xml, start, end, prefix + b'r')
+        if run is not None:
+            for child in _children(xml, *_content(xml, run)):
+                if _local(child[0]) == b'rPr':
+                    self.run_properties = xml[child[1]:child[2]]
+                    break
+
+    def build(self, lines, keep_open_tag=True):
+        # One paragraph holding the lines, separated by line breaks
+        w = self.prefix
+        parts = []
+        for i, line in enumerate(lines):
+            if i:
+                parts.append(b'<' + w + b'br/>')
+            for j, piece in enumerate(line.split('\t')):
+                if j:
+                    parts.append(b'<' + w + b'tab/>')
+                if piece:
+                    text = escape(piece.translate(_INVALID_XML_CHARS)).encode('utf-8')
+                    parts.append(b'<' + w + b't xml:space="preserve">' + text + b'</' + w + b't>')
+        run = b'<' + w + b'r>' + self.run_properties + b''.join(parts) + b'</' + w + b'r>' if parts else b''
+        # Paragraph ids must stay unique, so only the first copy keeps the start tag
+        open_tag = self.open_tag if keep_open_tag else b'<' + w + b'p>'
+        return open_tag + self.properties + run + b'</' + w + b'p>'
+
+    def build_each(self, lines, keep_open_tag=True):
+        # One paragraph per line
+        return b''.join(self.build([line], keep_open_tag and i == 0) for i, line in enumerate(lines))
+
+def _template_for(xml, prefix, block):
+    # The block itself if it is a paragraph, otherwise its first paragraph
+    paragraph = block if _local(block[0]) == b'p' else _find(xml, block[1], block[2], prefix + b'p')
+    return _ParagraphTemplate(prefix, xml, paragraph)
+
+def _rebuild_table(xml, prefix, table, old_lines, new_lines):
+    # Edits to a table that keep its shape only replace the edited cells
+    rows = [row for row in _children(xml, *_content(xml, table)) if _local(row[0]) == b'tr']
+    if len(rows) != len(old_lines) or len(rows) != len(new_lines):
+        return None
+    edits = []
+    for row, old_line, new_line in zip(rows, old_lines, new_lines):
+        if old_line == new_line:
+            continue
+        cells = [cell for cell in _children(xml, *_content(xml, row)) if _local(cell[0]) == b'tc']
+        old_texts, new_texts = old_line.split('\t'), new_line.split('\t')
+        if not len(cells) == len(old_texts) == len(new_texts):
+            return None
+        for cell, old_text, new_text in zip(cells, old_texts, new_texts):
+            if old_text == new_text:
+                continue
+            start, end = _content(xml, cell)
+            children = _children(xml, start, end)
+            properties = [child for child in children if _local(child[0]) == b'tcPr']
+            keep_from = properties[0][2] if properties else start
+            paragraph = _ParagraphTemplate(prefix, xml, _find(xml, start, end, prefix + b'p')).build([new_text])
+            edits.append((keep_from, end, paragraph))
+    return _splice(xml, table[1], table[2], edits)
+
+def _splice(xml, start, end, edits):
+    parts = []
+    position = start
+    for edit_start, edit_end, data in edits:
+        parts.append(xml[position:edit_start])
+        parts.append(data)
+        position = edit_end
+    parts.append(xml[position:end])
+    return b''.join(parts)
+
+def _rebuild_blocks(xml, prefix, blocks, block_lines, new_lines):
+    # New XML for consecutive body children whose lines are now new_lines.
+    # Lines are matched up with a diff, so unchanged children are copied
+    # as they are and edited paragraphs keep their formatting.
+    from diff_engine import opcodes
+    old_lines = []
+    owners = []
+    for index, lines in enumerate(block_lines):
+        old_lines.extend(lines)
+        owners.extend([index] * len(lines))
+    content = [[] for _ in blocks]
+    inserted_after = [[] for _ in blocks]
+    inserted_before = []
+    changed = [False] * len(blocks)
+    for tag, i1, i2, j1, j2 in opcodes(old_lines, new_lines):
+        if tag == 'insert':
+            if 0 < i1 < len(old_lines) and owners[i1 - 1] == owners[i1]:
+                # Between two lines of the same child, such as a paragraph with line breaks
+                content[owners[i1]].extend(new_lines[j1:j2])
+                changed[owners[i1]] = True
+            elif i1 == 0:
+                inserted_before.extend(new_lines[j1:j2])
+            else:
+                inserted_after[owners[i1 - 1]].extend(new_lines[j1:j2])
+            continue
+        for i in range(i1, i2):
+            changed[owners[i]] |= tag != 'equal'
+        # Replaced lines go to the children they replace, in order; any
+        # extra ones go to the last of them
+        for k in range(j2 - j1):
+            content[owners[i1 + min(k, i2 - i1 - 1)]].append(new_lines[j1 + k])
+
+    parts = []
+    if inserted_before:
+        parts.append(_template_for(xml, prefix, blocks[0]).build_each(inserted_before, keep_open_tag=False))
+    for block, lines, new, is_changed, after in zip(blocks, block_lines, content, changed, inserted_after):
+        kind = _local(block[0])
+        if not is_changed:
+            parts.append(xml[block[1]:block[2]])
+        elif not new:
+            pass  # All its lines were deleted
+        elif kind == b'p':
+            template = _ParagraphTemplate(prefix, xml, block)
+            # A paragraph that had line breaks keeps them
+            parts.append(template.build(new) if len(lines) > 1 else template.build_each(new))
+        else:
+            table = _rebuild_table(xml, prefix, block, lines, new) if kind == b'tbl' else None
+            parts.append(table if table is not None else _template_for(xml, prefix, block).build_each(new))
+        if after:
+            parts.append(_template_for(xml, prefix, block).build_each(after, keep_open_tag=False))
+    return b''.join(parts)
+
+def patch_docx_xml(xml, body_lines, hunks, hunk_lines):
+    """Returns document.xml with only the body children covering the hunks rewritten.
+
+    body_lines holds the lines of text each child of w:body produced when the
+    document was read (see docx_stream.body_lines), hunk_lines the lines that
+    now fill each hunk. Returns None if the XML does not match body_lines.
+    """
+    body = _BODY.search(xml)
+    if body is None:
+        return None
+    prefix = body.group(1) or b''
+    body_end = xml.rfind(b'</' + prefix + b'body>')
+    blocks = _children(xml, body.end(), body_end)
+    if len(blocks) != len(body_lines):
+        return None
+    # First line of each child; children without text share the next one's
+    first_lines = []
+    old_lines = []
+    for block_lines in body_lines:
+        first_lines.append(len(old_lines))
+        old_lines.extend(block_lines)
+
+    # Widen each hunk to whole children and merge those that then overlap
+    groups = []
+    for (_, _, original_start, original_end), lines in zip(hunks, hunk_lines):
+        first = bisect_right(first_lines, original_start) - 1
+        while not body_lines[first]:
+            first -= 1
+        last = bisect_right(first_lines, original_end - 1) - 1
+        if groups and first <= groups[-1][1]:
+            groups[-1][1] = max(groups[-1][1], last)
+            groups[-1][2].append((original_start, original_end, lines))
+        else:
+            groups.append([first, last, [(original_start, original_end, lines)]])
+
+    edits = []
+    for first, last, group_hunks in groups:
+        # The group's lines now: unchanged lines around and between its hunks
+        new_lines = []
+        position = first_lines[first]
+        for original_start, original_end, lines in group_hunks:
+            new_lines.extend(old_lines[position:original_start])
+            new_lines.extend(lines)
+            position = original_end
+        new_lines.extend(old_lines[position:first_lines[last] + len(body_lines[last])])
+        data = _rebuild_blocks(xml, prefix, blocks[first:last + 1], body_lines[first:last + 1], new_lines)
+        edits.append((blocks[first][1], blocks[last][2], data))
+    return _splice(xml, 0, len(xml), edits)
+
+def save_docx_incremental(file_path, content, changes):
+    """Patches word/document.xml in place for the edited paragraphs.
+
+    Untouched paragraphs, tables, sections and every other part of the
+    package are kept byte for byte (the zip itself is rewritten). Returns
+    'unchanged', 'patched', or None if the document has to be saved in full.
+    """
+    from docx_stream import body_lines
+    if not _applies(changes, file_path, content):
+        return None
+    if not changes.hunks:
+        return 'unchanged'
+    old_lines = body_lines(file_path)
+    if sum(len(block_lines) for block_lines in old_lines) != changes.line_count:
+        return None
+    with zipfile.ZipFile(file_path) as archive:
+        xml = patch_docx_xml(archive.read('word/document.xml'), old_lines, changes.hunks,
+                             changes.lines_for(content))
+        if xml is None:
+            return None
+        with atomic_path(file_path) as temp_path:
+            with zipfile.ZipFile(temp_path, 'w') as output:
+                for info in archive.infolist():
+                    if info.filename == 'word/document.xml':
+                        output.writestr(info, xml)
+                        continue
+                    with archive.open(info) as source, output.open(info, 'w') as target:
+                        shutil.copyfileobj(source, target, 1024 * 1024)
+            # Some systems cannot replace a file that is still open
+            archive.close()
+    return 'patched'
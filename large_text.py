@@ -0,0 +1,199 @@
+import argparse
+import codecs
+import mmap
+import os
+import time
+from array import array
+from bisect import bisect_left
+
+# Text files at least this big are opened with LargeTextFile instead of
+# being read into one string
+LARGE_FILE_BYTES = 64 * 1024 * 1024
+# One line count is kept per block, so the index of a multi-GB file is a few
+# hundred KB; finding a line scans at most one block
+BLOCK_SIZE = 64 * 1024
+# How much of the mapping is scanned before its pages are given back
+SCAN_SIZE = 16 * 1024 * 1024
+COPY_SIZE = 1024 * 1024
+DEFAULT_ERRORS = 'replace'
+
+def is_large_file(file_path):
+    return os.path.getsize(file_path) >= LARGE_FILE_BYTES
+
+class LargeTextFile:
+    """A text file read through mmap, line range by line range.
+
+    Opening it scans the file once and records how many lines start before
+    each BLOCK_SIZE block. lines() then decodes only the bytes of the lines
+    asked for, so memory use does not depend on the file size. Lines are
+    split on '\\n' as in str.split('\\n'), with '\\r\\n' read as '\\n'. The
+    encoding must be ASCII compatible; undecodable bytes are handled by the
+    errors policy ('replace', 'strict', 'ignore', 'backslashreplace'...).
+    progress(bytes_done, total_bytes) is called during the scan.
+    """
+
+    def __init__(self, file_path, encoding='utf-8', errors=DEFAULT_ERRORS, progress=None):
+        name = codecs.lookup(encoding).name
+        if name.startswith(('utf-16', 'utf-32')):
+            raise ValueError(f"Large files must use an ASCII-compatible encoding, not {encoding}")
+        codecs.lookup_error(errors)  # Fails early on an unknown policy
+        self.file_path = file_path
+        self.encoding = encoding
+        self.errors = errors
+        self._file = open(file_path, 'rb')
+        self.size = os.fstat(self._file.fileno()).st_size
+        # An empty file cannot be mapped
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else b''
+        try:
+            self._build_index(progress)
+        except BaseException:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        self._file.close()
+
+    def _build_index(self, progress):
+        # block_lines[b] is the number of newlines before block b
+        self.block_lines = array('q')
+        data = self._map
+        if hasattr(data, 'madvise'):
+            data.madvise(mmap.MADV_SEQUENTIAL)
+        release = hasattr(data, 'madvise') and hasattr(mmap, 'MADV_DONTNEED')
+        newlines = 0
+        released = 0
+        for start in range(0, self.size, BLOCK_SIZE):
+            self.block_lines.append(newlines)
+            newlines += data[start:start + BLOCK_SIZE].count(b'\n')
+            end = min(start + BLOCK_SIZE, self.size)
+            if end - released >= SCAN_SIZE or end == self.size:
+                # The scanned pages are not needed any more; dropping them
+                # keeps the resident size flat on multi-GB files
+                if release:
+                    data.madvise(mmap.MADV_DONTNEED, released, end - released)
+                released = end - end % mmap.PAGESIZE
+                if progress:
+                    progress(end, self.size)
+        self.newline_count = newlines
+        if hasattr(data, 'madvise'):
+            data.madvise(mmap.MADV_RANDOM)
+
+    @property
+    def line_count(self):
+        return self.newline_count + 1
+
+    def line_offset(self, line):
+        # Byte offset where a line (counted from 0) starts
+        if line <= 0:
+            return 0
+        if line > self.newline_count:
+            return self.size
+        # The last block with fewer than `line` newlines before it holds the
+        # newline that ends line - 1
+        block = bisect_left(self.block_lines, line) - 1
+        position = block * BLOCK_SIZE - 1
+        for _ in range(line - self.block_lines[block]):
+            position = self._map.find(b'\n', position + 1)
+        return position + 1
+
+    def lines(self, first, last):
+        # Lines first..last - 1 joined with '\n', like '\n'.join(text.split('\n')[first:last])
+        first = max(first, 0)
+        last = min(last, self.line_count)
+        if first >= last:
+            return ''
+        start = self.line_offset(first)
+        end = self.line_offset(last) - 1 if last < self.line_count else self.size
+        if end < self.size and end > start and self._map[end - 1] == 13:
+            end -= 1  # The '\r' of a '\r\n' ending the range
+        text = self._map[start:end].decode(self.encoding, self.errors)
+        return text.replace('\r\n', '\n')
+
+    @property
+    def newline(self):
+        # The line ending the file uses, judging by its first line
+        end = self._map.find(b'\n')
+        return b'\r\n' if end > 0 and self._map[end - 1] == 13 else b'\n'
+
+    def copy_lines(self, first, last, file):
+        # Writes the raw bytes of lines first..last - 1, line endings included
+        start, end = self.line_offset(first), self.line_offset(last)
+        if hasattr(os, 'copy_file_range'):
+            # Copied by the kernel without passing through Python
+            file.flush()
+            try:
+                while start < end:
+                    copied = os.copy_file_range(self._file.fileno(), file.fileno(), end - start, start)
+                    if not copied:
+                        break
+                    start += copied
+            except OSError:
+                # Not supported between these files (EXDEV, EINVAL, ENOSYS,
+                # EOPNOTSUPP...): what is left is copied from the map below
+                pass
+            # The kernel moved the descriptor, not the file object
+            file.seek(0, os.SEEK_END)
+        for position in range(start, end, COPY_SIZE):
+            file.write(self._map[position:min(position + COPY_SIZE, end)])
+
+    def iter_text(self, chunk_size=1 << 20):
+        # The whole text in chunks, decoded incrementally so a character split
+        # between chunks is decoded once both halves are read
+        decoder = codecs.getincrementaldecoder(self.encoding)(self.errors)
+        carry = ''
+        for start in range(0, self.size, chunk_size):
+            chunk = carry + decoder.decode(self._map[start:start + chunk_size])
+            # Keep a trailing '\r' back in case the next chunk starts with '\n'
+            carry = '\r' if chunk.endswith('\r') else ''
+            yield chunk[:-1].replace('\r\n', '\n') if carry else chunk.replace('\r\n', '\n')
+        yield carry + decoder.decode(b'', final=True)
+
+def read_text(file_path, encoding='utf-8', errors=DEFAULT_ERRORS):
+    # Like reading the whole file in text mode, with the errors policy
+    with LargeTextFile(file_path, encoding, errors) as text_file:
+        return ''.join(text_file.iter_text())
+
+def _make_benchmark_file(file_path, size_mb):
+    line = "2024-01-01 12:00:00 INFO request handled in 12 ms by worker 7 \xe9t\xe9\n".encode('utf-8')
+    block = line * 10000 + b"\xff invalid byte in this line\n"
+    with open(file_path, 'wb') as f:
+        for _ in range(size_mb * 1024 * 1024 // len(block) + 1):
+            f.write(block)
+
+def benchmark(file_path='benchmark_large.txt', size_mb=1024):
+    import random
+    import resource
+    _make_benchmark_file(file_path, size_mb)
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    started = time.perf_counter()
+    with LargeTextFile(file_path) as text_file:
+        indexed = time.perf_counter() - started
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        lookups = 1000
+        started = time.perf_counter()
+        for _ in range(lookups):
+            first = random.randrange(text_file.line_count)
+            text_file.lines(first, first + 200)
+        lookup = (time.perf_counter() - started) / lookups
+        print(f"{size_mb} MB, {text_file.line_count} lines: indexed in {indexed:.2f}s "
+              f"({size_mb / indexed:.0f} MB/s), index {len(text_file.block_lines) * 8 / 1024:.0f} KB")
+        print(f"peak RSS while opening {peak:.0f} MB ({peak - rss_before:.0f} MB above the start)")
+        # Pages read by lookups stay mapped, but they are file cache the
+        # kernel can drop at any time
+        print(f"200-line range: {lookup * 1000:.2f} ms on average")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure memory-mapped reading of a large text file.")
+    parser.add_argument('--size-mb', type=int, default=1024, help="Size of the generated file")
+    parser.add_argument('--output', default='benchmark_large.txt', help="Where to write the generated file")
+    args = parser.parse_args()
+    benchmark(args.output, args.size_mb)
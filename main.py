@@ -1,11 +1,40 @@
+import time
+STARTUP_BEGIN = time.perf_counter()
+
+import argparse
+import sys
 from tkinterdnd2 import TkinterDnD
-from project_gui import DocxReaderGUI
+from project_gui import DocxReaderGUI, benchmark_highlighting
 
-def run_application():
+def run_application(startup_budget=None):
     root = TkinterDnD.Tk()
     app = DocxReaderGUI(root)
     root.geometry("800x600")  # Set initial window size
+    result = {}
+    if startup_budget is not None:
+        # The first idle callback runs once the window is drawn and accepting input
+        root.after_idle(lambda: check_startup_time(root, startup_budget, result))
     root.mainloop()
+    return result.get('within_budget', True)
+
+def check_startup_time(root, startup_budget, result):
+    elapsed = time.perf_counter() - STARTUP_BEGIN
+    result['within_budget'] = elapsed <= startup_budget
+    print(f"Window interactive after {elapsed:.3f}s (budget {startup_budget:.3f}s)")
+    root.quit()
 
 if __name__ == "__main__":
-    run_application()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Document Reader")
+    parser.add_argument('--startup-budget', type=float, default=None,
+                        help="Measure the time until the window is interactive, then exit; "
+                             "fails if it exceeds this many seconds. Combine with 'python -X importtime' "
+                             "to see which imports dominate.")
+    parser.add_argument('--benchmark-highlighting', type=int, default=None, metavar='LINES',
+                        help="Compare viewport and full-document syntax highlighting on a generated "
+                             "Python file of this many lines, then exit")
+    args = parser.parse_args()
+    if args.benchmark_highlighting:
+        benchmark_highlighting(args.benchmark_highlighting)
+        sys.exit(0)
+    if not run_application(args.startup_budget):
+        sys.exit(1)
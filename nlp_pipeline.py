@@ -0,0 +1,202 @@
+import argparse
+import random
+import sys
+import time
+from functools import cached_property, lru_cache
+from nltk.tokenize import sent_tokenize, word_tokenize
+from nltk.corpus import stopwords
+from nltk.probability import FreqDist
+from textstat import syllable_count
+import numpy as np
+from nltk_resources import ensure_nltk_resources
+
+PUNCTUATION = '!"#$%&\'()*+,-./:;<=>?@[\\]^_`{|}~'
+
+@lru_cache(maxsize=1)
+def get_stop_words():
+    # Built once per process instead of on every call
+    return frozenset(stopwords.words('english'))
+
+@lru_cache(maxsize=1)
+def get_summary_stop_words():
+    return get_stop_words() | frozenset(PUNCTUATION)
+
+@lru_cache(maxsize=4096)
+def cached_syllable_count(word):
+    return syllable_count(word)
+
+def score_sentences(sentences):
+    # Tokenize every sentence once and map each token to an integer id. The
+    # (sentence_ids, token_ids) pairs form a sparse sentence-term count matrix.
+    tokenized = [sentence.lower().split() for sentence in sentences]
+    words = [word for sentence_words in tokenized for word in sentence_words]
+    vocabulary = {word: i for i, word in enumerate(dict.fromkeys(words))}
+    token_ids = np.fromiter(map(vocabulary.__getitem__, words), dtype=np.int64, count=len(words))
+    sentence_ids = np.repeat(np.arange(len(sentences)), [len(sentence_words) for sentence_words in tokenized])
+
+    # Stop words and punctuation get a frequency of zero, so they add nothing
+    stop_words = get_summary_stop_words()
+    is_stop_word = np.fromiter((word in stop_words for word in vocabulary), dtype=bool, count=len(vocabulary))
+
+    # Word frequencies are the column sums of the matrix, and the sentence
+    # scores are the matrix-vector product with the frequency vector
+    freq = np.bincount(token_ids, minlength=len(vocabulary))
+    freq[is_stop_word] = 0
+    return np.bincount(sentence_ids, weights=freq[token_ids], minlength=len(sentences))
+
+def top_sentence_indices(scores, num_sentences):
+    # Sentences without any scoring word are never picked
+    candidates = np.flatnonzero(scores > 0)
+    if len(candidates) > num_sentences:
+        top = np.argpartition(-scores[candidates], num_sentences - 1)[:num_sentences]
+        cutoff = scores[candidates][top].min()
+        # Keep every candidate tied with the cutoff so ties resolve by position below
+        candidates = candidates[scores[candidates] >= cutoff]
+    # Highest score first, earlier sentences first on ties
+    order = np.lexsort((candidates, -scores[candidates]))
+    return candidates[order][:num_sentences]
+
+class DocumentAnalysis:
+    """Summary, bullet points, keywords and readability for one text.
+
+    The text is sentence-split and tokenized once. The sentences, tokens and
+    frequency distributions are memoized and shared by all the analyses.
+    """
+
+    def __init__(self, text):
+        ensure_nltk_resources()
+        self.text = text
+
+    @cached_property
+    def sentences(self):
+        return sent_tokenize(self.text)
+
+    @cached_property
+    def sentence_scores(self):
+        return score_sentences(self.sentences)
+
+    @cached_property
+    def word_tokens(self):
+        # Lowercased word tokens, reusing the sentence split
+        return [token for sentence in self.sentences for token in word_tokenize(sentence.lower(), preserve_line=True)]
+
+    @cached_property
+    def words(self):
+        return [token for token in self.word_tokens if token.isalnum()]
+
+    @cached_property
+    def keyword_freq(self):
+        stop_words = get_stop_words()
+        return FreqDist(word for word in self.words if word not in stop_words)
+
+    def summary_sentences(self, num_sentences=5):
+        if num_sentences <= 0 or not self.sentences:
+            return []
+        return [self.sentences[i] for i in top_sentence_indices(self.sentence_scores, num_sentences)]
+
+    def summary(self, num_sentences=5):
+        return ' '.join(self.summary_sentences(num_sentences))
+
+    def bullet_points(self, num_points=5):
+        return '\n'.join([f"• {sentence}" for sentence in self.summary_sentences(num_points)])
+
+    def keywords(self, num_keywords=10):
+        return self.keyword_freq.most_common(num_keywords)
+
+    def readability(self):
+        # Flesch reading ease from the shared sentence and word counts
+        if not self.words:
+            return 0.0
+        syllables = sum(cached_syllable_count(word) for word in self.words)
+        words_per_sentence = len(self.words) / len(self.sentences)
+        syllables_per_word = syllables / len(self.words)
+        return round(206.835 - 1.015 * words_per_sentence - 84.6 * syllables_per_word, 2)
+
+@lru_cache(maxsize=4)
+def analyze(text):
+    # Running several analyses on the same text reuses one DocumentAnalysis
+    return DocumentAnalysis(text)
+
+def _reference_summary(text, num_sentences=5):
+    # summarize_text before scoring was vectorized, kept to check the output
+    from heapq import nlargest
+    sentences = sent_tokenize(text)
+    stop_words = get_summary_stop_words()
+    words = [word.lower() for sentence in sentences for word in sentence.split() if word.lower() not in stop_words]
+    freq = FreqDist(words)
+    sentence_scores = {}
+    for sentence in sentences:
+        for word in sentence.split():
+            if word.lower() in freq:
+                sentence_scores[sentence] = sentence_scores.get(sentence, 0) + freq[word.lower()]
+    return ' '.join(nlargest(num_sentences, sentence_scores, key=sentence_scores.get))
+
+def _reference_keywords(text, num_keywords=10):
+    # extract_keywords before the shared pipeline
+    stop_words = get_stop_words()
+    filtered_words = [word for word in word_tokenize(text.lower()) if word.isalnum() and word not in stop_words]
+    return FreqDist(filtered_words).most_common(num_keywords)
+
+def make_corpus(documents=50, sentences=400, seed=5):
+    # Fixed pseudo-random documents. Sentences are unique within a document,
+    # since the reference summary merges the scores of identical sentences.
+    rng = random.Random(seed)
+    vocabulary = [f"{rng.choice('bcdfgklmnprstvz')}{rng.choice('aeiou')}{rng.choice('lmnrst')}{i}" for i in range(2000)]
+    vocabulary += ['the', 'of', 'and', 'a', 'to', 'in', 'is', 'it', 'that', 'with']
+    weights = [1.0 / (rank + 1) for rank in range(len(vocabulary))]
+    corpus = []
+    for number in range(documents):
+        lines = []
+        for index in range(sentences):
+            words = rng.choices(vocabulary, weights, k=rng.randrange(6, 30))
+            lines.append(f"{' '.join(words).capitalize()} number {number} {index}{rng.choice('.!?')}")
+        corpus.append(' '.join(lines))
+    return corpus
+
+def benchmark(documents=50, sentences=400, num_sentences=5, num_keywords=10):
+    """Checks summary and keywords against the previous implementations on a
+    fixed corpus, and times the summaries both ways.
+    """
+    ensure_nltk_resources()
+    corpus = make_corpus(documents, sentences)
+    mismatches = 0
+    reference_time = pipeline_time = 0.0
+    for text in corpus:
+        started = time.perf_counter()
+        expected = (_reference_summary(text, num_sentences), _reference_keywords(text, num_keywords))
+        reference_time += time.perf_counter() - started
+        analyze.cache_clear()
+        started = time.perf_counter()
+        analysis = analyze(text)
+        actual = (analysis.summary(num_sentences), analysis.keywords(num_keywords))
+        pipeline_time += time.perf_counter() - started
+        if actual != expected:
+            mismatches += 1
+    # Scoring alone, on the sentences both versions split out the same way
+    sentences_list = [sent_tokenize(text) for text in corpus]
+    started = time.perf_counter()
+    for split in sentences_list:
+        stop_words = get_summary_stop_words()
+        freq = FreqDist(word.lower() for sentence in split for word in sentence.split() if word.lower() not in stop_words)
+        [sum(freq[word.lower()] for word in sentence.split()) for sentence in split]
+    loop_scoring = time.perf_counter() - started
+    started = time.perf_counter()
+    for split in sentences_list:
+        score_sentences(split)
+    vectorized_scoring = time.perf_counter() - started
+
+    print(f"{documents} documents of {sentences} sentences: {documents - mismatches} identical, {mismatches} different")
+    print(f"summary + keywords: previous {reference_time:.2f}s, pipeline {pipeline_time:.2f}s "
+          f"({reference_time / pipeline_time:.1f}x)")
+    print(f"sentence scoring only: loop {loop_scoring:.3f}s, vectorized {vectorized_scoring:.3f}s "
+          f"({loop_scoring / vectorized_scoring:.1f}x)")
+    return mismatches == 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the summary and keywords against the previous "
+                                                 "implementations and compare their speed.")
+    parser.add_argument('--documents', type=int, default=50, help="Documents in the generated corpus")
+    parser.add_argument('--sentences', type=int, default=400, help="Sentences per document")
+    args = parser.parse_args()
+    if not benchmark(args.documents, args.sentences):
+        sys.exit(1)
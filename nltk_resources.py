@@ -0,0 +1,61 @@
+import os
+import sys
+from functools import lru_cache
+
+# Resources shipped with the app (populated by running this module) are
+# searched before the user's and system NLTK data directories
+BUNDLED_NLTK_DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "nltk_data")
+
+# Resource name -> data paths that satisfy it. Newer NLTK releases load the
+# sentence tokenizer from punkt_tab, older ones from punkt.
+REQUIRED_RESOURCES = {
+    'punkt_tab': ('tokenizers/punkt_tab', 'tokenizers/punkt'),
+    'stopwords': ('corpora/stopwords',),
+}
+
+def offline_mode():
+    return os.environ.get('SMART_DOCS_OFFLINE', '').lower() in ('1', 'true', 'yes')
+
+def missing_resources():
+    import nltk
+    if BUNDLED_NLTK_DATA not in nltk.data.path:
+        nltk.data.path.insert(0, BUNDLED_NLTK_DATA)
+    missing = []
+    for name, paths in REQUIRED_RESOURCES.items():
+        for path in paths:
+            try:
+                nltk.data.find(path)
+                break
+            except LookupError:
+                pass
+        else:
+            missing.append(name)
+    return missing
+
+@lru_cache(maxsize=1)
+def ensure_nltk_resources():
+    # Checked once per process, the first time text is analysed. Nothing is
+    # downloaded when the resources are already present or in offline mode.
+    missing = missing_resources()
+    if missing and not offline_mode():
+        import nltk
+        for name in missing:
+            nltk.download(name, quiet=True)
+        missing = missing_resources()
+    if missing:
+        raise LookupError(f"Missing NLTK resources: {', '.join(missing)}. "
+                          f"Run 'python nltk_resources.py' while online to bundle them.")
+
+def bundle_resources(download_dir=BUNDLED_NLTK_DATA):
+    import nltk
+    # punkt is fetched as well so the bundle also works with older NLTK releases
+    for name in list(REQUIRED_RESOURCES) + ['punkt']:
+        nltk.download(name, download_dir=download_dir)
+
+if __name__ == "__main__":
+    download_dir = sys.argv[1] if len(sys.argv) > 1 else BUNDLED_NLTK_DATA
+    bundle_resources(download_dir)
+    import nltk
+    nltk.data.path.insert(0, download_dir)
+    missing = missing_resources()
+    print("All NLTK resources present." if not missing else f"Still missing: {', '.join(missing)}")
@@ -0,0 +1,192 @@
+class TextOperation:
+    """A change to a text as a sequence of retain, insert and delete components.
+
+    Components are stored compactly, as in ot.js: a positive int retains that
+    many characters, a string is inserted, and a negative int deletes that
+    many characters. An operation covers the whole text it applies to
+    (base_length) and produces a text of target_length characters, so its size
+    depends on the edit, not on the document.
+    """
+
+    def __init__(self, ops=None):
+        self.ops = []
+        self.base_length = 0
+        self.target_length = 0
+        for op in ops or ():
+            if isinstance(op, str):
+                self.insert(op)
+            elif op > 0:
+                self.retain(op)
+            elif op < 0:
+                self.delete(-op)
+
+    @classmethod
+    def from_edit(cls, length, offset, inserted='', deleted=0):
+        # An insertion and/or deletion at offset in a text of length characters
+        return cls().retain(offset).delete(deleted).insert(inserted).retain(length - offset - deleted)
+
+    def retain(self, n):
+        if n <= 0:
+            return self
+        self.base_length += n
+        self.target_length += n
+        if self.ops and isinstance(self.ops[-1], int) and self.ops[-1] > 0:
+            self.ops[-1] += n
+        else:
+            self.ops.append(n)
+        return self
+
+    def insert(self, text):
+        if not text:
+            return self
+        self.target_length += len(text)
+        ops = self.ops
+        if ops and isinstance(ops[-1], str):
+            ops[-1] += text
+        elif ops and isinstance(ops[-1], int) and ops[-1] < 0:
+            # Inserts go before deletes at the same position, so equal
+            # operations always have the same components
+            if len(ops) > 1 and isinstance(ops[-2], str):
+                ops[-2] += text
+            else:
+                ops.insert(len(ops) - 1, text)
+        else:
+            ops.append(text)
+        return self
+
+    def delete(self, n):
+        if n <= 0:
+            return self
+        self.base_length += n
+        if self.ops and isinstance(self.ops[-1], int) and self.ops[-1] < 0:
+            self.ops[-1] -= n
+        else:
+            self.ops.append(-n)
+        return self
+
+    def is_noop(self):
+        return len(self.ops) == 0 or (len(self.ops) == 1 and isinstance(self.ops[0], int) and self.ops[0] > 0)
+
+    def __eq__(self, other):
+        return isinstance(other, TextOperation) and self.ops == other.ops
+
+    def __repr__(self):
+        return f"TextOperation({self.ops!r})"
+
+    def to_json(self):
+        return list(self.ops)
+
+    @classmethod
+    def from_json(cls, ops):
+        return cls(ops)
+
+    def apply(self, text):
+        if len(text) != self.base_length:
+            raise ValueError(f"Operation expects a text of {self.base_length} characters, got {len(text)}")
+        parts = []
+        pos = 0
+        for op in self.ops:
+            if isinstance(op, str):
+                parts.append(op)
+            elif op > 0:
+                parts.append(text[pos:pos + op])
+                pos += op
+            else:
+                pos -= op
+        return ''.join(parts)
+
+    def compose(self, other):
+        # One operation with the effect of applying self and then other
+        if self.target_length != other.base_length:
+            raise ValueError("The base length of the second operation must be the target length of the first")
+        result = TextOperation()
+        ops1 = iter(self.ops)
+        ops2 = iter(other.ops)
+        op1 = next(ops1, None)
+        op2 = next(ops2, None)
+        while op1 is not None or op2 is not None:
+            if isinstance(op1, int) and op1 < 0:
+                result.delete(-op1)
+                op1 = next(ops1, None)
+                continue
+            if isinstance(op2, str):
+                result.insert(op2)
+                op2 = next(ops2, None)
+                continue
+            if op1 is None or op2 is None:
+                raise ValueError("Operations cannot be composed")
+            if isinstance(op1, int):
+                # op1 retains
+                if op2 > 0:
+                    n = min(op1, op2)
+                    result.retain(n)
+                    op1, op2 = _rest(op1, n, ops1), _rest(op2, n, ops2)
+                else:
+                    n = min(op1, -op2)
+                    result.delete(n)
+                    op1, op2 = _rest(op1, n, ops1), _rest(op2, n, ops2)
+            else:
+                # op1 inserts
+                if op2 > 0:
+                    n = min(len(op1), op2)
+                    result.insert(op1[:n])
+                    op1, op2 = _rest(op1, n, ops1), _rest(op2, n, ops2)
+                else:
+                    # Inserted and then deleted: nothing is left of it
+                    n = min(len(op1), -op2)
+                    op1, op2 = _rest(op1, n, ops1), _rest(op2, n, ops2)
+        return result
+
+    @staticmethod
+    def transform(a, b):
+        # For concurrent a and b on the same text, returns (a', b') such that
+        # applying a then b' gives the same text as b then a'. When both insert
+        # at the same position, a's text goes first.
+        if a.base_length != b.base_length:
+            raise ValueError("Both operations must apply to the same text")
+        a_prime = TextOperation()
+        b_prime = TextOperation()
+        ops1 = iter(a.ops)
+        ops2 = iter(b.ops)
+        op1 = next(ops1, None)
+        op2 = next(ops2, None)
+        while op1 is not None or op2 is not None:
+            if isinstance(op1, str):
+                a_prime.insert(op1)
+                b_prime.retain(len(op1))
+                op1 = next(ops1, None)
+                continue
+            if isinstance(op2, str):
+                a_prime.retain(len(op2))
+                b_prime.insert(op2)
+                op2 = next(ops2, None)
+                continue
+            if op1 is None or op2 is None:
+                raise ValueError("Operations cannot be transformed")
+            if op1 > 0 and op2 > 0:
+                n = min(op1, op2)
+                a_prime.retain(n)
+                b_prime.retain(n)
+                op1, op2 = _rest(op1, n, ops1), _rest(op2, n, ops2)
+            elif op1 < 0 and op2 < 0:
+                # Both deleted the same characters
+                n = min(-op1, -op2)
+                op1, op2 = _rest(op1, n, ops1), _rest(op2, n, ops2)
+            elif op1 < 0:
+                n = min(-op1, op2)
+                a_prime.delete(n)
+                op1, op2 = _rest(op1, n, ops1), _rest(op2, n, ops2)
+            else:
+                n = min(op1, -op2)
+                b_prime.delete(n)
+                op1, op2 = _rest(op1, n, ops1), _rest(op2, n, ops2)
+        return a_prime, b_prime
+
+def _rest(op, n, ops):
+    # What is left of a component after n characters of it were used, or the
+    # next component once it is used up
+    if isinstance(op, str):
+        return op[n:] if n < len(op) else next(ops, None)
+    if op > 0:
+        return op - n if n < op else next(ops, None)
+    return op + n if n < -op else next(ops, None)
@@ -0,0 +1,85 @@
+class PdfDocument:
+    """An open PDF shared by text and outline extraction.
+
+    The file is opened and its cross-reference table parsed once. Page text
+    is extracted when first asked for and kept, and outline destinations are
+    resolved to page indexes through a page reference -> index map built on
+    first use. Use it as a context manager, or call close().
+    """
+
+    def __init__(self, file_path):
+        import PyPDF2
+        self.file_path = file_path
+        self._file = open(file_path, 'rb')
+        try:
+            self.reader = PyPDF2.PdfReader(self._file)
+        except Exception:
+            self._file.close()
+            raise
+        self._texts = {}
+        self._page_indexes = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._file.close()
+
+    @property
+    def page_count(self):
+        return len(self.reader.pages)
+
+    def page_text(self, index):
+        text = self._texts.get(index)
+        if text is None:
+            text = self._texts[index] = self.reader.pages[index].extract_text()
+        return text
+
+    def iter_pages(self, progress=None):
+        # Reading every page in order keeps only the current one, unless it
+        # was already extracted, so streaming a large PDF stays flat in memory
+        total_pages = self.page_count
+        for index in range(total_pages):
+            text = self._texts.get(index)
+            if text is None:
+                text = self.reader.pages[index].extract_text()
+            if progress:
+                progress(index + 1, total_pages)
+            yield text
+
+    @property
+    def page_indexes(self):
+        # (object number, generation) of each page object -> page index
+        if self._page_indexes is None:
+            self._page_indexes = {}
+            for index, page in enumerate(self.reader.pages):
+                reference = getattr(page, 'indirect_reference', None) or getattr(page, 'indirect_ref', None)
+                if reference is not None:
+                    self._page_indexes[(reference.idnum, reference.generation)] = index
+        return self._page_indexes
+
+    def page_index(self, destination):
+        # Page index of an outline destination's page, or None if it has none
+        if hasattr(destination, 'idnum'):
+            return self.page_indexes.get((destination.idnum, destination.generation))
+        if isinstance(destination, int) and 0 <= destination < self.page_count:
+            return int(destination)  # Some writers store the page number itself
+        return None
+
+    def toc(self):
+        # Outline entries with the page index each one points to
+        if '/Outlines' not in self.reader.trailer['/Root']:
+            return []
+        return self._outline_entries(self.reader.outline, 1)
+
+    def _outline_entries(self, outline, level):
+        toc = []
+        for item in outline:
+            if isinstance(item, list):
+                toc.extend(self._outline_entries(item, level + 1))
+            else:
+                toc.append({'title': item.title, 'level': level, 'page': self.page_index(item.page)})
+        return toc
@@ -0,0 +1,201 @@
+import argparse
+import time
+import zlib
+from functools import lru_cache
+
+# Same layout as the original drawString export: US Letter, 50pt margins,
+# Helvetica 12 with 15pt between lines
+PAGE_WIDTH = 612
+PAGE_HEIGHT = 792
+MARGIN = 50
+FONT_NAME = 'Helvetica'
+FONT_SIZE = 12
+LEADING = 15
+TAB_SIZE = 4
+CHUNK_SIZE = 1 << 20
+
+@lru_cache(maxsize=None)
+def char_width(char, font_name=FONT_NAME, font_size=FONT_SIZE):
+    from reportlab.pdfbase.pdfmetrics import stringWidth
+    return stringWidth(char, font_name, font_size)
+
+@lru_cache(maxsize=65536)
+def word_width(word, font_name=FONT_NAME, font_size=FONT_SIZE):
+    # Words repeat a lot in real text, so their widths are cached too
+    return sum(char_width(char, font_name, font_size) for char in word)
+
+# Control characters are shown as spaces
+_CONTROL_CHARS = {code: ' ' for code in range(32)}
+
+def to_pdf_text(line):
+    # Standard PDF fonts cover WinAnsi (cp1252) only; anything else becomes '?'
+    line = line.expandtabs(TAB_SIZE).translate(_CONTROL_CHARS)
+    return line.encode('cp1252', 'replace').decode('cp1252')
+
+def iter_chunks(text, chunk_size=CHUNK_SIZE):
+    for start in range(0, len(text), chunk_size):
+        yield text[start:start + chunk_size]
+
+def iter_lines(chunks):
+    # Lines from an iterable of text chunks, without joining the chunks
+    partial = ''
+    for chunk in chunks:
+        lines = (partial + chunk).split('\n')
+        partial = lines.pop()
+        yield from lines
+    yield partial
+
+def wrap_line(line, max_width, font_name=FONT_NAME, font_size=FONT_SIZE):
+    # Greedy word wrap; a word wider than the line is broken between characters
+    if not line:
+        return ['']
+    wrapped = []
+    current = ''
+    current_width = 0.0
+    for word in line.split(' '):
+        width = word_width(word, font_name, font_size)
+        space_width = char_width(' ', font_name, font_size) if current else 0.0
+        if current_width + space_width + width <= max_width:
+            current = f"{current} {word}" if current else word
+            current_width += space_width + width
+            continue
+        if current:
+            wrapped.append(current)
+            current = ''
+            current_width = 0.0
+        for char in word:
+            width = char_width(char, font_name, font_size)
+            if current and current_width + width > max_width:
+                wrapped.append(current)
+                current = ''
+                current_width = 0.0
+            current += char
+            current_width += width
+    wrapped.append(current)
+    return wrapped
+
+def _escape(line):
+    return line.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)').encode('cp1252')
+
+class StreamingPdfWriter:
+    """Writes a text-only PDF one page at a time.
+
+    Each page's content stream is compressed and written as soon as the page
+    is full, so memory use does not grow with the document; only the file
+    offsets of the objects are kept for the cross-reference table.
+    """
+
+    CATALOG_ID = 1
+    PAGES_ID = 2
+    FONT_ID = 3
+
+    def __init__(self, file, font_name=FONT_NAME, font_size=FONT_SIZE, leading=LEADING):
+        self.file = file
+        self.font_name = font_name
+        self.font_size = font_size
+        self.leading = leading
+        self.lines_per_page = int((PAGE_HEIGHT - 2 * MARGIN) // leading) + 1
+        self.offsets = {}
+        self.page_ids = []
+        self.position = 0
+        self._next_id = self.FONT_ID + 1
+        self._write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        self._object(self.CATALOG_ID, b"<< /Type /Catalog /Pages 2 0 R >>")
+        self._object(self.FONT_ID, f"<< /Type /Font /Subtype /Type1 /BaseFont /{font_name} "
+                                   f"/Encoding /WinAnsiEncoding >>".encode('ascii'))
+
+    def _write(self, data):
+        self.file.write(data)
+        self.position += len(data)
+
+    def _object(self, object_id, body):
+        self.offsets[object_id] = self.position
+        self._write(f"{object_id} 0 obj\n".encode('ascii') + body + b"\nendobj\n")
+
+    def _allocate(self):
+        object_id = self._next_id
+        self._next_id += 1
+        return object_id
+
+    def write_page(self, lines):
+        top = PAGE_HEIGHT - MARGIN
+        parts = [f"BT /F1 {self.font_size} Tf {self.leading} TL {MARGIN} {top + self.leading} Td\n".encode('ascii')]
+        for line in lines:
+            parts.append(b"(" + _escape(line) + b") '\n")
+        parts.append(b"ET")
+        stream = zlib.compress(b''.join(parts))
+        content_id = self._allocate()
+        self._object(content_id, f"<< /Length {len(stream)} /Filter /FlateDecode >>\nstream\n".encode('ascii')
+                     + stream + b"\nendstream")
+        page_id = self._allocate()
+        self._object(page_id, (f"<< /Type /Page /Parent {self.PAGES_ID} 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] "
+                               f"/Resources << /Font << /F1 {self.FONT_ID} 0 R >> >> /Contents {content_id} 0 R >>")
+                     .encode('ascii'))
+        self.page_ids.append(page_id)
+
+    def close(self):
+        if not self.page_ids:
+            self.write_page([])
+        kids = ' '.join(f"{page_id} 0 R" for page_id in self.page_ids)
+        self._object(self.PAGES_ID, f"<< /Type /Pages /Kids [{kids}] /Count {len(self.page_ids)} >>".encode('ascii'))
+        xref_position = self.position
+        size = self._next_id
+        entries = [b"xref\n", f"0 {size}\n".encode('ascii'), b"0000000000 65535 f \n"]
+        entries.extend(f"{self.offsets[object_id]:010d} 00000 n \n".encode('ascii') for object_id in range(1, size))
+        entries.append(f"trailer\n<< /Size {size} /Root {self.CATALOG_ID} 0 R >>\n"
+                       f"startxref\n{xref_position}\n%%EOF\n".encode('ascii'))
+        self._write(b''.join(entries))
+
+def export_text_to_pdf(file_path, chunks, total_chars=None, progress=None):
+    # chunks is an iterable of text. progress(pages, chars_done, total_chars)
+    # is called after every page; total_chars may be None if unknown.
+    max_width = PAGE_WIDTH - 2 * MARGIN
+    chars_done = 0
+
+    def counted(chunks):
+        nonlocal chars_done
+        for chunk in chunks:
+            yield chunk
+            chars_done += len(chunk)
+
+    with open(file_path, 'wb') as f:
+        writer = StreamingPdfWriter(f)
+        page = []
+        for line in iter_lines(counted(chunks)):
+            for wrapped in wrap_line(to_pdf_text(line), max_width):
+                page.append(wrapped)
+                if len(page) == writer.lines_per_page:
+                    writer.write_page(page)
+                    page = []
+                    if progress:
+                        progress(len(writer.page_ids), chars_done, total_chars)
+        if page:
+            writer.write_page(page)
+        writer.close()
+        if progress:
+            progress(len(writer.page_ids), chars_done, total_chars)
+        return len(writer.page_ids)
+
+def benchmark(size_mb=100, output='benchmark_export.pdf'):
+    import resource
+    line = "The quick brown fox jumps over the lazy dog while the document reader exports a long line. " * 2
+    target = size_mb * 1024 * 1024
+
+    def chunks():
+        block = (line + '\n') * 1000
+        for _ in range(target // len(block) + 1):
+            yield block
+
+    started = time.perf_counter()
+    pages = export_text_to_pdf(output, chunks())
+    elapsed = time.perf_counter() - started
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"{size_mb} MB of text -> {pages} pages in {elapsed:.2f}s "
+          f"({pages / elapsed:.0f} pages/s, {size_mb / elapsed:.1f} MB/s), peak RSS {peak_mb:.0f} MB")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure streaming PDF export throughput.")
+    parser.add_argument('--size-mb', type=int, default=100, help="Amount of text to export")
+    parser.add_argument('--output', default='benchmark_export.pdf', help="Where to write the PDF")
+    args = parser.parse_args()
+    benchmark(args.size_mb, args.output)
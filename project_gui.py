@@ -1,21 +1,63 @@
 import tkinter as tk
 from tkinter import filedialog, scrolledtext, messagebox, font, ttk
 from tkinter.colorchooser import askcolor
-from doc_reader import read_file, save_file, export_to_pdf, export_to_html
+from doc_reader import read_file, save_file, export_to_pdf, export_to_html, extract_toc
+from edit_journal import EditJournal, find_sessions, recover, discard_session
+from extraction_cache import ExtractionCache
+from incremental_save import EditTracker
+from large_text import LargeTextFile, is_large_file
+from tasks import TaskRunner
+from text_find import TextBuffer, FindResults, compile_pattern
+import atexit
 import json
 import os
+import time
+import warnings
+from contextlib import contextmanager
 from themes import light_theme, dark_theme
-import openai
-from config import OPENAI_API_KEY
-from openai import OpenAI
-from pygments import lex
-from pygments.lexers import get_lexer_for_filename, guess_lexer, get_lexer_by_name
-from pygments.token import Token
-from pygments.util import ClassNotFound
 from tkinterdnd2 import DND_FILES, TkinterDnD
 from tkinter import PanedWindow
 
+_state_stack_readable = None
+
+def _read_state_stack(tokens):
+    # RegexLexer keeps its state stack in a local variable of the running
+    # token generator; pygments has no public way to get it
+    frame = getattr(tokens, "gi_frame", None)
+    return frame.f_locals.get("statestack") if frame is not None else None
+
+def _can_read_state_stack():
+    # Checked once, on a string that must leave the lexer inside a state
+    global _state_stack_readable
+    if _state_stack_readable is None:
+        from pygments.lexers import PythonLexer
+        tokens = PythonLexer().get_tokens_unprocessed('x = """\ninside\n')
+        stack = None
+        for index, token_type, value in tokens:
+            if index > 4:
+                # Past the opening quotes, whose state is pushed after they are yielded
+                stack = _read_state_stack(tokens)
+                break
+        _state_stack_readable = bool(stack) and len(stack) > 1
+        if not _state_stack_readable:
+            warnings.warn("Cannot read the pygments lexer state: syntax highlighting restarts in the "
+                          "initial state at every block, so multi-line strings and comments may be "
+                          "highlighted wrongly", RuntimeWarning)
+    return _state_stack_readable
+
 class SyntaxHighlightingText(tk.Text):
+    # Only the lines around the viewport are lexed and tagged. Highlighting is
+    # done in blocks of CHECKPOINT_LINES lines, and the lexer state at the start
+    # of each block is cached so a block can be lexed on its own.
+    CHECKPOINT_LINES = 100
+    VIEW_MARGIN_LINES = 50
+    # When the view jumps further than this many blocks past the last cached
+    # checkpoint, lexing restarts there in the lexer's initial state. The
+    # checkpoints that follow are guesses until a real state reaches them.
+    MAX_CATCHUP_BLOCKS = 20
+    # Whether Tcl counts a character outside the BMP as two, set on first use
+    _wide_chars_doubled = None
+
     def __init__(self, *args, **kwargs):
         tk.Text.__init__(self, *args, **kwargs)
         self.configure(font=("Courier", 10))
@@ -26,30 +68,349 @@ class SyntaxHighlightingText(tk.Text):
         self.tag_configure("Token.Comment", foreground="#919191", font=("Courier", 10, "italic"))
         self.tag_configure("Token.Operator", foreground="#687687")
         self.tag_configure("Token.Number", foreground="#FF00FF")
+        self._token_tags = {}
+        self._lexer = None
+        self._checkpoints = {}
+        self._guessed_checkpoints = set()
+        self._highlighted_blocks = set()
+        self._view_job = None
+        self.highlight_stats = {'tokens': 0, 'seconds': 0.0}
 
-    def highlight(self, content, lexer=None):
-        self.delete(1.0, tk.END)
-        if lexer:
-            formatter = get_formatter_by_name('text', style='default')
-            highlighted = highlight(content, lexer, formatter)
-            self.insert(tk.END, highlighted)
-            for token, value in lexer.get_tokens(content):
-                start = f"1.0 + {len(self.get('1.0', 'end')[:self.search(value, '1.0', 'end')])} chars"
-                end = f"{start} + {len(value)} chars"
-                self.tag_add(str(token), start, end)
+        # Edits made by the user notify these callbacks with
+        # (operation, start index, text), after the change is applied
+        self.edit_listeners = []
+        self._suppress_edit_events = 0
+
+        # Route the widget's Tcl command through _dispatch, so edits and
+        # scrolling are seen even when they come from Tk's own key bindings
+        self._original_command = self._w + "_original"
+        self.tk.call("rename", self._w, self._original_command)
+        self.tk.createcommand(self._w, self._dispatch)
+        self.bind("<Configure>", lambda event: self._schedule_view_update(), add="+")
+
+    def _dispatch(self, command, *args):
+        if command in ("insert", "delete", "replace") and not self._suppress_edit_events and self._is_editable():
+            result = getattr(self, "_dispatch_" + command)(*args)
         else:
+            result = self.tk.call((self._original_command, command) + args)
+        if command in ("insert", "delete", "replace", "yview", "see"):
+            self._schedule_view_update()
+        return result
+
+    def _is_editable(self):
+        return str(self.tk.call(self._original_command, "cget", "-state")) == tk.NORMAL
+
+    def _dispatch_insert(self, index, *args):
+        start = str(self.tk.call(self._original_command, "index", index))
+        if self.tk.call(self._original_command, "compare", start, "==", "end"):
+            start = str(self.tk.call(self._original_command, "index", "end-1c"))
+        result = self.tk.call((self._original_command, "insert", index) + args)
+        self._notify_edit("insert", start, "".join(args[0::2]))
+        return result
+
+    def _dispatch_delete(self, index1, index2=None, *args):
+        if args:
+            # Several ranges: delete them back to front so earlier indices stay valid
+            ranges = [(index1, index2)] + list(zip(args[0::2], args[1::2]))
+            for range_start, range_end in reversed(ranges):
+                self._dispatch_delete(range_start, range_end)
+            return ""
+        original = self._original_command
+        start = str(self.tk.call(original, "index", index1))
+        end = str(self.tk.call(original, "index", index2 if index2 is not None else f"{start}+1c"))
+        if self.tk.call(original, "compare", end, ">", "end-1c"):
+            end = str(self.tk.call(original, "index", "end-1c"))
+        if not self.tk.call(original, "compare", start, "<", end):
+            return ""
+        text = str(self.tk.call(original, "get", start, end))
+        result = self.tk.call(original, "delete", start, end)
+        self._notify_edit("delete", start, text)
+        return result
+
+    def _dispatch_replace(self, index1, index2, *args):
+        start = str(self.tk.call(self._original_command, "index", index1))
+        self._dispatch_delete(start, index2)
+        return self._dispatch_insert(start, *args)
+
+    def _notify_edit(self, operation, start, text):
+        self._invalidate_highlighting(int(start.split(".")[0]))
+        for listener in self.edit_listeners:
+            listener(operation, start, text)
+
+    def tk_length(self, text):
+        # The length of text in Tk index characters. Tcl 8.6 counts a character
+        # outside the BMP (an emoji, for example) as two, Python as one.
+        if SyntaxHighlightingText._wide_chars_doubled is None:
+            SyntaxHighlightingText._wide_chars_doubled = int(self.tk.call("string", "length", "\U0001F600")) == 2
+        if SyntaxHighlightingText._wide_chars_doubled:
+            return len(text.encode("utf-16-le")) // 2
+        return len(text)
+
+    @contextmanager
+    def without_edit_events(self):
+        # For programmatic changes such as loading a document
+        self._suppress_edit_events += 1
+        try:
+            yield
+        finally:
+            self._suppress_edit_events -= 1
+
+    def highlight(self, content, lexer=None):
+        self._lexer = None
+        with self.without_edit_events():
+            self.delete(1.0, tk.END)
             self.insert(tk.END, content)
+        self._checkpoints = {}
+        self._guessed_checkpoints = set()
+        self._highlighted_blocks = set()
+        self.highlight_stats = {'tokens': 0, 'seconds': 0.0}
+        self._lexer = lexer
+        self._schedule_view_update()
+
+    def _schedule_view_update(self):
+        if self._view_job is None:
+            self._view_job = self.after_idle(self._update_view)
+
+    def _update_view(self):
+        self._view_job = None
+        if self._lexer is not None:
+            first_line = int(self.index("@0,0").split(".")[0])
+            last_line = int(self.index(f"@0,{self.winfo_height()}").split(".")[0])
+            line_count = int(self.index("end-1c").split(".")[0])
+            first_block = max(first_line - self.VIEW_MARGIN_LINES - 1, 0) // self.CHECKPOINT_LINES
+            last_block = (min(last_line + self.VIEW_MARGIN_LINES, line_count) - 1) // self.CHECKPOINT_LINES
+            for block in range(first_block, last_block + 1):
+                if block not in self._highlighted_blocks:
+                    self._catch_up(block)
+                    self._highlight_block(block)
+        self.event_generate("<<ViewChanged>>")
+
+    def _catch_up(self, block):
+        # Lex forward from the nearest cached checkpoint so that the block
+        # starts in the correct lexer state
+        known = block
+        while known > 0 and not self._has_real_checkpoint(known) and block - known < self.MAX_CATCHUP_BLOCKS:
+            known -= 1
+        if known == 0 or self._has_real_checkpoint(known):
+            for previous in range(known, block):
+                self._highlight_block(previous)
+
+    def _has_real_checkpoint(self, block):
+        return block in self._checkpoints and block not in self._guessed_checkpoints
+
+    def _highlight_block(self, block):
+        # Tagging a block from a real state can correct the guessed checkpoint
+        # of the next one, which is then tagged again if it already was
+        while self._tag_block(block):
+            block += 1
+
+    def _set_checkpoint(self, block, checkpoint, guessed):
+        # Returns whether block was tagged from a guess that is now replaced
+        if not guessed:
+            replaced = block in self._guessed_checkpoints
+            self._guessed_checkpoints.discard(block)
+            self._checkpoints[block] = checkpoint
+            return replaced and block in self._highlighted_blocks
+        if block not in self._checkpoints or block in self._guessed_checkpoints:
+            self._guessed_checkpoints.add(block)
+            self._checkpoints[block] = checkpoint
+        return False
+
+    def _tag_block(self, block):
+        started = time.perf_counter()
+        first_line = block * self.CHECKPOINT_LINES + 1
+        next_block_line = first_line + self.CHECKPOINT_LINES
+        guessed = block > 0 and not self._has_real_checkpoint(block)
+        if guessed:
+            # Remembered as a guess, so the block is tagged again once a real
+            # state reaches it
+            self._set_checkpoint(block, self._checkpoints.get(block, (0, None)), True)
+        # A checkpoint holds the lexer state and how far into the block the
+        # first token starts; anything before that belongs to a token that
+        # spans the boundary and was tagged with the previous block
+        skip, state = self._checkpoints.get(block, (0, None))
+        start = self.index(f"{first_line}.0 + {skip} chars")
+        if self.compare(start, ">=", f"{next_block_line}.0"):
+            # The spanning token covers this whole block as well
+            block_length = len(self.get(f"{first_line}.0", f"{next_block_line}.0"))
+            retag = self._set_checkpoint(block + 1, (skip - block_length, state), guessed)
+            self._highlighted_blocks.add(block)
+            return retag
+        text = self.get(start, f"{next_block_line}.0")
+        boundary = len(text)
+        # Lexing continues into the next block until a token starts there,
+        # which gives the lexer state for the next checkpoint
+        text += self.get(f"{next_block_line}.0", f"{next_block_line + self.CHECKPOINT_LINES}.0")
+
+        for tag in self._token_tags.values():
+            if tag:
+                self.tag_remove(tag, start, f"{next_block_line}.0")
+
+        # Token offsets are turned into line.column indices with a running line
+        # counter, and all ranges for one tag are added with a single tag_add call
+        tokens = self._lex(text, state)
+        ranges = {}
+        count = 0
+        retag = False
+        line, column = map(int, start.split("."))
+        line_start = -column
+        for index, token_type, value in tokens:
+            if index >= boundary:
+                retag = self._set_checkpoint(block + 1, (index - boundary, self._lexer_state(tokens)), guessed)
+                break
+            tag = self._tag_for(token_type)
+            token_start = f"{line}.{index - line_start}"
+            newlines = value.count("\n")
+            if newlines:
+                line += newlines
+                line_start = index + value.rindex("\n") + 1
+            if tag:
+                ranges.setdefault(tag, []).extend((token_start, f"{line}.{index + len(value) - line_start}"))
+            count += 1
+        for tag, tag_ranges in ranges.items():
+            self.tag_add(tag, *tag_ranges)
+        self._highlighted_blocks.add(block)
+        self.highlight_stats['tokens'] += count
+        self.highlight_stats['seconds'] += time.perf_counter() - started
+        return retag
+
+    def _lex(self, text, state):
+        from pygments.lexer import RegexLexer
+        # Only the stock RegexLexer tokenizer can resume from a saved state stack
+        if state and type(self._lexer).get_tokens_unprocessed is RegexLexer.get_tokens_unprocessed:
+            return self._lexer.get_tokens_unprocessed(text, stack=state)
+        return self._lexer.get_tokens_unprocessed(text)
+
+    def _lexer_state(self, tokens):
+        # The RegexLexer state stack; None for other lexers, which have no
+        # resumable state, or if it cannot be read from this pygments version
+        stack = _read_state_stack(tokens) if _can_read_state_stack() else None
+        return tuple(stack) if stack else None
+
+    def _invalidate_highlighting(self, line):
+        # An edit can change the lexer state for everything after it
+        if self._lexer is None:
+            return
+        block = (line - 1) // self.CHECKPOINT_LINES
+        self._highlighted_blocks = {b for b in self._highlighted_blocks if b < block}
+        self._checkpoints = {b: state for b, state in self._checkpoints.items() if b <= block}
+        self._guessed_checkpoints = {b for b in self._guessed_checkpoints if b <= block}
+        for tag in self._token_tags.values():
+            if tag:
+                self.tag_remove(tag, f"{block * self.CHECKPOINT_LINES + 1}.0", tk.END)
+
+    def _tag_for(self, token_type):
+        # Map a token type to the closest configured parent, e.g.
+        # Token.Keyword.Namespace -> Token.Keyword
+        if token_type not in self._token_tags:
+            tag = None
+            current = token_type
+            while current is not None:
+                if str(current) in self.tag_names():
+                    tag = str(current)
+                    break
+                current = current.parent
+            self._token_tags[token_type] = tag
+        return self._token_tags[token_type]
 
     def clear_highlighting(self):
         for tag in self.tag_names():
             if tag.startswith("Token"):
                 self.tag_remove(tag, "1.0", tk.END)
 
+def _generated_source(lines):
+    block = [
+        "class Worker{n}(object):",
+        "    \"\"\"Handles batch {n} of the generated benchmark source.\"\"\"",
+        "",
+        "    def run(self, items, limit={n}):",
+        "        # Keep the first items above the limit",
+        "        total = sum(item * 2 for item in items if item > limit)",
+        "        return {{'name': 'worker-{n}', 'total': total, 'ratio': total / 3.5}}",
+        "",
+    ]
+    source = []
+    n = 0
+    while len(source) < lines:
+        source.extend(line.format(n=n) for line in block)
+        n += 1
+    return '\n'.join(source[:lines])
+
+def _highlight_everything(text_widget, text, lexer):
+    # How highlighting worked before it followed the viewport: one lexing
+    # pass over the whole document, every token tagged up front
+    ranges = {}
+    count = 0
+    line, line_start = 1, 0
+    for index, token_type, value in lexer.get_tokens_unprocessed(text):
+        tag = text_widget._tag_for(token_type)
+        token_start = f"{line}.{index - line_start}"
+        newlines = value.count("\n")
+        if newlines:
+            line += newlines
+            line_start = index + value.rindex("\n") + 1
+        if tag:
+            ranges.setdefault(tag, []).extend((token_start, f"{line}.{index + len(value) - line_start}"))
+        count += 1
+    for tag, tag_ranges in ranges.items():
+        text_widget.tag_add(tag, *tag_ranges)
+    return count
+
+def benchmark_highlighting(lines=50000):
+    """Highlights a generated Python file with the viewport highlighter and
+    with a full-document pass, and prints the time until the first screen is
+    highlighted and the tokens per second of each. Needs a display.
+    """
+    from pygments.lexers import PythonLexer
+    source = _generated_source(lines)
+    root = tk.Tk()
+    text_widget = SyntaxHighlightingText(root, width=100, height=40)
+    text_widget.pack()
+    root.update()
+
+    started = time.perf_counter()
+    text_widget.highlight(source, PythonLexer())
+    root.update()  # Runs the idle view update, which highlights the first screen
+    viewport_first_paint = time.perf_counter() - started
+    # Scroll page by page so every block gets highlighted
+    while text_widget.yview()[1] < 1.0:
+        text_widget.yview_scroll(1, "pages")
+        root.update()
+    viewport_total = time.perf_counter() - started
+    stats = text_widget.highlight_stats
+
+    text_widget.highlight(source)
+    root.update()
+    started = time.perf_counter()
+    tokens = _highlight_everything(text_widget, source, PythonLexer())
+    root.update()
+    full_pass = time.perf_counter() - started
+    root.destroy()
+
+    print(f"{lines} lines, {tokens} tokens")
+    print(f"viewport: first screen in {viewport_first_paint * 1000:.0f} ms, "
+          f"{stats['tokens'] / stats['seconds']:.0f} tokens/s lexing and tagging, "
+          f"whole file scrolled through in {viewport_total:.2f}s")
+    print(f"full pass: first screen in {full_pass * 1000:.0f} ms, {tokens / full_pass:.0f} tokens/s")
+
+SAVE_RESULTS = {
+    'unchanged': "No changes to save",
+    'appended': "Saved (new text appended)",
+    'patched': "Saved (edited paragraphs rewritten)",
+    'rewritten': "Saved",
+}
+
 class DocxReaderGUI:
+    # Lines of a large text file loaded into the editor at a time
+    LARGE_WINDOW_LINES = 3000
+
     def __init__(self, root):
         self.root = root
         self.root.title("Document Reader")
         self.current_file = None
+        self.extraction_cache = ExtractionCache()
+        self.tasks = TaskRunner(root)
+        self.load_task = None
         self.recent_files = self.load_recent_files()
         self.current_theme = dark_theme
         self.create_widgets()
@@ -58,6 +419,12 @@ class DocxReaderGUI:
         self.setup_drag_drop()
         self.apply_theme()
         self.setup_ai()
+        self.setup_search()
+        self.setup_find()
+        self.setup_collaboration()
+        self.setup_large_files()
+        self.setup_saving()
+        self.setup_journal()
 
     def create_widgets(self):
         # Create a main frame
@@ -103,6 +470,27 @@ class DocxReaderGUI:
         self.text_area.pack(expand=True, fill=tk.BOTH)
         self.text_area.tag_configure("placeholder", foreground="gray")
 
+        # Find and replace bar, shown above the document with Ctrl+F
+        self.find_frame = ttk.Frame(doc_frame)
+        self.find_text = tk.StringVar()
+        self.replace_text = tk.StringVar()
+        self.find_regex = tk.BooleanVar(value=False)
+        self.find_match_case = tk.BooleanVar(value=False)
+        self.find_whole_word = tk.BooleanVar(value=False)
+        self.find_count = tk.StringVar()
+        self.find_entry = ttk.Entry(self.find_frame, textvariable=self.find_text, width=25)
+        self.find_entry.pack(side=tk.LEFT, padx=2)
+        ttk.Button(self.find_frame, text="Previous", command=self.find_previous).pack(side=tk.LEFT, padx=2)
+        ttk.Button(self.find_frame, text="Next", command=self.find_next).pack(side=tk.LEFT, padx=2)
+        ttk.Entry(self.find_frame, textvariable=self.replace_text, width=20).pack(side=tk.LEFT, padx=2)
+        ttk.Button(self.find_frame, text="Replace", command=self.replace_match).pack(side=tk.LEFT, padx=2)
+        ttk.Button(self.find_frame, text="Replace All", command=self.replace_all_matches).pack(side=tk.LEFT, padx=2)
+        ttk.Checkbutton(self.find_frame, text="Regex", variable=self.find_regex).pack(side=tk.LEFT, padx=2)
+        ttk.Checkbutton(self.find_frame, text="Match case", variable=self.find_match_case).pack(side=tk.LEFT, padx=2)
+        ttk.Checkbutton(self.find_frame, text="Whole word", variable=self.find_whole_word).pack(side=tk.LEFT, padx=2)
+        ttk.Label(self.find_frame, textvariable=self.find_count).pack(side=tk.LEFT, padx=5)
+        ttk.Button(self.find_frame, text="Close", command=self.hide_find).pack(side=tk.RIGHT, padx=2)
+
         # Create a frame for AI suggestions
         ai_frame = ttk.Frame(self.paned_window)
         self.paned_window.add(ai_frame, weight=40)
@@ -128,6 +516,14 @@ class DocxReaderGUI:
         send_button = ttk.Button(prompt_frame, text="Send", command=self.send_prompt)
         send_button.pack(side=tk.LEFT)
 
+        stop_button = ttk.Button(prompt_frame, text="Stop", command=self.stop_prompt)
+        stop_button.pack(side=tk.LEFT, padx=(5, 0))
+
+        # Status bar for background work such as loading and saving
+        self.status_text = tk.StringVar(value="Ready")
+        status_bar = ttk.Label(self.main_frame, textvariable=self.status_text, anchor=tk.W)
+        status_bar.pack(side=tk.BOTTOM, fill=tk.X, padx=5)
+
         # Set the initial position of the sash (divider) to 60% of the window width
         self.root.update()  # Ensure the window is drawn before we calculate sizes
         window_width = self.root.winfo_width()
@@ -172,6 +568,19 @@ class DocxReaderGUI:
         view_menu = tk.Menu(menubar, tearoff=0)
         menubar.add_cascade(label="View", menu=view_menu)
         view_menu.add_command(label="Toggle Theme", command=self.toggle_theme)
+        view_menu.add_command(label="Table of Contents", command=self.show_toc)
+        view_menu.add_command(label="AI Cache Statistics", command=self.show_ai_cache_stats)
+
+        search_menu = tk.Menu(menubar, tearoff=0)
+        menubar.add_cascade(label="Search", menu=search_menu)
+        search_menu.add_command(label="Find and Replace", command=self.show_find, accelerator="Ctrl+F")
+        search_menu.add_command(label="Go to Line...", command=self.go_to_line, accelerator="Ctrl+G")
+        search_menu.add_command(label="Search Documents...", command=self.search_documents)
+
+        collaborate_menu = tk.Menu(menubar, tearoff=0)
+        menubar.add_cascade(label="Collaborate", menu=collaborate_menu)
+        collaborate_menu.add_command(label="Start Collaboration...", command=self.start_collaboration)
+        collaborate_menu.add_command(label="Stop Collaboration", command=self.stop_collaboration)
 
     def toggle_theme(self):
         self.current_theme = dark_theme if self.current_theme == light_theme else light_theme
@@ -229,37 +638,682 @@ class DocxReaderGUI:
             self.load_file(file_path)
 
     def load_file(self, file_path):
+        # Opening another document leaves the shared one
+        if self.collab_session:
+            self.stop_collaboration()
         # Remove the placeholder before loading the file
         if self.text_area.get("1.0", "end-1c") == "Open a document or drag and drop a file here...":
-            self.text_area.delete("1.0", "end")
+            with self.text_area.without_edit_events():
+                self.text_area.delete("1.0", "end")
             self.text_area.tag_remove("placeholder", "1.0", "end")
 
-        text = read_file(file_path)
+        from pygments.lexers import get_lexer_for_filename
+        from pygments.util import ClassNotFound
+
         lexer = None
+        guess = False
         try:
             lexer = get_lexer_for_filename(file_path)
         except ClassNotFound:
-            if file_path.lower().endswith(('.py', '.js', '.html', '.css', '.java', '.cpp', '.c', '.h', '.php', '.rb', '.go', '.rs', '.ts')):
-                try:
-                    lexer = guess_lexer(text)
-                except ClassNotFound:
-                    pass  # If we can't guess, we'll treat it as plain text
+            # The lexer is guessed from the content once the file is read
+            guess = file_path.lower().endswith(('.py', '.js', '.html', '.css', '.java', '.cpp', '.c', '.h', '.php', '.rb', '.go', '.rs', '.ts'))
+
+        # A new load replaces one that is still running
+        if self.load_task:
+            self.load_task.cancel()
+        self.edit_tracker = None
+        self.journal_call(self.journal.close)
+        self.close_large_file()
+        self.text_area.highlight('')
+        if not file_path.lower().endswith(('.docx', '.pdf')) and is_large_file(file_path):
+            self.open_large_file(file_path)
+            return
+        self.set_status(f"Loading {os.path.basename(file_path)}...")
+        # Plain documents are shown page by page as they are extracted
+        show_pages = lexer is None and not guess
+        self.load_task = self.tasks.submit(
+            self.read_document, file_path, show_pages,
+            on_progress=self.show_loaded_page,
+            on_done=lambda pages: self.finish_load(file_path, pages, lexer, guess),
+            on_error=lambda error: self.task_failed(f"Failed to open {os.path.basename(file_path)}", error))
+
+    def read_document(self, task, file_path, show_pages):
+        # Runs on a worker thread
+        pages = []
+        page_count = [0]
+
+        def count_pages(done, total):
+            page_count[0] = total
+
+        for page in read_file(file_path, stream=True, cache=self.extraction_cache, progress=count_pages):
+            task.check_cancelled()
+            pages.append(page)
+            task.report_progress(len(pages), page_count[0], page if show_pages else None)
+        return pages
+
+    def show_loaded_page(self, pages_done, total_pages, page):
+        if page is not None:
+            with self.text_area.without_edit_events():
+                if pages_done > 1:
+                    self.text_area.insert(tk.END, '\n')
+                self.text_area.insert(tk.END, page)
+        self.set_status(f"Loading... page {pages_done} of {total_pages}")
+
+    def finish_load(self, file_path, pages, lexer, guess):
+        text = '\n'.join(pages)
+        if guess:
+            from pygments.lexers import guess_lexer
+            from pygments.util import ClassNotFound
+            try:
+                lexer = guess_lexer(text)
+            except ClassNotFound:
+                pass  # If we can't guess, we'll treat it as plain text
+        if lexer or guess:
+            self.text_area.highlight(text, lexer)
+        self.load_task = None
+        self.current_file = file_path
+        self.edit_tracker = EditTracker(file_path, text.count('\n') + 1)
+        self.journal_call(self.journal.start, file_path)
+        self.add_recent_file(file_path)
+        self.set_status(f"Opened {os.path.basename(file_path)}")
+        self.build_chunk_index(text)
+        self.index_document(file_path, pages)
+        if self.pending_jump and self.pending_jump[0] == os.path.abspath(file_path):
+            self.jump_to_offset(self.pending_jump[1])
+        self.pending_jump = None
+
+    def build_chunk_index(self, text):
+        from retrieval import ChunkIndex
+        self.chunk_index = None
+
+        def on_error(error):
+            print(f"Could not index document: {error}")
+
+        self.tasks.submit(lambda task: ChunkIndex(text), on_done=lambda index: setattr(self, 'chunk_index', index),
+                          on_error=on_error)
+
+    def schedule_index_update(self, *edit):
+        # Re-index shortly after the user stops typing; only changed chunks are re-tokenized
+        if self.chunk_index is None:
+            return
+        if self.index_update_job is not None:
+            self.root.after_cancel(self.index_update_job)
+        self.index_update_job = self.root.after(1500, self.update_chunk_index)
+
+    def update_chunk_index(self):
+        self.index_update_job = None
+        index = self.chunk_index
+        text = self.text_area.get("1.0", "end-1c")
+        self.tasks.submit(lambda task: index.update(text))
+
+    def setup_search(self):
+        from search_index import SearchIndex
+        self.search_index = SearchIndex()
+        self.pending_jump = None
+        # Recent files that changed since they were last opened are re-indexed
+        recent = [path for path in self.recent_files if os.path.exists(path)]
+        self.tasks.submit(self.index_files, recent,
+                          on_error=lambda error: print(f"Could not update search index: {error}"))
+
+    def index_files(self, task, file_paths):
+        # Runs on a worker thread
+        for file_path in file_paths:
+            task.check_cancelled()
+            self.search_index.index_file(file_path, self.extraction_cache)
+
+    def index_document(self, file_path, pages):
+        self.tasks.submit(lambda task: self.search_index.add_document(file_path, pages),
+                          on_error=lambda error: print(f"Could not index {file_path}: {error}"))
+
+    def search_documents(self):
+        from tkinter import simpledialog
+        query = simpledialog.askstring("Search Documents",
+                                       'Words, "exact phrases", AND, OR, NOT and prefix* are supported:',
+                                       parent=self.root)
+        if not query:
+            return
+        started = time.perf_counter()
+        try:
+            results = self.search_index.search(query)
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return
+        elapsed = time.perf_counter() - started
+        self.show_search_results(query, results, elapsed)
+
+    def show_search_results(self, query, results, elapsed):
+        window = tk.Toplevel(self.root)
+        window.title(f"Search: {query}")
+        ttk.Label(window, text=f"{len(results)} results in {elapsed * 1000:.1f} ms").pack(anchor=tk.W, padx=5, pady=5)
+        results_list = tk.Listbox(window, width=100, height=20,
+                                  bg=self.current_theme.text_bg, fg=self.current_theme.text_fg)
+        results_list.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        for result in results:
+            snippet = ' '.join(result['snippet'].split())
+            results_list.insert(tk.END, f"{os.path.basename(result['path'])} (page {result['page']}): {snippet}")
+
+        def open_result(event):
+            selection = results_list.curselection()
+            if selection:
+                result = results[selection[0]]
+                self.open_search_result(result['path'], result['offset'])
+
+        results_list.bind("<Double-Button-1>", open_result)
+        results_list.bind("<Return>", open_result)
+
+    def open_search_result(self, file_path, offset):
+        if self.current_file and os.path.abspath(self.current_file) == file_path and not self.load_task:
+            self.jump_to_offset(offset)
+            return
+        if not os.path.exists(file_path):
+            messagebox.showerror("Error", f"{file_path} no longer exists")
+            self.search_index.remove_document(file_path)
+            return
+        self.pending_jump = (file_path, offset)
+        self.load_file(file_path)
+
+    def jump_to_offset(self, offset):
+        index = f"1.0 + {offset} chars"
+        self.text_area.mark_set(tk.INSERT, index)
+        self.text_area.tag_remove(tk.SEL, "1.0", tk.END)
+        self.text_area.tag_add(tk.SEL, index, f"{index} wordend")
+        self.text_area.see(index)
+        self.text_area.focus_set()
+
+    def show_toc(self):
+        if not self.current_file or self.load_task:
+            messagebox.showerror("Error", "No file is currently open.")
+            return
+        file_path = self.current_file
+        # Served from the extraction cache, which the load has just filled;
+        # large text files are not cached and have no TOC anyway
+        cache = None if self.large_file else self.extraction_cache
+        self.tasks.submit(lambda task: extract_toc(file_path, cache),
+                          on_done=lambda toc: self.show_toc_window(file_path, toc),
+                          on_error=lambda error: self.task_failed("Could not read the table of contents", error))
+
+    def show_toc_window(self, file_path, toc):
+        window = tk.Toplevel(self.root)
+        window.title(f"Contents: {os.path.basename(file_path)}")
+        if not toc:
+            ttk.Label(window, text="This document has no table of contents.").pack(padx=10, pady=10)
+            return
+        toc_list = tk.Listbox(window, width=80, height=25,
+                              bg=self.current_theme.text_bg, fg=self.current_theme.text_fg)
+        toc_list.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        for entry in toc:
+            page = f" (page {entry['page'] + 1})" if entry.get('page') is not None else ""
+            toc_list.insert(tk.END, "    " * (entry['level'] - 1) + entry['title'] + page)
+
+        def open_entry(event):
+            selection = toc_list.curselection()
+            if not selection:
+                return
+            offset = toc[selection[0]].get('offset')
+            if offset is None:
+                self.set_status("This entry does not point to a page")
+            elif self.current_file == file_path and not self.load_task:
+                self.jump_to_offset(offset)
+
+        toc_list.bind("<Double-Button-1>", open_entry)
+        toc_list.bind("<Return>", open_entry)
+
+    def go_to_line(self, event=None):
+        from tkinter import simpledialog
+        line_count = self.large_file.line_count if self.large_file else int(self.text_area.index("end-1c").split(".")[0])
+        line = simpledialog.askinteger("Go to Line", f"Line number (1-{line_count}):",
+                                       minvalue=1, maxvalue=line_count, parent=self.root)
+        if line is None:
+            return
+        if self.large_file:
+            self.show_large_lines(line - 1 - self.LARGE_WINDOW_LINES // 2)
+            line -= self.large_first_line
+        self.text_area.mark_set(tk.INSERT, f"{line}.0")
+        self.text_area.see(f"{line}.0")
+        self.text_area.focus_set()
+
+    def setup_large_files(self):
+        # Text files of LARGE_FILE_BYTES or more are shown read-only, a window
+        # of lines at a time, from a memory-mapped LargeTextFile
+        self.large_file = None
+        self.large_first_line = 0
+        self.text_area.bind("<<ViewChanged>>", self.scroll_large_file, add="+")
+
+    def open_large_file(self, file_path):
+        self.chunk_index = None
+        self.set_status(f"Indexing lines of {os.path.basename(file_path)}...")
 
-        self.text_area.highlight(text, lexer)
+        def open_text_file(task):
+            # Runs on a worker thread
+            def progress(bytes_done, total_bytes):
+                task.check_cancelled()
+                task.report_progress(bytes_done, total_bytes)
+            return LargeTextFile(file_path, progress=progress)
+
+        self.load_task = self.tasks.submit(
+            open_text_file,
+            on_progress=lambda done, total: self.set_status(f"Indexing lines... {done / total:.0%}"),
+            on_done=lambda text_file: self.show_large_file(file_path, text_file),
+            on_error=lambda error: self.task_failed(f"Failed to open {os.path.basename(file_path)}", error))
+
+    def show_large_file(self, file_path, text_file):
+        self.load_task = None
+        self.large_file = text_file
         self.current_file = file_path
         self.add_recent_file(file_path)
+        self.show_large_lines(0)
+
+    def show_large_lines(self, first):
+        text_file = self.large_file
+        first = max(0, min(first, text_file.line_count - self.LARGE_WINDOW_LINES))
+        self.large_first_line = first
+        text = text_file.lines(first, first + self.LARGE_WINDOW_LINES)
+        self.text_area.config(state=tk.NORMAL)
+        with self.text_area.without_edit_events():
+            self.text_area.delete("1.0", tk.END)
+            self.text_area.insert(tk.END, text)
+        self.text_area.config(state=tk.DISABLED)
+        last = min(first + self.LARGE_WINDOW_LINES, text_file.line_count)
+        self.set_status(f"{os.path.basename(text_file.file_path)} (read-only): "
+                        f"lines {first + 1:,}-{last:,} of {text_file.line_count:,}")
+
+    def scroll_large_file(self, event=None):
+        # When the view nears either end of the loaded lines, the window is
+        # moved so that the line at the top of the view is in its middle
+        text_file = self.large_file
+        if text_file is None:
+            return
+        top, bottom = self.text_area.yview()
+        first = self.large_first_line
+        more_above = top < 0.1 and first > 0
+        more_below = bottom > 0.9 and first + self.LARGE_WINDOW_LINES < text_file.line_count
+        if not (more_above or more_below):
+            return
+        top_line = first + int(self.text_area.index("@0,0").split(".")[0]) - 1
+        self.show_large_lines(top_line - self.LARGE_WINDOW_LINES // 2)
+        self.text_area.yview(f"{top_line - self.large_first_line + 1}.0")
+
+    def close_large_file(self):
+        if self.large_file is not None:
+            self.large_file.close()
+            self.large_file = None
+            self.text_area.config(state=tk.NORMAL)
+
+    def setup_find(self):
+        self.find_buffer = None
+        self.find_results = None
+        self.find_current = None
+        self.text_area.tag_configure("find_match", background="#FFE066", foreground="#000000")
+        self.text_area.tag_configure("find_current", background="#FF9933", foreground="#000000")
+        self.text_area.tag_raise("find_current", "find_match")
+        # Only the matches on screen are tagged; scrolling tags the new ones
+        self.text_area.bind("<<ViewChanged>>", self.tag_visible_matches, add="+")
+        self.text_area.edit_listeners.append(self.invalidate_find)
+        for variable in (self.find_text, self.find_regex, self.find_match_case, self.find_whole_word):
+            variable.trace_add("write", self.invalidate_find)
+        self.root.bind("<Control-f>", self.show_find)
+        self.root.bind("<Control-g>", self.go_to_line)
+        self.find_entry.bind("<Return>", lambda event: self.find_next())
+        self.find_entry.bind("<Shift-Return>", lambda event: self.find_previous())
+        self.find_entry.bind("<Escape>", lambda event: self.hide_find())
+
+    def show_find(self, event=None):
+        if not self.find_frame.winfo_ismapped():
+            self.find_frame.pack(fill=tk.X, pady=(0, 5), before=self.text_area)
+        self.find_entry.focus_set()
+        self.find_entry.select_range(0, tk.END)
+        return "break"
+
+    def hide_find(self):
+        self.find_frame.pack_forget()
+        self.invalidate_find()
+        self.text_area.focus_set()
+
+    def invalidate_find(self, *args):
+        # Any edit or change to the search makes the results stale
+        self.find_buffer = None
+        self.find_results = None
+        self.find_current = None
+        self.find_count.set("")
+        self.text_area.tag_remove("find_match", "1.0", tk.END)
+        self.text_area.tag_remove("find_current", "1.0", tk.END)
+
+    def run_find(self):
+        # Matches are found once over a snapshot of the whole text; stepping
+        # through them and tagging the visible ones only uses the offset tables
+        if self.find_results is not None:
+            return self.find_results
+        if not self.find_text.get():
+            return None
+        try:
+            pattern = compile_pattern(self.find_text.get(), self.find_regex.get(),
+                                      self.find_match_case.get(), self.find_whole_word.get())
+        except ValueError as e:
+            self.find_count.set(str(e))
+            return None
+        started = time.perf_counter()
+        self.find_buffer = TextBuffer(self.text_area.get("1.0", "end-1c"))
+        self.find_results = FindResults(self.find_buffer, pattern)
+        elapsed = time.perf_counter() - started
+        self.find_count.set(f"{len(self.find_results)} matches ({elapsed * 1000:.0f} ms)")
+        self.tag_visible_matches()
+        return self.find_results
+
+    def find_next(self):
+        results = self.run_find()
+        if results:
+            self.select_match(results.next_match(self.find_buffer.offset(self.text_area.index(tk.INSERT))))
+
+    def find_previous(self):
+        results = self.run_find()
+        if results:
+            if self.find_current is not None:
+                offset = results.span(self.find_current)[0]
+            else:
+                offset = self.find_buffer.offset(self.text_area.index(tk.INSERT))
+            self.select_match(results.previous_match(offset))
+
+    def select_match(self, i):
+        self.find_current = i
+        start, end = (self.find_buffer.index(offset) for offset in self.find_results.span(i))
+        self.text_area.tag_remove("find_current", "1.0", tk.END)
+        self.text_area.tag_add("find_current", start, end)
+        self.text_area.tag_remove(tk.SEL, "1.0", tk.END)
+        self.text_area.tag_add(tk.SEL, start, end)
+        self.text_area.mark_set(tk.INSERT, end)
+        self.text_area.see(start)
+        self.find_count.set(f"{i + 1} of {len(self.find_results)}")
+
+    def tag_visible_matches(self, event=None):
+        results = self.find_results
+        if not results:
+            return
+        first = self.find_buffer.offset(self.text_area.index("@0,0 linestart"))
+        last = self.find_buffer.offset(self.text_area.index(f"@0,{self.text_area.winfo_height()} lineend"))
+        indexes = []
+        for i in results.between(first, last + 1):
+            indexes.extend(self.find_buffer.index(offset) for offset in results.span(i))
+        self.text_area.tag_remove("find_match", "1.0", tk.END)
+        if indexes:
+            self.text_area.tag_add("find_match", *indexes)
+
+    def replace_match(self):
+        if self.find_current is None:
+            self.find_next()
+            return
+        results = self.find_results
+        start, end = results.span(self.find_current)
+        replacement = results.replacement(self.find_current, self.replace_text.get(), self.find_regex.get())
+        start_index = self.find_buffer.index(start)
+        self.text_area.replace(start_index, self.find_buffer.index(end), replacement)
+        self.text_area.mark_set(tk.INSERT, f"{start_index} + {len(replacement)} chars")
+        self.find_next()
+
+    def replace_all_matches(self):
+        results = self.run_find()
+        if not results:
+            return
+        text, count = results.replace_all(self.replace_text.get(), self.find_regex.get())
+        insert = self.text_area.index(tk.INSERT)
+        self.text_area.replace("1.0", "end-1c", text)
+        self.text_area.mark_set(tk.INSERT, insert)
+        self.set_status(f"Replaced {count} matches")
+
+    def setup_collaboration(self):
+        self.collab_session = None
+        self.collab_job = None
+        self.applying_remote_edit = False
+        self.text_area.edit_listeners.append(self.send_local_edit)
+
+    def start_collaboration(self):
+        from tkinter import simpledialog
+        from collab_sync import CollaborationSession, DEFAULT_SERVER
+        if self.large_file:
+            messagebox.showerror("Error", "Large text files are opened read-only and cannot be shared.")
+            return
+        if self.collab_session:
+            self.stop_collaboration()
+        server = simpledialog.askstring("Collaborate", "Relay server (host:port):",
+                                        initialvalue=DEFAULT_SERVER, parent=self.root)
+        if not server:
+            return
+        default_id = os.path.basename(self.current_file) if self.current_file else "untitled"
+        doc_id = simpledialog.askstring("Collaborate", "Shared document name:", initialvalue=default_id, parent=self.root)
+        if not doc_id:
+            return
+        text = self.text_area.get("1.0", "end-1c")
+        if text == "Open a document or drag and drop a file here...":
+            with self.text_area.without_edit_events():
+                self.text_area.delete("1.0", "end")
+            self.text_area.tag_remove("placeholder", "1.0", "end")
+            text = ""
+        # Local edits wait until the server's copy of the document arrives
+        self.text_area.config(state=tk.DISABLED)
+        self.set_status(f"Connecting to {server}...")
+
+        def on_done(session):
+            self.collab_session = session
+            self.collab_job = self.root.after(30, self.poll_collaboration)
+
+        def on_error(error):
+            self.text_area.config(state=tk.NORMAL)
+            self.task_failed(f"Could not connect to {server}", error)
+
+        self.tasks.submit(lambda task: CollaborationSession(server, doc_id, text), on_done=on_done, on_error=on_error)
+
+    def stop_collaboration(self):
+        if self.collab_job is not None:
+            self.root.after_cancel(self.collab_job)
+            self.collab_job = None
+        if self.collab_session:
+            self.collab_session.close()
+            self.collab_session = None
+            self.set_status("Collaboration stopped")
+        self.text_area.config(state=tk.NORMAL)
+
+    def poll_collaboration(self):
+        self.collab_job = None
+        session = self.collab_session
+        for kind, value in session.poll():
+            if kind == 'snapshot':
+                self.text_area.config(state=tk.NORMAL)
+                if value != self.text_area.get("1.0", "end-1c"):
+                    with self.remote_edit():
+                        self.text_area.replace("1.0", "end-1c", value)
+                self.set_status(f"Collaborating on {session.doc_id}")
+            elif kind == 'op':
+                self.apply_remote_operation(value)
+            elif kind == 'closed':
+                self.stop_collaboration()
+                self.set_status(f"Collaboration ended: {value}" if value else "Collaboration ended")
+                return
+        self.collab_job = self.root.after(30, self.poll_collaboration)
+
+    @contextmanager
+    def remote_edit(self):
+        # Edits from other users still update highlighting, the find results
+        # and the AI index, but are not sent back to the server
+        self.applying_remote_edit = True
+        try:
+            yield
+        finally:
+            self.applying_remote_edit = False
+
+    def apply_remote_operation(self, op):
+        # Operations count Python characters, which Tk indices may not
+        text = self.text_area.get("1.0", "end-1c")
+        source = 0  # Position in text
+        position = 0  # Tk characters from 1.0
+        with self.remote_edit():
+            for component in op.ops:
+                index = f"1.0 + {position} chars"
+                if isinstance(component, str):
+                    self.text_area.insert(index, component)
+                    position += self.text_area.tk_length(component)
+                elif component > 0:
+                    position += self.text_area.tk_length(text[source:source + component])
+                    source += component
+                else:
+                    length = self.text_area.tk_length(text[source:source - component])
+                    self.text_area.delete(index, f"{index} + {length} chars")
+                    source -= component
+
+    def send_local_edit(self, operation, start, text):
+        session = self.collab_session
+        if session is None or session.client is None or self.applying_remote_edit:
+            return
+        from ot import TextOperation
+        # In Python characters, like session.length and the text itself
+        offset = len(self.text_area.get("1.0", start))
+        if operation == 'insert':
+            op = TextOperation.from_edit(session.length, offset, inserted=text)
+        else:
+            op = TextOperation.from_edit(session.length, offset, deleted=len(text))
+        session.local_edit(op)
+
+    def set_status(self, message):
+        self.status_text.set(message)
+
+    def task_failed(self, message, error):
+        self.set_status(message)
+        messagebox.showerror("Error", f"{message}: {error}")
+
+    def setup_saving(self):
+        # Edited line ranges are tracked so that Save only rewrites those
+        self.edit_tracker = None
+        self.text_area.edit_listeners.append(self.track_edit)
+
+    def track_edit(self, operation, start, text):
+        if self.edit_tracker is not None:
+            self.edit_tracker.edit(operation, start, text)
+
+    def editor_lines(self, first, last):
+        # Lines first to last - 1 of the editor, counted from 0
+        return self.text_area.get(f"{first + 1}.0", f"{last}.end").split('\n')
 
     def save_file(self):
-        if not self.current_file:
-            self.current_file = filedialog.asksaveasfilename(
+        if self.large_file:
+            messagebox.showerror("Error", "Large text files are opened read-only.")
+            return
+        file_path = self.current_file
+        # A PDF is saved as a new document rather than over the original
+        if not file_path or file_path.lower().endswith('.pdf'):
+            file_path = filedialog.asksaveasfilename(
                 defaultextension=".txt",
-                filetypes=[("Text Files", "*.txt"), ("Word Documents", "*.docx")]
+                filetypes=[("Text Files", "*.txt"), ("Word Documents", "*.docx"), ("PDF Files", "*.pdf")]
             )
-        if self.current_file:
-            content = self.text_area.get(1.0, tk.END)
-            save_file(self.current_file, content)
+            if not file_path:
+                return
+            self.current_file = file_path
+        content = self.text_area.get("1.0", "end-1c")
+        changes = self.edit_tracker.snapshot(self.editor_lines) if self.edit_tracker else None
+        # Edits made while the save runs are tracked against the saved text
+        saved = self.edit_tracker = EditTracker(file_path, content.count('\n') + 1)
+        journal_mark = self.journal.mark()
+        self.set_status(f"Saving {os.path.basename(file_path)}...")
+
+        def on_done(result):
+            saved.mark_saved()
+            # A saved PDF reads back as different text, so its journal keeps
+            # replaying from the previous base
+            if file_path.lower().endswith(('.txt', '.docx')):
+                self.journal_call(self.journal.rebase, file_path, journal_mark)
+            self.set_status(SAVE_RESULTS[result])
             messagebox.showinfo("Success", "File saved successfully.")
 
+        def on_error(error):
+            # The file may not match the saved text, so the next save writes it all
+            if self.edit_tracker is saved:
+                self.edit_tracker = None
+            self.task_failed("Saving failed", error)
+
+        self.tasks.submit(lambda task: save_file(file_path, content, changes), on_done=on_done, on_error=on_error)
+
+    def setup_journal(self):
+        # Edits are journaled as they are made, so a crash or an exit without
+        # saving loses at most the last sync interval of typing
+        self.journal = EditJournal(on_error=lambda error: print(f"Could not write the edit journal: {error}"))
+        self.text_area.edit_listeners.append(self.journal_edit)
+        atexit.register(self.journal.shutdown)
+        # Asked once the window is up, after startup-time checks
+        self.root.after(200, self.offer_recovery)
+
+    def journal_call(self, method, *args):
+        # A journal that cannot be written must not stop editing or saving
+        try:
+            method(*args)
+        except OSError as error:
+            print(f"Could not write the edit journal: {error}")
+
+    def journal_edit(self, operation, start, text):
+        if self.journal.active:
+            # The journal counts columns in Python characters, as replay() does
+            line = start.split(".")[0]
+            self.journal.record(operation, f"{line}.{len(self.text_area.get(f'{line}.0', start))}", text)
+            if self.journal.needs_compaction():
+                self.journal_call(self.journal.compact, self.text_area.get("1.0", "end-1c"))
+        elif self.load_task is None and not self.large_file:
+            # The first edit of a document that was not loaded from a file;
+            # the snapshot already includes it
+            self.journal_call(self.journal.start_text, self.current_file, self.text_area.get("1.0", "end-1c"))
+
+    def offer_recovery(self):
+        sessions = find_sessions()
+        if not sessions:
+            return
+        # One document is open at a time; older sessions are offered at the next start
+        session = sessions[0]
+        name = os.path.basename(session['path']) if session['path'] else "an untitled document"
+        modified = time.strftime("%Y-%m-%d %H:%M", time.localtime(session['modified']))
+        if not messagebox.askyesno("Recover Unsaved Changes",
+                                   f"Edits to {name} made until {modified} were not saved. Recover them?"):
+            discard_session(session['journal'])
+            return
+        self.set_status("Recovering unsaved changes...")
+
+        def on_error(error):
+            self.load_task = None
+            if isinstance(error, ValueError):
+                # The edits no longer apply to the file
+                discard_session(session['journal'])
+            self.task_failed("Could not recover unsaved changes", error)
+
+        self.load_task = self.tasks.submit(
+            lambda task: recover(session['journal'], lambda file_path: read_file(file_path, cache=self.extraction_cache)),
+            on_done=lambda result: self.finish_recovery(session['journal'], *result),
+            on_error=on_error)
+
+    def finish_recovery(self, journal_path, file_path, text, line_count):
+        self.load_task = None
+        if self.collab_session:
+            self.stop_collaboration()
+        self.close_large_file()
+        self.text_area.tag_remove("placeholder", "1.0", "end")
+        self.text_area.highlight(text)
+        self.current_file = file_path
+        # The next save compares the whole text with the file
+        self.edit_tracker = None
+        if line_count is not None:
+            self.edit_tracker = EditTracker(file_path, line_count)
+            self.edit_tracker.replace_lines(0, line_count, text.count('\n') + 1)
+        # The recovered text becomes the base of a new journal before the old one goes
+        self.journal_call(self.journal.start_text, file_path, text)
+        discard_session(journal_path)
+        self.build_chunk_index(text)
+        name = os.path.basename(file_path) if file_path else "untitled document"
+        self.set_status(f"Recovered unsaved changes to {name}")
+
+    def run_in_background(self, action, func, file_path, content, success_message):
+        # File writes run on a worker thread; the result is reported on the UI thread
+        self.set_status(f"{action} {os.path.basename(file_path)}...")
+
+        def on_done(result):
+            self.set_status("Ready")
+            messagebox.showinfo("Success", success_message)
+
+        self.tasks.submit(lambda task: func(file_path, content), on_done=on_done,
+                          on_error=lambda error: self.task_failed(f"{action} failed", error))
+
     def setup_drag_drop(self):
         self.root.drop_target_register(DND_FILES)
         self.root.dnd_bind('<<Drop>>', self.drop_file)
@@ -286,20 +1340,39 @@ class DocxReaderGUI:
         
         file_path = filedialog.asksaveasfilename(defaultextension=".pdf", filetypes=[("PDF Files", "*.pdf")])
         if file_path:
-            content = self.text_area.get(1.0, tk.END)
-            export_to_pdf(file_path, content)
-            messagebox.showinfo("Success", "File exported to PDF successfully.")
+            # A large file is exported from disk in chunks
+            content = self.large_file.iter_text() if self.large_file else self.text_area.get(1.0, tk.END)
+            self.set_status(f"Exporting {os.path.basename(file_path)}...")
+
+            def export(task):
+                return export_to_pdf(file_path, content, progress=task.report_progress)
+
+            def show_progress(pages, chars_done, total_chars):
+                if total_chars is None:
+                    self.set_status(f"Exporting... page {pages}")
+                else:
+                    self.set_status(f"Exporting... page {pages} ({chars_done / max(total_chars, 1):.0%})")
+
+            def on_done(pages):
+                self.set_status("Ready")
+                messagebox.showinfo("Success", f"File exported to PDF successfully ({pages} pages).")
+
+            self.tasks.submit(export, on_progress=show_progress, on_done=on_done,
+                              on_error=lambda error: self.task_failed("Exporting failed", error))
 
     def export_to_html(self):
         if not self.current_file:
             messagebox.showerror("Error", "No file is currently open.")
             return
+        if self.large_file:
+            messagebox.showerror("Error", "Large text files can only be exported to PDF.")
+            return
         
         file_path = filedialog.asksaveasfilename(defaultextension=".html", filetypes=[("HTML Files", "*.html")])
         if file_path:
             content = self.text_area.get(1.0, tk.END)
-            export_to_html(file_path, content)
-            messagebox.showinfo("Success", "File exported to HTML successfully.")
+            self.run_in_background("Exporting", export_to_html, file_path, content,
+                                   success_message="File exported to HTML successfully.")
 
     def load_recent_files(self):
         try:
@@ -328,46 +1401,106 @@ class DocxReaderGUI:
             menu.add_command(label=os.path.basename(file_path), command=lambda fp=file_path: self.load_file(fp))
 
     def setup_ai(self):
-        self.client = OpenAI(api_key=OPENAI_API_KEY)
+        # The OpenAI client is created on the first prompt, keeping the
+        # openai import off the startup path
+        self.client = None
+        self.ai_task = None
+        self.response_cache = None
+        # Index of the open document used to pick the passages sent to the AI
+        self.chunk_index = None
+        self.index_update_job = None
+        self.text_area.edit_listeners.append(self.schedule_index_update)
+
+    def get_ai_client(self):
+        if self.client is None:
+            from ai_assistant import create_client
+            self.client = create_client()
+        return self.client
 
     def send_prompt(self):
         prompt = self.prompt_text.get("1.0", tk.END).strip()
         if not prompt:
             return
 
-        document_content = self.text_area.get(1.0, tk.END).strip()
-        if document_content == "Open a document or drag and drop a file here...":
+        # The same text update_chunk_index() gives the chunk index, so the two
+        # do not re-chunk the end of the document against each other
+        document_content = self.text_area.get("1.0", "end-1c")
+        if document_content.strip() == "Open a document or drag and drop a file here...":
             document_content = "No document is currently loaded."
 
-        full_prompt = f"Given the following document content:\n\n{document_content}\n\nUser question: {prompt}\n\nPlease provide a response:"
+        # A new question replaces an answer that is still streaming
+        self.stop_prompt()
+        self.ai_suggestion_area.config(state=tk.NORMAL)
+        self.ai_suggestion_area.clear_highlighting()
+        self.ai_suggestion_area.delete(1.0, tk.END)
+        self.ai_suggestion_area.insert(tk.END, f"Q: {prompt}\n\nA: ")
+        # Don't apply syntax highlighting to AI responses
+        self.ai_suggestion_area.config(state=tk.DISABLED)
 
-        try:
-            response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "You are a helpful assistant that answers questions about documents."},
-                    {"role": "user", "content": full_prompt}
-                ],
-                max_tokens=300,
-                n=1,
-                temperature=0.7,
-            )
-            ai_response = response.choices[0].message.content.strip()
-            
+        self.set_status("Waiting for AI response...")
+        started = time.perf_counter()
+        first_token = []
+
+        def append_answer(text):
+            if not first_token:
+                first_token.append(time.perf_counter() - started)
+                self.set_status(f"Receiving AI response (first token after {first_token[0]:.2f}s)...")
             self.ai_suggestion_area.config(state=tk.NORMAL)
-            self.ai_suggestion_area.clear_highlighting()
-            self.ai_suggestion_area.delete(1.0, tk.END)
-            full_response = f"Q: {prompt}\n\nA: {ai_response}"
-            self.ai_suggestion_area.insert(tk.END, full_response)
-            # Don't apply syntax highlighting to AI responses
+            self.ai_suggestion_area.insert(tk.END, text)
+            self.ai_suggestion_area.see(tk.END)
             self.ai_suggestion_area.config(state=tk.DISABLED)
-        except Exception as e:
+
+        def on_done(result):
+            self.ai_task = None
+            self.set_status(f"AI response complete in {time.perf_counter() - started:.2f}s")
+
+        def on_error(e):
+            self.ai_task = None
             print(f"Detailed error: {str(e)}")  # This will print the full error to the console
+            self.set_status("AI request failed")
             messagebox.showerror("Error", f"Failed to get AI response: {str(e)}")
 
+        self.ai_task = self.tasks.submit(
+            self.stream_ai_answer, document_content, prompt,
+            on_progress=append_answer, on_done=on_done, on_error=on_error)
+
         # Clear the prompt text after sending
         self.prompt_text.delete("1.0", tk.END)
 
+    def stream_ai_answer(self, task, document_content, prompt):
+        # Runs on a worker thread; each chunk of the answer is passed to the UI as progress
+        from ai_assistant import cached_stream_answer, context_token_budget
+        context = None
+        if self.chunk_index is not None:
+            # Send only the passages most relevant to the question
+            self.chunk_index.update(document_content)
+            context = self.chunk_index.select_context(prompt, context_token_budget())
+        for text in cached_stream_answer(self.get_ai_client(), self.get_response_cache(), document_content, prompt,
+                                         context=context, cancelled=lambda: task.cancelled):
+            task.report_progress(text)
+        task.check_cancelled()
+
+    def get_response_cache(self):
+        if self.response_cache is None:
+            from response_cache import ResponseCache
+            self.response_cache = ResponseCache()
+        return self.response_cache
+
+    def show_ai_cache_stats(self):
+        stats = self.get_response_cache().stats()
+        messagebox.showinfo("AI Response Cache",
+                            f"Hits: {stats['hits']}\n"
+                            f"Misses: {stats['misses']}\n"
+                            f"Coalesced requests: {stats['coalesced']}\n"
+                            f"Hit rate: {stats['hit_rate']:.0%}\n"
+                            f"Cached answers: {stats['entries']}")
+
+    def stop_prompt(self):
+        if self.ai_task:
+            self.ai_task.cancel()
+            self.ai_task = None
+            self.set_status("AI response stopped")
+
     def clear_ai_suggestions(self):
         self.ai_suggestion_area.config(state=tk.NORMAL)
         self.ai_suggestion_area.clear_highlighting()
@@ -377,7 +1510,8 @@ class DocxReaderGUI:
 
     def set_document_placeholder(self):
         placeholder_text = "Open a document or drag and drop a file here..."
-        self.text_area.insert("1.0", placeholder_text)
+        with self.text_area.without_edit_events():
+            self.text_area.insert("1.0", placeholder_text)
         self.text_area.tag_add("placeholder", "1.0", "end")
 
 if __name__ == "__main__":
@@ -0,0 +1,162 @@
+import argparse
+import asyncio
+import json
+from ot import TextOperation
+
+PERSIST_DELAY = 1.0
+
+class RelayDocument:
+    # The server's copy of a shared document. Operations are only appended
+    # to pending; the text is rebuilt when a new client joins or it is saved,
+    # so each edit costs about its own size.
+    def __init__(self, text):
+        self._text = text
+        self.length = len(text)
+        # Accepted operations from revision first_revision on; older ones are
+        # dropped once no client can still send an operation based on them
+        self.history = []
+        self.first_revision = 0
+        self.pending = []
+        # Each client -> the oldest revision its next operation can be based on
+        self.clients = {}
+        self.persist_job = None
+
+    @property
+    def revision(self):
+        return self.first_revision + len(self.history)
+
+    @property
+    def text(self):
+        if self.pending:
+            # Composed pairwise into one operation, so the text is rebuilt in
+            # a single pass however many operations are pending
+            ops = self.pending
+            while len(ops) > 1:
+                ops = [ops[i].compose(ops[i + 1]) if i + 1 < len(ops) else ops[i] for i in range(0, len(ops), 2)]
+            self._text = ops[0].apply(self._text)
+            self.pending = []
+        return self._text
+
+    def receive(self, revision, op):
+        # Transform an operation made at an older revision past everything
+        # that was accepted since, then accept it
+        if not self.first_revision <= revision <= self.revision:
+            raise ValueError(f"Unknown revision {revision}")
+        for concurrent in self.history[revision - self.first_revision:]:
+            op, _ = TextOperation.transform(op, concurrent)
+        if op.base_length != self.length:
+            raise ValueError("Operation does not match the document length")
+        self.history.append(op)
+        self.pending.append(op)
+        self.length = op.target_length
+        return op
+
+    def client_at(self, client, revision):
+        # Clients only move forward, so operations before the oldest revision
+        # any of them is at are never needed again
+        self.clients[client] = revision
+        oldest = min(self.clients.values())
+        if oldest > self.first_revision:
+            del self.history[:oldest - self.first_revision]
+            self.first_revision = oldest
+
+class RelayServer:
+    """Relays operations between the clients editing each document.
+
+    Every client operation is transformed against the operations accepted
+    since the revision it was made at, acknowledged to its sender and sent to
+    the other clients of the document. With a CollaborationManager and
+    WriteBehind, documents are loaded from and saved to its backend.
+    """
+
+    def __init__(self, manager=None, writer=None):
+        self.manager = manager
+        self.writer = writer
+        self.documents = {}
+
+    async def handle_client(self, reader, writer):
+        doc_id = None
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                message = json.loads(line)
+                if message['type'] == 'join':
+                    doc_id = message['doc']
+                    self.join(doc_id, message.get('text', ''), writer)
+                elif message['type'] == 'op' and doc_id is not None:
+                    self.receive(doc_id, message, writer)
+                await writer.drain()
+        except (ValueError, KeyError) as e:
+            self.send(writer, {'type': 'error', 'message': str(e)})
+        except ConnectionError:
+            pass
+        finally:
+            if doc_id in self.documents:
+                self.documents[doc_id].clients.pop(writer, None)
+            writer.close()
+
+    def join(self, doc_id, text, writer):
+        document = self.documents.get(doc_id)
+        if document is None:
+            stored = self.manager.get_document(doc_id) if self.manager else None
+            document = self.documents[doc_id] = RelayDocument(stored if stored is not None else text)
+        document.client_at(writer, document.revision)
+        self.send(writer, {'type': 'snapshot', 'revision': document.revision, 'text': document.text})
+
+    def receive(self, doc_id, message, sender):
+        document = self.documents[doc_id]
+        op = document.receive(message['revision'], TextOperation.from_json(message['op']))
+        document.client_at(sender, message['revision'])
+        self.send(sender, {'type': 'ack'})
+        broadcast = {'type': 'op', 'op': op.to_json()}
+        for client in document.clients:
+            if client is not sender:
+                self.send(client, broadcast)
+        self.schedule_persist(doc_id, document)
+
+    def send(self, writer, message):
+        writer.write((json.dumps(message, separators=(',', ':')) + '\n').encode('utf-8'))
+
+    def schedule_persist(self, doc_id, document):
+        if self.writer is None or document.persist_job is not None:
+            return
+
+        def persist():
+            document.persist_job = None
+            self.writer.update(doc_id, document.text)
+
+        document.persist_job = asyncio.get_running_loop().call_later(PERSIST_DELAY, persist)
+
+async def serve(host, port, manager=None, writer=None):
+    relay = RelayServer(manager, writer)
+    server = await asyncio.start_server(relay.handle_client, host, port)
+    print(f"Relay server listening on {host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+def main():
+    parser = argparse.ArgumentParser(description="Relay server for real-time collaborative editing.")
+    parser.add_argument('--host', default='127.0.0.1', help="Address to listen on")
+    parser.add_argument('--port', type=int, default=8765, help="Port to listen on")
+    parser.add_argument('--store', help="SQLite file to load and save shared documents")
+    args = parser.parse_args()
+
+    manager = writer = None
+    if args.store:
+        from collaboration import CollaborationManager
+        from version_store import SQLiteBackend
+        from write_behind import WriteBehind
+        manager = CollaborationManager(SQLiteBackend(args.store))
+        writer = WriteBehind(manager)
+    try:
+        asyncio.run(serve(args.host, args.port, manager, writer))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if writer is not None:
+            writer.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+import math
+import threading
+import zlib
+from collections import Counter
+from nltk.tokenize import word_tokenize
+from nltk_resources import ensure_nltk_resources
+from nlp_pipeline import get_stop_words
+
+CHUNK_WORDS = 200
+DEFAULT_TOKEN_BUDGET = 2000
+DEFAULT_TOP_K = 8
+CHUNK_SEPARATOR = "\n...\n"
+# A chunk that holds enough words ends after roughly one line in this many
+ANCHOR_LINES = 8
+
+# BM25 parameters
+K1 = 1.5
+B = 0.75
+
+def tokenize(text):
+    stop_words = get_stop_words()
+    return [word for word in word_tokenize(text.lower(), preserve_line=True) if word.isalnum() and word not in stop_words]
+
+def estimate_tokens(text):
+    # Roughly four characters per token for English text
+    return len(text) // 4 + 1
+
+def _is_anchor(line):
+    # About one line in ANCHOR_LINES, chosen by content alone
+    return zlib.crc32(line.encode('utf-8')) % ANCHOR_LINES == 0
+
+def split_chunks(text, chunk_words=CHUNK_WORDS):
+    # Whole lines are grouped into chunks of chunk_words / 2 to 2 * chunk_words
+    # words. Past the minimum, a chunk ends after an anchor line, picked by a
+    # hash of the line. Boundaries depend on the text around them rather than
+    # on a word count from the start, so an edit only changes the chunks up
+    # to the next anchor and the later ones stay the same.
+    chunks = []
+    current = []
+    word_count = 0
+    for line in text.split('\n'):
+        current.append(line)
+        word_count += len(line.split())
+        if word_count >= 2 * chunk_words or (word_count >= chunk_words // 2 and _is_anchor(line)):
+            chunks.append('\n'.join(current))
+            current = []
+            word_count = 0
+    if word_count:
+        chunks.append('\n'.join(current))
+    return chunks
+
+class ChunkIndex:
+    """BM25 index over the chunks of one document.
+
+    update() re-chunks the text but only tokenizes chunks it has not seen
+    before, so re-indexing after an edit costs about the size of the edit.
+    """
+
+    def __init__(self, text='', chunk_words=CHUNK_WORDS):
+        ensure_nltk_resources()
+        self.chunk_words = chunk_words
+        self.chunks = []
+        self._term_counts = {}
+        # Updates after edits and queries for the AI assistant can run on
+        # different worker threads
+        self._lock = threading.Lock()
+        self.update(text)
+
+    def update(self, text):
+        chunks = split_chunks(text, self.chunk_words)
+        with self._lock:
+            term_counts = {}
+            for chunk in chunks:
+                if chunk not in term_counts:
+                    term_counts[chunk] = self._term_counts.get(chunk) or Counter(tokenize(chunk))
+            self.chunks = chunks
+            self._term_counts = term_counts
+
+            self.doc_freq = Counter()
+            total_length = 0
+            for chunk in chunks:
+                counts = term_counts[chunk]
+                self.doc_freq.update(counts.keys())
+                total_length += sum(counts.values())
+            self.avg_length = total_length / len(chunks) if chunks else 0.0
+
+    def scores(self, query):
+        terms = set(tokenize(query))
+        chunk_count = len(self.chunks)
+        idf = {term: math.log(1 + (chunk_count - self.doc_freq[term] + 0.5) / (self.doc_freq[term] + 0.5))
+               for term in terms if self.doc_freq[term]}
+        scores = []
+        for chunk in self.chunks:
+            counts = self._term_counts[chunk]
+            length_norm = K1 * (1 - B + B * sum(counts.values()) / (self.avg_length or 1))
+            scores.append(sum(weight * counts[term] * (K1 + 1) / (counts[term] + length_norm)
+                              for term, weight in idf.items() if counts[term]))
+        return scores
+
+    def select_context(self, query, token_budget=DEFAULT_TOKEN_BUDGET, top_k=DEFAULT_TOP_K):
+        # The best-scoring chunks that fit the token budget, in document order.
+        # Ties go to earlier chunks, so a question that matches nothing, such
+        # as "summarize this", gets the start of the document.
+        with self._lock:
+            return self._select_context(query, token_budget, top_k)
+
+    def _select_context(self, query, token_budget, top_k):
+        if sum(estimate_tokens(chunk) for chunk in self.chunks) <= token_budget:
+            return '\n'.join(self.chunks)
+        scores = self.scores(query)
+        ranked = sorted(range(len(self.chunks)), key=lambda i: (-scores[i], i))
+        selected = {}
+        remaining = token_budget
+        oversized = None  # The best chunk too big for what was left of the budget
+        for i in ranked:
+            if len(selected) == top_k:
+                break
+            cost = estimate_tokens(self.chunks[i])
+            if cost <= remaining:
+                selected[i] = self.chunks[i]
+                remaining -= cost
+            elif oversized is None:
+                oversized = i
+        # Rather than leave budget unused, or send nothing at all when every
+        # chunk is bigger than the budget (a few very long lines), the part
+        # of that chunk that fits is sent
+        if oversized is not None and len(selected) < top_k:
+            excerpt = _excerpt(self.chunks[oversized], tokenize(query), remaining)
+            if excerpt:
+                selected[oversized] = excerpt
+        return CHUNK_SEPARATOR.join(selected[i] for i in sorted(selected))
+
+def _excerpt(text, terms, token_budget):
+    # A part of text that fits token_budget, starting a little before the
+    # first query term it contains, cut at whitespace where possible
+    length = (token_budget - 1) * 4
+    if length <= 0:
+        return ''
+    lowered = text.lower()
+    found = [position for position in (lowered.find(term) for term in terms) if position >= 0]
+    start = max(0, min(found) - length // 4) if found else 0
+    start = max(0, min(start, len(text) - length))
+    if start:
+        space = text.find(' ', start, start + length // 4)
+        start = space + 1 if space >= 0 else start
+    excerpt = text[start:start + length]
+    if start + length < len(text):
+        space = excerpt.rfind(' ')
+        if space > length // 2:
+            excerpt = excerpt[:space]
+    return excerpt
@@ -0,0 +1,130 @@
+import os
+import sqlite3
+import threading
+from doc_reader import read_file, page_offsets
+from large_text import is_large_file
+
+DEFAULT_INDEX_PATH = os.path.join(os.path.expanduser("~"), ".smart_documents_reader", "search_index.sqlite3")
+
+# Markers used to find where the first match starts inside a page
+MATCH_START = '\x01'
+MATCH_END = '\x02'
+# 1: documents hold the rowids of their pages
+FORMAT_VERSION = 1
+
+class SearchIndex:
+    """Full-text index over opened and batch-processed documents (SQLite FTS5).
+
+    Each page is indexed as its own row together with its start offset in the
+    document text, so a hit can be turned into a position in the editor.
+    Queries use FTS5 syntax: words, "exact phrases", AND, OR, NOT and prefix*.
+    The pages of a document get consecutive rowids, so re-indexing it deletes
+    them by rowid instead of scanning the unindexed doc_id column.
+    """
+
+    def __init__(self, path=DEFAULT_INDEX_PATH):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS documents (
+                id INTEGER PRIMARY KEY, path TEXT UNIQUE, mtime_ns INTEGER, size INTEGER,
+                first_page_rowid INTEGER, last_page_rowid INTEGER)""")
+            conn.execute("""CREATE VIRTUAL TABLE IF NOT EXISTS pages USING fts5(
+                body, doc_id UNINDEXED, page UNINDEXED, page_offset UNINDEXED)""")
+            if conn.execute("PRAGMA user_version").fetchone()[0] < FORMAT_VERSION:
+                # Documents indexed before have no rowids and are deleted the slow way
+                columns = [row[1] for row in conn.execute("PRAGMA table_info(documents)")]
+                if 'first_page_rowid' not in columns:
+                    conn.execute("ALTER TABLE documents ADD COLUMN first_page_rowid INTEGER")
+                    conn.execute("ALTER TABLE documents ADD COLUMN last_page_rowid INTEGER")
+                conn.execute(f"PRAGMA user_version = {FORMAT_VERSION}")
+
+    def _connect(self):
+        # One connection per thread, reused for every call. Worker processes
+        # forked after the first call open their own.
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=30)
+            self._local.pid = os.getpid()
+            conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def is_current(self, file_path):
+        stat = os.stat(file_path)
+        with self._connect() as conn:
+            row = conn.execute("SELECT mtime_ns, size FROM documents WHERE path = ?",
+                               (os.path.abspath(file_path),)).fetchone()
+        return row is not None and row[0] == stat.st_mtime_ns and row[1] == stat.st_size
+
+    def add_document(self, file_path, pages):
+        path = os.path.abspath(file_path)
+        stat = os.stat(file_path)
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            self._delete(conn, path)
+            row = conn.execute("SELECT rowid FROM pages ORDER BY rowid DESC LIMIT 1").fetchone()
+            first = (row[0] if row is not None else 0) + 1
+            doc_id = conn.execute("""INSERT INTO documents (path, mtime_ns, size, first_page_rowid, last_page_rowid)
+                                     VALUES (?, ?, ?, ?, ?)""",
+                                  (path, stat.st_mtime_ns, stat.st_size, first, first + len(pages) - 1)).lastrowid
+            conn.executemany("INSERT INTO pages (rowid, body, doc_id, page, page_offset) VALUES (?, ?, ?, ?, ?)",
+                             [(first + number - 1, page, doc_id, number, offset)
+                              for number, (page, offset) in enumerate(zip(pages, page_offsets(pages)), 1)])
+
+    def index_file(self, file_path, cache=None):
+        # Only files that are new or changed since they were indexed are read.
+        # Large text files are read a window at a time and are not indexed.
+        if self.is_current(file_path) or (file_path.lower().endswith('.txt') and is_large_file(file_path)):
+            return False
+        self.add_document(file_path, list(read_file(file_path, stream=True, cache=cache)))
+        return True
+
+    def remove_document(self, file_path):
+        with self._connect() as conn:
+            self._delete(conn, os.path.abspath(file_path))
+
+    def _delete(self, conn, path):
+        row = conn.execute("SELECT id, first_page_rowid, last_page_rowid FROM documents WHERE path = ?",
+                           (path,)).fetchone()
+        if row is not None:
+            doc_id, first, last = row
+            if first is not None:
+                conn.execute("DELETE FROM pages WHERE rowid BETWEEN ? AND ?", (first, last))
+            else:
+                conn.execute("DELETE FROM pages WHERE doc_id = ?", (doc_id,))
+            conn.execute("DELETE FROM documents WHERE id = ?", (doc_id,))
+
+    def refresh(self, cache=None):
+        # Re-index changed files and drop deleted ones
+        with self._connect() as conn:
+            paths = [row[0] for row in conn.execute("SELECT path FROM documents")]
+        for path in paths:
+            if not os.path.exists(path):
+                self.remove_document(path)
+            else:
+                self.index_file(path, cache)
+
+    def search(self, query, limit=50):
+        try:
+            with self._connect() as conn:
+                rows = conn.execute(
+                    """SELECT documents.path, pages.page, pages.page_offset,
+                              snippet(pages, 0, '[', ']', '...', 12),
+                              highlight(pages, 0, ?, ?)
+                       FROM pages JOIN documents ON documents.id = pages.doc_id
+                       WHERE pages MATCH ? ORDER BY rank LIMIT ?""",
+                    (MATCH_START, MATCH_END, query, limit)).fetchall()
+        except sqlite3.OperationalError as e:
+            raise ValueError(f"Invalid search query: {e}") from e
+
+        results = []
+        for path, page, page_offset, snippet, highlighted in rows:
+            # The first marker sits exactly where the first match starts
+            match_offset = max(highlighted.find(MATCH_START), 0)
+            results.append({'path': path, 'page': page, 'offset': page_offset + match_offset, 'snippet': snippet})
+        return results
+
+    def document_count(self):
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
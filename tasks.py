@@ -0,0 +1,97 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+class TaskCancelled(Exception):
+    pass
+
+class Task:
+    """Handle for work submitted to a TaskRunner.
+
+    The work function receives the task as its first argument. It should call
+    check_cancelled() regularly and can send progress to the UI thread with
+    report_progress().
+    """
+
+    def __init__(self, runner, on_done=None, on_error=None, on_progress=None):
+        self._runner = runner
+        self._cancel_event = threading.Event()
+        self.on_done = on_done
+        self.on_error = on_error
+        self.on_progress = on_progress
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    def check_cancelled(self):
+        if self.cancelled:
+            raise TaskCancelled()
+
+    def report_progress(self, *args):
+        self._runner._results.put((self, 'progress', args))
+
+class TaskRunner:
+    """Runs work off the Tk event thread and delivers the callbacks on it.
+
+    Workers never touch widgets. They put their results on a queue, which is
+    drained from the Tk mainloop with root.after. Callbacks of cancelled tasks
+    are dropped.
+    """
+
+    POLL_INTERVAL_MS = 30
+
+    def __init__(self, root, max_workers=4):
+        self.root = root
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="task")
+        self._results = queue.Queue()
+        self._pending = 0
+        self._poll_job = None
+
+    def submit(self, func, *args, on_done=None, on_error=None, on_progress=None):
+        task = Task(self, on_done, on_error, on_progress)
+        self._pending += 1
+        self._executor.submit(self._run, task, func, args)
+        if self._poll_job is None:
+            self._poll_job = self.root.after(self.POLL_INTERVAL_MS, self._poll)
+        return task
+
+    def _run(self, task, func, args):
+        try:
+            result = func(task, *args)
+        except TaskCancelled:
+            self._results.put((task, 'cancelled', None))
+        except Exception as e:
+            self._results.put((task, 'error', e))
+        else:
+            self._results.put((task, 'done', result))
+
+    def _poll(self):
+        try:
+            while True:
+                try:
+                    task, kind, value = self._results.get_nowait()
+                except queue.Empty:
+                    break
+                if kind != 'progress':
+                    self._pending -= 1
+                if task.cancelled:
+                    continue
+                if kind == 'progress' and task.on_progress:
+                    task.on_progress(*value)
+                elif kind == 'done' and task.on_done:
+                    task.on_done(value)
+                elif kind == 'error' and task.on_error:
+                    task.on_error(value)
+        finally:
+            # Keep polling even if a callback raised
+            if self._pending:
+                self._poll_job = self.root.after(self.POLL_INTERVAL_MS, self._poll)
+            else:
+                self._poll_job = None
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
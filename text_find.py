@@ -0,0 +1,91 @@
+import re
+from array import array
+from bisect import bisect_left, bisect_right
+
+class TextBuffer:
+    """A snapshot of the editor text with a table of line start offsets.
+
+    Offsets are character positions in the text; index() and offset() convert
+    to and from Tk "line.column" indexes without asking the widget.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.line_starts = array('q', [0])
+        self.line_starts.extend(match.end() for match in re.finditer('\n', text))
+
+    def index(self, offset):
+        line = bisect_right(self.line_starts, offset) - 1
+        return f"{line + 1}.{offset - self.line_starts[line]}"
+
+    def offset(self, index):
+        line, column = map(int, index.split('.'))
+        line = min(max(line, 1), len(self.line_starts))
+        return min(self.line_starts[line - 1] + column, len(self.text))
+
+def compile_pattern(pattern, regex=False, match_case=False, whole_word=False):
+    # Raises ValueError for an invalid regular expression
+    if not regex:
+        pattern = re.escape(pattern)
+    if whole_word:
+        pattern = rf"\b(?:{pattern})\b"
+    try:
+        return re.compile(pattern, 0 if match_case else re.IGNORECASE)
+    except re.error as e:
+        raise ValueError(f"Invalid pattern: {e}") from e
+
+class FindResults:
+    """All matches of a pattern in a TextBuffer, found in one pass.
+
+    Match start and end offsets are kept in sorted arrays, so the next or
+    previous match from a position and the matches inside the visible lines
+    are binary searches.
+    """
+
+    def __init__(self, buffer, pattern):
+        self.buffer = buffer
+        self.pattern = pattern
+        spans = [match.span() for match in pattern.finditer(buffer.text)]
+        # Empty matches cannot be shown or stepped through
+        self.starts = array('q', [start for start, end in spans if end > start])
+        self.ends = array('q', [end for start, end in spans if end > start])
+
+    def __len__(self):
+        return len(self.starts)
+
+    def next_match(self, offset):
+        # Index of the first match starting at or after offset, wrapping around
+        if not self.starts:
+            return None
+        i = bisect_left(self.starts, offset)
+        return i if i < len(self.starts) else 0
+
+    def previous_match(self, offset):
+        # Index of the last match starting before offset, wrapping around
+        if not self.starts:
+            return None
+        i = bisect_left(self.starts, offset) - 1
+        return i if i >= 0 else len(self.starts) - 1
+
+    def between(self, start_offset, end_offset):
+        # Indexes of the matches that overlap [start_offset, end_offset)
+        first = bisect_right(self.ends, start_offset)
+        last = bisect_left(self.starts, end_offset)
+        return range(first, max(first, last))
+
+    def span(self, i):
+        return self.starts[i], self.ends[i]
+
+    def replacement(self, i, replacement, regex=False):
+        # The text that replaces match i; with regex, \1 and \g<name> refer to groups
+        if not regex:
+            return replacement
+        return self.pattern.match(self.buffer.text, self.starts[i]).expand(replacement)
+
+    def replace_all(self, replacement, regex=False):
+        # The whole text with every match replaced, and how many were replaced
+        def substitute(match):
+            if match.end() == match.start():
+                return ''
+            return match.expand(replacement) if regex else replacement
+        return self.pattern.sub(substitute, self.buffer.text), len(self)
@@ -0,0 +1,287 @@
+import json
+import sqlite3
+import threading
+import time
+from diff_engine import opcodes
+
+# A full copy of the document is stored at least every SNAPSHOT_INTERVAL
+# versions; the versions in between only store a delta from the previous one
+SNAPSHOT_INTERVAL = 20
+
+class VersionConflict(Exception):
+    # Another writer saved a new version since the head was read
+    pass
+
+def make_delta(old_content, new_content):
+    # A delta is a list of ops: [start, end] copies lines start:end of the old
+    # content, a string is inserted as is. Lines keep their line endings, so
+    # applying the delta gives back new_content exactly.
+    old_lines = old_content.splitlines(keepends=True)
+    new_lines = new_content.splitlines(keepends=True)
+    ops = []
+    for tag, i1, i2, j1, j2 in opcodes(old_lines, new_lines):
+        if tag == 'equal':
+            ops.append([i1, i2])
+        elif j2 > j1:
+            ops.append(''.join(new_lines[j1:j2]))
+    return ops
+
+def apply_delta(old_content, ops):
+    old_lines = old_content.splitlines(keepends=True)
+    parts = []
+    for op in ops:
+        if isinstance(op, str):
+            parts.append(op)
+        else:
+            parts.extend(old_lines[op[0]:op[1]])
+    return ''.join(parts)
+
+def make_record(version, base, old_content, new_content, snapshot_interval=SNAPSHOT_INTERVAL):
+    # A version record is either a snapshot ('content') or a delta from the
+    # previous version ('delta', JSON encoded). 'base' is the snapshot the
+    # version is rebuilt from; None if the previous version has no record
+    # to build on, as with documents saved before versions had records.
+    if old_content is not None and base is not None and version - base < snapshot_interval:
+        delta = json.dumps(make_delta(old_content, new_content), separators=(',', ':'))
+        # A delta larger than half the document is not worth replaying
+        if len(delta) < len(new_content) // 2:
+            return {'version': version, 'base': base, 'delta': delta}
+    return {'version': version, 'base': version, 'content': new_content}
+
+def rebuild(records):
+    # Yields (version, content) for consecutive records starting at a snapshot
+    content = None
+    for record in records:
+        if 'content' in record:
+            content = record['content']
+        else:
+            content = apply_delta(content, json.loads(record['delta']))
+        yield record['version'], content
+
+class MemoryBackend:
+    """Keeps documents in memory; a stand-in for Firestore in tests.
+
+    latency, in seconds, is added to every call to simulate a round trip.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self._heads = {}
+        self._records = {}
+        self._lock = threading.Lock()
+
+    def _round_trip(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def get_head(self, doc_id):
+        # The current {'content', 'version', 'base'} of a document, or None
+        return self.get_heads([doc_id])[doc_id]
+
+    def get_heads(self, doc_ids):
+        # {doc_id: head or None} in one round trip
+        self._round_trip()
+        with self._lock:
+            return {doc_id: dict(self._heads[doc_id]) if doc_id in self._heads else None for doc_id in doc_ids}
+
+    def write_version(self, doc_id, head, record):
+        self._round_trip()
+        with self._lock:
+            self._heads[doc_id] = dict(head)
+            self._records.setdefault(doc_id, {})[record['version']] = dict(record)
+
+    def commit(self, writes):
+        # writes are (doc_id, expected_version, head, record); expected_version
+        # is None for a new document. Nothing is written if any check fails.
+        self._round_trip()
+        with self._lock:
+            conflicts = [doc_id for doc_id, expected, head, record in writes
+                         if self._heads.get(doc_id, {}).get('version') != expected]
+            if conflicts:
+                raise VersionConflict(conflicts)
+            for doc_id, expected, head, record in writes:
+                self._heads[doc_id] = dict(head)
+                self._records.setdefault(doc_id, {})[record['version']] = dict(record)
+
+    def get_record(self, doc_id, version):
+        self._round_trip()
+        with self._lock:
+            record = self._records.get(doc_id, {}).get(version)
+            return dict(record) if record is not None else None
+
+    def get_records(self, doc_id, first, last):
+        # Records for versions first..last inclusive, in order
+        self._round_trip()
+        with self._lock:
+            records = self._records.get(doc_id, {})
+            return [dict(records[version]) for version in range(first, last + 1) if version in records]
+
+class SQLiteBackend:
+    """Keeps documents in an SQLite file, for working offline."""
+
+    def __init__(self, path):
+        self.path = path
+        # One connection per thread, reused for every call
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS heads (
+                doc_id TEXT PRIMARY KEY, content TEXT, version INTEGER, base INTEGER)""")
+            conn.execute("""CREATE TABLE IF NOT EXISTS versions (
+                doc_id TEXT, version INTEGER, base INTEGER, content TEXT, delta TEXT,
+                PRIMARY KEY (doc_id, version))""")
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def get_head(self, doc_id):
+        return self.get_heads([doc_id])[doc_id]
+
+    def get_heads(self, doc_ids):
+        heads = dict.fromkeys(doc_ids)
+        with self._connect() as conn:
+            for doc_id in doc_ids:
+                row = conn.execute("SELECT content, version, base FROM heads WHERE doc_id = ?", (doc_id,)).fetchone()
+                if row is not None:
+                    heads[doc_id] = {'content': row[0], 'version': row[1], 'base': row[2]}
+        return heads
+
+    def write_version(self, doc_id, head, record):
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            self._write(conn, doc_id, head, record)
+
+    def commit(self, writes):
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conflicts = []
+            for doc_id, expected, head, record in writes:
+                row = conn.execute("SELECT version FROM heads WHERE doc_id = ?", (doc_id,)).fetchone()
+                if (row[0] if row is not None else None) != expected:
+                    conflicts.append(doc_id)
+            if conflicts:
+                raise VersionConflict(conflicts)
+            for doc_id, expected, head, record in writes:
+                self._write(conn, doc_id, head, record)
+
+    def _write(self, conn, doc_id, head, record):
+        conn.execute("INSERT OR REPLACE INTO heads VALUES (?, ?, ?, ?)",
+                     (doc_id, head['content'], head['version'], head['base']))
+        conn.execute("INSERT OR REPLACE INTO versions VALUES (?, ?, ?, ?, ?)",
+                     (doc_id, record['version'], record['base'], record.get('content'), record.get('delta')))
+
+    def get_record(self, doc_id, version):
+        records = self.get_records(doc_id, version, version)
+        return records[0] if records else None
+
+    def get_records(self, doc_id, first, last):
+        with self._connect() as conn:
+            rows = conn.execute("""SELECT version, base, content, delta FROM versions
+                                   WHERE doc_id = ? AND version BETWEEN ? AND ? ORDER BY version""",
+                                (doc_id, first, last)).fetchall()
+        records = []
+        for version, base, content, delta in rows:
+            record = {'version': version, 'base': base}
+            if delta is None:
+                record['content'] = content
+            else:
+                record['delta'] = delta
+            records.append(record)
+        return records
+
+class FirestoreBackend:
+    """Keeps documents in Firestore.
+
+    The head of a document is documents/<doc_id>; each version is a document
+    in its versions subcollection, so reading one version does not pull the
+    whole history.
+    """
+
+    def __init__(self, credentials_path="path/to/your/firebase_credentials.json"):
+        # Imported here so the offline backends work without firebase_admin
+        import firebase_admin
+        from firebase_admin import credentials, firestore
+        # The app and its connections are shared by every backend instance.
+        # With FIRESTORE_EMULATOR_HOST set, the client talks to a local emulator.
+        try:
+            app = firebase_admin.get_app()
+        except ValueError:
+            app = firebase_admin.initialize_app(credentials.Certificate(credentials_path))
+        self._firestore = firestore
+        self.db = firestore.client(app)
+
+    def _doc_ref(self, doc_id):
+        return self.db.collection('documents').document(doc_id)
+
+    def _head_from(self, doc):
+        if not doc.exists:
+            return None
+        data = doc.to_dict()
+        # Documents from before version records have no base; their next
+        # version is then written as a snapshot
+        return {'content': data['content'], 'version': data['version'], 'base': data.get('base')}
+
+    def get_head(self, doc_id):
+        return self._head_from(self._doc_ref(doc_id).get())
+
+    def get_heads(self, doc_ids):
+        heads = dict.fromkeys(doc_ids)
+        for doc in self.db.get_all([self._doc_ref(doc_id) for doc_id in doc_ids]):
+            heads[doc.id] = self._head_from(doc)
+        return heads
+
+    def write_version(self, doc_id, head, record):
+        batch = self.db.batch()
+        self._write(batch, doc_id, head, record)
+        batch.commit()
+
+    def commit(self, writes):
+        refs = [self._doc_ref(doc_id) for doc_id, expected, head, record in writes]
+
+        @self._firestore.transactional
+        def run(transaction):
+            versions = {doc.id: doc.to_dict()['version'] if doc.exists else None
+                        for doc in transaction.get_all(refs)}
+            conflicts = [doc_id for doc_id, expected, head, record in writes if versions.get(doc_id) != expected]
+            if conflicts:
+                raise VersionConflict(conflicts)
+            for doc_id, expected, head, record in writes:
+                self._write(transaction, doc_id, head, record)
+
+        run(self.db.transaction())
+
+    def _write(self, writer, doc_id, head, record):
+        # writer is a WriteBatch or a Transaction
+        doc_ref = self._doc_ref(doc_id)
+        # Merged, so the history array of documents from before version
+        # records is kept for _legacy_records()
+        writer.set(doc_ref, head, merge=True)
+        writer.set(doc_ref.collection('versions').document(f"{record['version']:010d}"), record)
+
+    def get_record(self, doc_id, version):
+        doc = self._doc_ref(doc_id).collection('versions').document(f"{version:010d}").get()
+        if doc.exists:
+            return doc.to_dict()
+        return self._legacy_records(doc_id).get(version)
+
+    def get_records(self, doc_id, first, last):
+        query = (self._doc_ref(doc_id).collection('versions')
+                 .where('version', '>=', first).where('version', '<=', last).order_by('version'))
+        records = {record['version']: record for record in (doc.to_dict() for doc in query.stream())}
+        if len(records) < last - first + 1:
+            # Versions saved before version records live in the head's history
+            legacy = self._legacy_records(doc_id)
+            for version in range(first, last + 1):
+                if version not in records and version in legacy:
+                    records[version] = legacy[version]
+        return [records[version] for version in sorted(records)]
+
+    def _legacy_records(self, doc_id):
+        # The old history array of full copies, as snapshot records
+        doc = self._doc_ref(doc_id).get()
+        history = doc.to_dict().get('history', []) if doc.exists else []
+        return {entry['version']: {'version': entry['version'], 'base': entry['version'], 'content': entry['content']}
+                for entry in history}
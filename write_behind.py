@@ -0,0 +1,155 @@
+import threading
+import time
+from collections import deque
+from version_store import VersionConflict
+
+DEFAULT_DELAY = 0.5
+DEFAULT_MAX_DELAY = 3.0
+DEFAULT_MAX_BATCH = 100
+MAX_FLUSH_ATTEMPTS = 5
+
+class WriteBehind:
+    """Debounces, coalesces and batches document updates for a CollaborationManager.
+
+    update() only records the latest content of a document. A document is
+    written once no update arrived for `delay` seconds, or at the latest
+    `max_delay` seconds after its first pending update. Ready documents are
+    read with one get_heads() call and saved with one backend.commit()
+    transaction per batch. A version conflict means another writer saved
+    first: the heads are read again and the batch is retried.
+    """
+
+    def __init__(self, manager, delay=DEFAULT_DELAY, max_delay=DEFAULT_MAX_DELAY, max_batch=DEFAULT_MAX_BATCH,
+                 on_error=None):
+        self.manager = manager
+        self.delay = delay
+        self.max_delay = max_delay
+        self.max_batch = max_batch
+        self.on_error = on_error
+        self._pending = {}  # doc_id -> [content, first update time, last update time]
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._closed = False
+        self._counters = dict.fromkeys(('updates', 'coalesced', 'batches', 'documents_written', 'conflicts', 'errors'), 0)
+        # Commit round trips, and time from a document's first pending update
+        # until it was written
+        self._commit_latencies = deque(maxlen=1000)
+        self._end_to_end_latencies = deque(maxlen=1000)
+        self._started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+
+    def update(self, doc_id, content):
+        now = time.monotonic()
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("WriteBehind is closed")
+            self._counters['updates'] += 1
+            entry = self._pending.get(doc_id)
+            if entry is None:
+                self._pending[doc_id] = [content, now, now]
+            else:
+                self._counters['coalesced'] += 1
+                entry[0] = content
+                entry[2] = now
+            self._condition.notify()
+
+    def _ready(self, now, everything=False):
+        # Takes the documents that are due out of the pending set
+        ready = [doc_id for doc_id, (content, first, last) in self._pending.items()
+                 if everything or now - last >= self.delay or now - first >= self.max_delay]
+        return {doc_id: self._pending.pop(doc_id) for doc_id in ready}
+
+    def _next_due(self, now):
+        if not self._pending:
+            return None
+        return max(0.0, min(min(last + self.delay, first + self.max_delay) - now
+                            for content, first, last in self._pending.values()))
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._closed:
+                    wait = self._next_due(time.monotonic())
+                    if wait == 0.0:
+                        break
+                    self._condition.wait(wait)
+                if self._closed:
+                    return
+                ready = self._ready(time.monotonic())
+            self._write(ready)
+
+    def flush(self):
+        # Writes everything that is pending now, on the calling thread
+        with self._condition:
+            ready = self._ready(time.monotonic(), everything=True)
+        self._write(ready)
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+        self.flush()
+
+    def _write(self, ready):
+        if not ready:
+            return
+        with self._flush_lock:
+            doc_ids = list(ready)
+            for start in range(0, len(doc_ids), self.max_batch):
+                batch = {doc_id: ready[doc_id] for doc_id in doc_ids[start:start + self.max_batch]}
+                try:
+                    self._commit(batch)
+                except Exception as e:
+                    self._failed(batch, e)
+
+    def _commit(self, batch):
+        backend = self.manager.backend
+        for attempt in range(MAX_FLUSH_ATTEMPTS):
+            started = time.perf_counter()
+            heads = backend.get_heads(list(batch))
+            writes = [self.manager.prepare_write(doc_id, heads[doc_id], content)
+                      for doc_id, (content, first, last) in batch.items()]
+            try:
+                backend.commit(writes)
+            except VersionConflict:
+                with self._condition:
+                    self._counters['conflicts'] += 1
+                continue
+            finished = time.monotonic()
+            with self._condition:
+                self._counters['batches'] += 1
+                self._counters['documents_written'] += len(batch)
+                self._commit_latencies.append(time.perf_counter() - started)
+                self._end_to_end_latencies.extend(finished - first for content, first, last in batch.values())
+            return
+        raise VersionConflict(list(batch))
+
+    def _failed(self, batch, error):
+        # Content that was not replaced by a newer update is retried after
+        # another delay
+        now = time.monotonic()
+        with self._condition:
+            self._counters['errors'] += 1
+            if not self._closed:
+                for doc_id, entry in batch.items():
+                    self._pending.setdefault(doc_id, [entry[0], now, now])
+                self._condition.notify()
+        if self.on_error:
+            self.on_error(error)
+        else:
+            print(f"Could not save documents {', '.join(batch)}: {error}")
+
+    def metrics(self):
+        with self._condition:
+            metrics = dict(self._counters)
+            latencies = sorted(self._commit_latencies)
+            end_to_end = sorted(self._end_to_end_latencies)
+            metrics['pending'] = len(self._pending)
+        elapsed = time.perf_counter() - self._started
+        metrics['documents_per_second'] = metrics['documents_written'] / elapsed if elapsed > 0 else 0.0
+        for name, values in (('commit', latencies), ('end_to_end', end_to_end)):
+            metrics[f'{name}_latency_avg'] = sum(values) / len(values) if values else 0.0
+            metrics[f'{name}_latency_p95'] = values[min(len(values) - 1, int(len(values) * 0.95))] if values else 0.0
+        return metrics